@@ -18,6 +18,9 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_conversation_idx'),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender.username} in {self.conversation}"
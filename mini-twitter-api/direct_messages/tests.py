@@ -0,0 +1,27 @@
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.contrib.auth.models import User
+from mini_twitter.testing import QueryPlanTestMixin
+from .models import Conversation, Message
+
+class MessageQueryPlanTests(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='alice')
+        self.other_user = User.objects.create_user(username='bob')
+        self.client.force_authenticate(user=self.user)
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.user, self.other_user)
+        for i in range(5):
+            Message.objects.create(
+                conversation=self.conversation,
+                sender=self.other_user if i % 2 else self.user,
+                content=f'Message {i}'
+            )
+    
+    def test_messages(self):
+        url = reverse('conversation-messages', args=[self.conversation.id])
+        response = self.assertIndexedEndpoint(f'{url}?page_size=2', ['direct_messages_message'])
+        self.assertEqual([m['content'] for m in response.data['results']], ['Message 0', 'Message 1'])
+        self.assertIndexedEndpoint(response.data['next'], ['direct_messages_message'])
@@ -6,10 +6,13 @@ from django.db.models import Q
 from .models import Conversation, Message
 from .serializers import ConversationSerializer, MessageSerializer
 from django.contrib.auth.models import User
+from mini_twitter.pagination import AscendingKeysetPagination
+from mini_twitter.renderers import FAST_RENDERER_CLASSES
 
 class ConversationViewSet(viewsets.ModelViewSet):
     serializer_class = ConversationSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = FAST_RENDERER_CLASSES
     
     def get_queryset(self):
         return Conversation.objects.filter(participants=self.request.user)
@@ -58,13 +61,11 @@ class ConversationViewSet(viewsets.ModelViewSet):
         unread_messages = messages.filter(is_read=False).exclude(sender=request.user)
         unread_messages.update(is_read=True)
         
-        page = self.paginate_queryset(messages)
-        if page is not None:
-            serializer = MessageSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        # Messages read oldest first
+        paginator = AscendingKeysetPagination()
+        page = paginator.paginate_queryset(messages, request, view=self)
+        serializer = MessageSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
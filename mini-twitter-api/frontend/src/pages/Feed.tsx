@@ -24,20 +24,21 @@ interface Post {
 const Feed: React.FC = () => {
   const [posts, setPosts] = useState<Post[]>([])
   const [loading, setLoading] = useState(true)
-  const [page, setPage] = useState(1)
+  const [nextUrl, setNextUrl] = useState<string | null>(null)
   const [hasMore, setHasMore] = useState(true)
 
-  const fetchFeed = async (pageNum = 1) => {
+  const fetchFeed = async (url: string | null = null) => {
     try {
       setLoading(true)
-      const response = await api.get(`/api/posts/feed/?page=${pageNum}`)
+      const response = await api.get(url || "/api/posts/feed/")
 
-      if (pageNum === 1) {
+      if (!url) {
         setPosts(response.data.results)
       } else {
         setPosts((prevPosts) => [...prevPosts, ...response.data.results])
       }
 
+      setNextUrl(response.data.next)
       setHasMore(!!response.data.next)
       setLoading(false)
     } catch (error) {
@@ -51,10 +52,8 @@ const Feed: React.FC = () => {
   }, [])
 
   const handleLoadMore = () => {
-    if (!loading && hasMore) {
-      const nextPage = page + 1
-      setPage(nextPage)
-      fetchFeed(nextPage)
+    if (!loading && hasMore && nextUrl) {
+      fetchFeed(nextUrl)
     }
   }
 
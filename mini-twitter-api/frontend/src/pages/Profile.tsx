@@ -39,7 +39,7 @@ const Profile: React.FC = () => {
   const [posts, setPosts] = useState<Post[]>([])
   const [loading, setLoading] = useState(true)
   const [isFollowing, setIsFollowing] = useState(false)
-  const [page, setPage] = useState(1)
+  const [nextUrl, setNextUrl] = useState<string | null>(null)
   const [hasMore, setHasMore] = useState(true)
 
   const isOwnProfile = user?.id === Number(userId)
@@ -63,16 +63,17 @@ const Profile: React.FC = () => {
     }
   }
 
-  const fetchPosts = async (pageNum = 1) => {
+  const fetchPosts = async (url: string | null = null) => {
     try {
-      const postsResponse = await api.get(`/api/posts/?user_id=${userId}&page=${pageNum}`)
+      const postsResponse = await api.get(url || `/api/posts/?user_id=${userId}`)
 
-      if (pageNum === 1) {
+      if (!url) {
         setPosts(postsResponse.data.results)
       } else {
         setPosts((prevPosts) => [...prevPosts, ...postsResponse.data.results])
       }
 
+      setNextUrl(postsResponse.data.next)
       setHasMore(!!postsResponse.data.next)
     } catch (error) {
       console.error("Error fetching posts:", error)
@@ -104,10 +105,8 @@ const Profile: React.FC = () => {
   }
 
   const handleLoadMore = () => {
-    if (!loading && hasMore) {
-      const nextPage = page + 1
-      setPage(nextPage)
-      fetchPosts(nextPage)
+    if (!loading && hasMore && nextUrl) {
+      fetchPosts(nextUrl)
     }
   }
 
@@ -0,0 +1,34 @@
+"""
+Gunicorn settings: gunicorn -c gunicorn.conf.py
+
+/metrics aggregates all workers through PROMETHEUS_MULTIPROC_DIR (see
+mini_twitter.metrics), which defaults to a directory of this server's own.
+The directory is emptied on start, so Celery workers must use another one
+(they serve their metrics on CELERY_METRICS_PORT).
+"""
+import os
+import tempfile
+from pathlib import Path
+
+wsgi_app = 'mini_twitter.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+
+# Set before the workers are forked and import the metrics
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus-gunicorn'))
+
+
+def on_starting(server):
+    # Values left by a previous run would be added to the new ones
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        for path in Path(directory).glob('*.db'):
+            path.unlink()
+
+
+def child_exit(server, worker):
+    # Drop the live (summed) gauges of the exited worker
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,6 +1,7 @@
 from django.urls import path
-from .admin_views import environment_variables
+from .admin_views import environment_variables, performance
 
 urlpatterns = [
     path('env-vars/', environment_variables, name='environment-variables'),
+    path('performance/', performance, name='performance-report'),
 ]
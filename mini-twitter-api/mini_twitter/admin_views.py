@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
 import os
 
+from .instrumentation import performance_report
+
 @staff_member_required
 def environment_variables(request):
     """
@@ -15,4 +18,16 @@ def environment_variables(request):
            key == 'miniTwitterProject'
     }
     
-    return JsonResponse(env_vars)
\ No newline at end of file
+    return JsonResponse(env_vars)
+
+
+@staff_member_required
+def performance(request):
+    """
+    Per-view latency percentiles and mean query, cache and serializer
+    figures for the sampled requests handled by this process.
+    """
+    return JsonResponse({
+        'sample_rate': settings.PERFORMANCE_SAMPLE_RATE,
+        'views': performance_report(),
+    })
@@ -0,0 +1,255 @@
+"""
+API hot-path benchmarks, run by ``manage.py benchmark_api``.
+
+Every scenario sends real requests through the Django test client, so the
+full middleware, view, serializer and renderer stack is measured without a
+network hop, against whatever the database holds (usually a dataset built
+with ``generate_dataset``). Per scenario it records latency percentiles, SQL
+queries per request, throughput, time spent building serializer data (every request is
+sampled by PerformanceMiddleware, which reports it in Server-Timing) and
+response bytes. The ``*_entities`` scenarios request the same pages as their
+counterparts in the normalized format (``?entities=1``). Results are plain JSON, so a run can
+be stored as a baseline and later runs compared against it.
+
+Each request runs in a transaction that is rolled back afterwards, so
+write scenarios (like, follow) leave the dataset as they found it and their
+on-commit side effects (fan-out, notifications tasks) are not triggered.
+"""
+import contextlib
+import io
+import statistics
+import time
+from urllib.parse import urlencode
+
+from celery import current_app
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework.throttling import UserRateThrottle
+
+from posts.models import Hashtag, Post
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Scenario:
+    """
+    A request to time. ``before`` and ``after`` run untimed in the same
+    transaction, e.g. to like a post so that unliking it can be measured.
+    """
+
+    def __init__(self, name, method, url, before=None, after=None, requires=()):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.before = before
+        self.after = after
+        self.requires = requires
+
+
+def _like(client, fixtures):
+    client.post(reverse('post-like', args=[fixtures['like_post'].id]))
+
+
+def _unlike(client, fixtures):
+    client.post(reverse('post-unlike', args=[fixtures['like_post'].id]))
+
+
+def _unfollow(client, fixtures):
+    client.post(reverse('user-unfollow', args=[fixtures['follow_user'].id]))
+
+
+SCENARIOS = [
+    Scenario('feed', 'get', lambda f: reverse('post-feed')),
+    Scenario('feed_entities', 'get', lambda f: reverse('post-feed') + '?entities=1'),
+    Scenario('post_list', 'get', lambda f: reverse('post-list')),
+    Scenario('post_list_entities', 'get', lambda f: reverse('post-list') + '?entities=1'),
+    Scenario('post_retrieve', 'get', lambda f: reverse('post-detail', args=[f['post'].id])),
+    Scenario('search', 'get', lambda f: reverse('post-search') + '?' + urlencode({'q': f['query']})),
+    Scenario('trending_hashtags', 'get', lambda f: reverse('post-trending-hashtags')),
+    Scenario(
+        'like', 'post', lambda f: reverse('post-like', args=[f['like_post'].id]),
+        after=_unlike, requires=['like_post']
+    ),
+    Scenario(
+        'unlike', 'post', lambda f: reverse('post-unlike', args=[f['like_post'].id]),
+        before=_like, requires=['like_post']
+    ),
+    Scenario(
+        'follow', 'post', lambda f: reverse('user-follow', args=[f['follow_user'].id]),
+        after=_unfollow, requires=['follow_user']
+    ),
+    Scenario('notifications', 'get', lambda f: reverse('notification-list')),
+    Scenario('conversations', 'get', lambda f: reverse('conversation-list')),
+]
+
+SCENARIO_NAMES = [scenario.name for scenario in SCENARIOS]
+
+
+def pick_fixtures(username=None, query=None):
+    """
+    Choose the objects the scenarios act on: by default the user following
+    the most accounts, the most replied-to post, a post and an account the
+    user has not liked or followed yet, and the most used hashtag as the
+    search query.
+    """
+    users = User.objects.select_related('profile')
+    if username:
+        viewer = users.filter(username=username).first()
+        if viewer is None:
+            raise BenchmarkError(f"Unknown user: {username}")
+    else:
+        viewer = users.order_by('-profile__following_count', 'id').first()
+    post = Post.objects.filter(is_retweet=False).order_by('-replies_count', '-id').first()
+    if viewer is None or post is None:
+        raise BenchmarkError("The database has no users or posts; run generate_dataset first.")
+
+    like_post = Post.objects.filter(is_retweet=False).exclude(
+        likes__user=viewer
+    ).order_by('-created_at', '-id').first()
+    follow_user = User.objects.exclude(id=viewer.id).exclude(
+        followers__follower=viewer
+    ).order_by('-profile__followers_count', 'id').first()
+    if query is None:
+        query = Hashtag.objects.order_by('-post_count').values_list('name', flat=True).first() or 'the'
+
+    return {
+        'viewer': viewer,
+        'post': post,
+        'like_post': like_post,
+        'follow_user': follow_user,
+        'query': query,
+    }
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def serializer_ms(response):
+    """Serializer time reported in the Server-Timing header of a sampled response."""
+    for metric in response.get('Server-Timing', '').split(','):
+        name, _, params = metric.strip().partition(';')
+        if name == 'serialize':
+            return float(params.partition('dur=')[2].partition(';')[0])
+    return 0.0
+
+
+def run_scenario(client, scenario, fixtures, iterations, warmup=0):
+    url = scenario.url(fixtures)
+    # The throttle is checked on every request, but repeated runs must not hit the limit
+    throttle_key = UserRateThrottle.cache_format % {
+        'scope': UserRateThrottle.scope, 'ident': fixtures['viewer'].pk
+    }
+    timings, queries, serializing, sizes = [], [], [], []
+    for run in range(warmup + iterations):
+        UserRateThrottle.cache.delete(throttle_key)
+        # Keep task output (e.g. send_follow_notification) out of the report
+        with transaction.atomic(), contextlib.redirect_stdout(io.StringIO()):
+            if scenario.before:
+                scenario.before(client, fixtures)
+            # queries_log is capped, so start from an empty one
+            reset_queries()
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = getattr(client, scenario.method)(url)
+                elapsed = (time.perf_counter() - started) * 1000
+            if scenario.after:
+                scenario.after(client, fixtures)
+            transaction.set_rollback(True)
+
+        if response.status_code >= 400:
+            raise BenchmarkError(f"{scenario.name}: {url} returned {response.status_code}")
+        if run >= warmup:
+            timings.append(elapsed)
+            queries.append(len(ctx.captured_queries))
+            serializing.append(serializer_ms(response))
+            sizes.append(len(response.content))
+
+    timings.sort()
+    return {
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        # Sequential throughput of one process: 1000 / mean latency in ms
+        'requests_per_s': round(1000 / statistics.mean(timings), 1),
+        'queries': round(statistics.mean(queries), 1),
+        'serialize_ms': round(statistics.mean(serializing), 3),
+        'bytes': round(statistics.mean(sizes)),
+    }
+
+
+def run_benchmarks(names=None, iterations=50, warmup=5, username=None, query=None, log=None):
+    """Run the named scenarios (default: all) and return the results as a dict."""
+    fixtures = pick_fixtures(username, query)
+    # Send a Host header the site accepts ('testserver' is only allowed under the test runner)
+    host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+    client = APIClient(SERVER_NAME=host)
+    client.force_authenticate(user=fixtures['viewer'])
+    # Skip write scenarios when the viewer has already liked or followed everything
+    scenarios = [
+        scenario for scenario in SCENARIOS
+        if (names is None or scenario.name in names)
+        and all(fixtures[name] is not None for name in scenario.requires)
+    ]
+
+    results = {}
+    # follow queues send_follow_notification directly; run it in-process
+    # rather than requiring a broker
+    eager = current_app.conf.task_always_eager
+    current_app.conf.task_always_eager = True
+    try:
+        # Sample every request, so each response reports its serializer time
+        with override_settings(PERFORMANCE_SAMPLE_RATE=1.0):
+            for scenario in scenarios:
+                results[scenario.name] = run_scenario(client, scenario, fixtures, iterations, warmup)
+                if log:
+                    log(scenario.name, results[scenario.name])
+    finally:
+        current_app.conf.task_always_eager = eager
+
+    return {
+        'environment': {
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'feed_engine': settings.FEED_ENGINE,
+            'users': User.objects.count(),
+            'posts': Post.objects.count(),
+            'viewer': fixtures['viewer'].username,
+        },
+        'iterations': iterations,
+        'scenarios': results,
+    }
+
+
+def compare(results, baseline, threshold=0.2, noise_ms=0.5):
+    """
+    Compare results with a baseline run. Returns {scenario: [regressions]}:
+    a p50/p95 latency more than ``threshold`` slower (and at least
+    ``noise_ms`` slower), more queries, or more than ``threshold`` larger
+    responses.
+    """
+    regressions = {}
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        found = []
+        for metric in ('p50_ms', 'p95_ms'):
+            if (current[metric] > previous[metric] * (1 + threshold)
+                    and current[metric] - previous[metric] >= noise_ms):
+                found.append(metric)
+        if current['queries'] > previous['queries']:
+            found.append('queries')
+        if current['bytes'] > previous['bytes'] * (1 + threshold):
+            found.append('bytes')
+        if found:
+            regressions[name] = found
+    return regressions
@@ -0,0 +1,129 @@
+"""
+Sparse fieldsets: ``?fields=`` and ``?expand=``.
+
+``fields`` is a comma-separated list of the fields to return, and dotted
+names select the fields of nested objects: ``fields=id,content,user.username``
+returns posts with only their ID, content and author's username. A nested
+object named without sub-fields (``fields=id,user``) is returned whole.
+
+Nested posts are shallow references (``{"id": 42}``) unless ``expand``
+lists them, again dotted for deeper levels
+(``expand=original_post_data.parent_data``). An embedded post has the same
+fields as the post embedding it, unless ``fields`` names its own
+(``original_post_data.content``), which also expands it. ``expand=*``
+embeds every nested post at every level, the representation served before
+nested posts became references.
+
+Serializers used without a request (e.g. by background tasks) render
+everything, nested posts included.
+"""
+from rest_framework import serializers
+
+
+def parse_paths(value):
+    """Parse 'a,b.c,b.d' into {'a': {}, 'b': {'c': {}, 'd': {}}}."""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class Fieldset:
+    """The fields requested of one (possibly nested) serializer."""
+
+    def __init__(self, fields=None, expand=None):
+        # None selects every field; nested dicts select sub-fields
+        self.fields = fields or None
+        self.expand = expand or {}
+
+    @classmethod
+    def from_request(cls, request):
+        """Return the request's fieldset, or None (everything) outside a request."""
+        params = getattr(request, 'query_params', None)
+        if params is None:
+            return None
+        return cls(parse_paths(params.get('fields', '')), parse_paths(params.get('expand', '')))
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def requests(self, name):
+        """Whether ``name`` may be rendered at this level or any nested one."""
+        if self.fields is None or name in self.fields:
+            return True
+        return any(Fieldset(fields).requests(name) for fields in self.fields.values() if fields)
+
+    def expands(self, name):
+        return name in self.expand or '*' in self.expand or bool(self.fields and self.fields.get(name))
+
+    def expand_child(self, name):
+        """The expansions below ``name``; a ``*`` carries on to every level."""
+        expand = self.expand.get(name, {})
+        if '*' in self.expand:
+            expand = {**expand, '*': {}}
+        return expand
+
+    def child(self, name):
+        return Fieldset((self.fields or {}).get(name), self.expand_child(name))
+
+    def embedded(self, name):
+        """The fieldset of an object embedded under ``name`` that has the same type as this one."""
+        if self.fields and self.fields.get(name):
+            return self.child(name)
+        return Fieldset(self.fields, self.expand_child(name))
+
+    def trim(self, data):
+        """Drop the unrequested keys of an already rendered dict, recursing into nested dicts."""
+        trimmed = {}
+        for key, value in data.items():
+            if not self.includes(key):
+                continue
+            if isinstance(value, dict) and self.fields and self.fields.get(key):
+                value = self.child(key).trim(value)
+            trimmed[key] = value
+        return trimmed
+
+
+def get_fieldset(serializer):
+    """
+    Return the fieldset applying to ``serializer``: the context's ``fieldset``
+    (or the request's) for a top-level serializer, narrowed down along the
+    field names of its parents. Serializers nested in ones not supporting
+    fieldsets are rendered whole.
+    """
+    parent = serializer.parent
+    if isinstance(parent, serializers.ListSerializer):
+        serializer, parent = parent, parent.parent
+    if parent is None:
+        context = serializer.context
+        if 'fieldset' in context:
+            return context['fieldset']
+        return Fieldset.from_request(context.get('request'))
+    if not isinstance(parent, SparseFieldsetMixin):
+        return None
+    fieldset = get_fieldset(parent)
+    return fieldset.child(serializer.field_name) if fieldset is not None else None
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin dropping the fields a request did not ask for, so that
+    their SerializerMethodFields are never evaluated.
+    """
+
+    @property
+    def fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = get_fieldset(self)
+        return self._fieldset
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.fieldset
+        # Input is always validated against every field
+        if fieldset is None or fieldset.fields is None or hasattr(self.root, 'initial_data'):
+            return fields
+        return {name: field for name, field in fields.items() if fieldset.includes(name)}
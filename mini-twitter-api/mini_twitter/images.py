@@ -0,0 +1,244 @@
+"""
+Image processing for uploaded post images, avatars and header images.
+
+Uploads are stored as received, and a Celery task (``posts.tasks`` and
+``users.tasks``) then processes them off the request thread:
+
+1. validation: the file must decode completely as a JPEG, PNG, WebP or
+   GIF of at most IMAGE_MAX_PIXELS pixels; invalid uploads are removed;
+2. metadata stripping: the image is rotated upright following its EXIF
+   orientation and re-encoded without EXIF, XMP or comments (the colour
+   profile is kept), replacing the uploaded file;
+3. variants: each size in VARIANT_SIZES is written twice, as JPEG (PNG for
+   images with transparency) and as WebP.
+
+The dimensions and variant paths are recorded in the ``<field>_variants``
+JSON field next to the image field, which the serializers expose as URLs
+(see ``variant_urls``). Until processing has finished it is None and
+clients get the original.
+
+A task only records its result while the row still holds the file it was
+given, so a newer upload is never overwritten by an older one's results.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+
+# Variant name -> (width, height, crop). Cropped variants fill the box
+# exactly; the others fit inside it, keeping their aspect ratio, and are
+# never enlarged.
+VARIANT_SIZES = {
+    'post': {
+        'large': (1280, 1280, False),
+        'medium': (640, 640, False),
+        'small': (320, 320, False),
+    },
+    'avatar': {
+        'medium': (200, 200, True),
+        'small': (96, 96, True),
+    },
+    'header': {
+        'large': (1500, 500, True),
+        'small': (600, 200, True),
+    },
+}
+
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+
+class ImageError(Exception):
+    pass
+
+
+def open_image(file):
+    """Decode an image completely, rejecting unsupported formats and oversized images."""
+    try:
+        image = Image.open(file)
+        if image.format not in ALLOWED_FORMATS:
+            raise ImageError(f"Unsupported image format: {image.format}.")
+        # Checked before decoding the pixels, which is what costs memory
+        if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+            raise ImageError("The image is too large.")
+        image.load()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise ImageError(f"Invalid image: {exc}")
+    return image
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def encode(image, format, **params):
+    buffer = BytesIO()
+    if format == 'JPEG':
+        image = image.convert('RGB') if image.mode not in ('RGB', 'L', 'CMYK') else image
+        params = {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True, **params}
+    elif format == 'WEBP':
+        image = image.convert('RGBA' if has_alpha(image) else 'RGB') if image.mode not in ('RGB', 'RGBA') else image
+        params = {'quality': WEBP_QUALITY, 'method': 4, **params}
+    elif format == 'PNG':
+        params = {'optimize': True, **params}
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def strip_metadata(image):
+    """Return the upright image, without metadata, encoded in its original format."""
+    format = image.format
+    icc_profile = image.info.get('icc_profile')
+    if getattr(image, 'is_animated', False):
+        # Keep every frame; animated GIF and WebP carry no orientation
+        params = {key: image.info[key] for key in ('duration', 'loop') if key in image.info}
+        image.info = {}
+        return image, encode(image, format, save_all=True, **params)
+
+    upright = ImageOps.exif_transpose(image)
+    upright.info = {}
+    params = {'icc_profile': icc_profile} if icc_profile and format != 'GIF' else {}
+    return upright, encode(upright, format, **params)
+
+
+def resize(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((width, height), Image.LANCZOS)
+    return resized
+
+
+def process_image(storage, name, sizes):
+    """
+    Validate the image stored under ``name``, store a copy without metadata
+    and its variants. Returns the new name and the info to record; raises
+    ImageError for invalid images.
+    """
+    try:
+        file = storage.open(name, 'rb')
+    except OSError as exc:
+        raise ImageError(f"Missing image: {exc}")
+    # Animated images read their frames from the file as they go
+    with file:
+        image = open_image(file)
+        format = image.format
+        image, original = strip_metadata(image)
+        # Variants are made from the first frame of animated images
+        image.seek(0)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+        else:
+            image.load()
+
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    clean_name = storage.save(
+        os.path.join(directory, f'{stem}.{EXTENSIONS[format]}'), ContentFile(original)
+    )
+    fallback = 'PNG' if has_alpha(image) else 'JPEG'
+    variant_dir = os.path.join(directory, 'variants', os.path.splitext(os.path.basename(clean_name))[0])
+
+    variants = {}
+    for label, (width, height, crop) in sizes.items():
+        variant = resize(image, width, height, crop)
+        variants[label] = {
+            'width': variant.width,
+            'height': variant.height,
+            'src': storage.save(
+                os.path.join(variant_dir, f'{label}.{EXTENSIONS[fallback]}'),
+                ContentFile(encode(variant, fallback))
+            ),
+            'webp': storage.save(
+                os.path.join(variant_dir, f'{label}.webp'), ContentFile(encode(variant, 'WEBP'))
+            ),
+        }
+    return clean_name, {'width': image.width, 'height': image.height, 'variants': variants}
+
+
+def stored_paths(info):
+    """The variant files listed in recorded info."""
+    return [
+        path for variant in (info or {}).get('variants', {}).values()
+        for path in (variant['src'], variant['webp'])
+    ]
+
+
+def delete_files(storage, names):
+    for name in names:
+        if name:
+            storage.delete(name)
+
+
+def process_upload(model, pk, field_name, name, kind, stale=()):
+    """
+    Process the image ``name`` of ``field_name`` in the ``model`` row ``pk``
+    and record the result, unless the row was changed to another file in
+    the meantime. Returns the recorded info, or None. Also bumps the row's
+    ``updated_at``, which retires cached renderings of it. ``stale`` lists
+    the variant files of the image it replaced, which are deleted.
+    """
+    storage = model._meta.get_field(field_name).storage
+    delete_files(storage, stale)
+    rows = model.objects.filter(pk=pk, **{field_name: name})
+    variants_field = f'{field_name}_variants'
+    try:
+        clean_name, info = process_image(storage, name, VARIANT_SIZES[kind])
+    except ImageError:
+        rows.update(**{field_name: '', variants_field: None, 'updated_at': timezone.now()})
+        delete_files(storage, [name])
+        return None
+
+    if not rows.update(**{field_name: clean_name, variants_field: info, 'updated_at': timezone.now()}):
+        # Replaced or deleted while processing; this work is not referenced
+        delete_files(storage, [clean_name, *stored_paths(info)])
+        return None
+    if clean_name != name:
+        delete_files(storage, [name])
+    return info
+
+
+def variant_urls(field_file, info):
+    """Return the recorded dimensions with each variant's paths turned into URLs."""
+    if not field_file or not info:
+        return None
+    storage = field_file.storage
+    return {
+        'width': info['width'],
+        'height': info['height'],
+        'variants': {
+            label: {
+                'width': variant['width'],
+                'height': variant['height'],
+                'src': storage.url(variant['src']),
+                'webp': storage.url(variant['webp']),
+            }
+            for label, variant in info['variants'].items()
+        },
+    }
+
+
+def track_uploads(instance, field_names):
+    """
+    For ``Model.save``: return the image fields of ``instance`` that were
+    assigned a new upload, as (field name, variant paths of the replaced
+    image), and reset their recorded variants. Cleared fields lose their
+    variants too.
+    """
+    uploads = []
+    for field_name in field_names:
+        field_file = getattr(instance, field_name)
+        if field_file and field_file._committed:
+            continue
+        variants_field = f'{field_name}_variants'
+        if field_file:
+            uploads.append((field_name, stored_paths(getattr(instance, variants_field))))
+        setattr(instance, variants_field, None)
+    return uploads
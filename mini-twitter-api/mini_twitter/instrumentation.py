@@ -0,0 +1,251 @@
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` measures a sample of requests (a fraction
+PERFORMANCE_SAMPLE_RATE of them): SQL queries and their time, Django cache
+reads and writes with the hit ratio, time spent building serializer data,
+and the total time through the middleware and view stack. The numbers are
+returned in a ``Server-Timing`` header (shown by browser dev tools) and kept
+per view in fixed-size ring buffers, from which ``performance_report``
+computes p50/p95/p99. Buffers are per process.
+
+Requests that are not sampled cost one random() call; the serializer hook
+only does work while a sampled request is active, and the cache hook then
+only feeds the Prometheus hit/miss counters (see mini_twitter.metrics).
+"""
+import random
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from .metrics import record_cache_reads
+
+_current = ContextVar('request_metrics', default=None)
+# Set while a cache method runs, so backends calling their own methods
+# (e.g. get_many looping over get) count once
+_cache_depth = ContextVar('cache_depth', default=0)
+
+CACHE_READS = ('get', 'get_many')
+CACHE_WRITES = ('set', 'set_many', 'add')
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.cache_gets = 0
+        self.cache_hits = 0
+        self.cache_sets = 0
+        self.cache_time = 0.0
+        self.serializer_time = 0.0
+        # Nesting guard, so serializers built by other serializers count once
+        self.serializer_depth = 0
+
+    def cache_hit_ratio(self):
+        return self.cache_hits / self.cache_gets if self.cache_gets else None
+
+    def server_timing(self, total):
+        # Commas separate metrics in the header, so descriptions avoid them
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"',
+            f'cache;dur={self.cache_time * 1000:.1f};'
+            f'desc="{self.cache_hits}/{self.cache_gets} hits {self.cache_sets} sets"',
+            f'serialize;dur={self.serializer_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def current_metrics():
+    """The metrics of the sampled request being handled, or None."""
+    return _current.get()
+
+
+def _time_sql(execute, sql, params, many, context):
+    metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if metrics is not None:
+            metrics.sql_count += 1
+            metrics.sql_time += time.perf_counter() - started
+
+
+def _instrument_cache_method(method, name):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if _cache_depth.get():
+            return method(self, *args, **kwargs)
+
+        metrics = _current.get()
+        token = _cache_depth.set(1)
+        started = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            _cache_depth.reset(token)
+            if metrics is not None:
+                metrics.cache_time += time.perf_counter() - started
+
+        # Reads feed the Prometheus hit/miss counters on every request
+        if name == 'get':
+            default = kwargs.get('default', args[1] if len(args) > 1 else None)
+            keys = [args[0] if args else kwargs['key']]
+            found = keys if result is not default else ()
+            record_cache_reads(keys, found)
+            if metrics is not None:
+                metrics.cache_gets += 1
+                metrics.cache_hits += bool(found)
+        elif name == 'get_many':
+            keys = args[0] if args else kwargs['keys']
+            record_cache_reads(keys, result)
+            if metrics is not None:
+                metrics.cache_gets += len(keys)
+                metrics.cache_hits += len(result)
+        elif metrics is not None:
+            metrics.cache_sets += (
+                (len(args[0]) if args else len(kwargs.get('data', {}))) if name == 'set_many' else 1
+            )
+        return result
+
+    wrapper._instrumented = True
+    return wrapper
+
+
+def instrument_caches():
+    """Count reads and writes on the backends of all configured caches (idempotent)."""
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        for name in CACHE_READS + CACHE_WRITES:
+            method = getattr(backend, name)
+            if not getattr(method, '_instrumented', False):
+                setattr(backend, name, _instrument_cache_method(method, name))
+
+
+def instrument_serializers():
+    """Time the outermost ``serializer.data`` evaluation of a request."""
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data.fget
+    if getattr(original, '_instrumented', False):
+        return
+
+    @wraps(original)
+    def data(self):
+        metrics = _current.get()
+        if metrics is None or metrics.serializer_depth:
+            return original(self)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original(self)
+        finally:
+            metrics.serializer_depth -= 1
+            metrics.serializer_time += time.perf_counter() - started
+
+    data._instrumented = True
+    BaseSerializer.data = property(data)
+
+
+class ViewStats:
+    """The most recent samples of one view, in a ring buffer."""
+
+    def __init__(self, size):
+        # (total ms, queries, SQL ms, serializer ms, cache gets, cache hits)
+        self.samples = deque(maxlen=size)
+        self.requests = 0
+
+    def add(self, metrics, total):
+        self.samples.append((
+            total * 1000, metrics.sql_count, metrics.sql_time * 1000,
+            metrics.serializer_time * 1000, metrics.cache_gets, metrics.cache_hits,
+        ))
+        self.requests += 1
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record(view_name, metrics, total):
+    with _stats_lock:
+        stats = _stats.get(view_name)
+        if stats is None:
+            stats = _stats[view_name] = ViewStats(settings.PERFORMANCE_RING_SIZE)
+        stats.add(metrics, total)
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def performance_report():
+    """Per-view latency percentiles and means over the buffered samples, slowest p95 first."""
+    with _stats_lock:
+        snapshot = {name: (list(stats.samples), stats.requests) for name, stats in _stats.items()}
+
+    report = {}
+    for name, (samples, requests) in snapshot.items():
+        if not samples:
+            continue
+        count = len(samples)
+        totals = sorted(sample[0] for sample in samples)
+        gets = sum(sample[4] for sample in samples)
+        report[name] = {
+            'sampled_requests': requests,
+            'buffered': count,
+            'p50_ms': round(_percentile(totals, 0.50), 2),
+            'p95_ms': round(_percentile(totals, 0.95), 2),
+            'p99_ms': round(_percentile(totals, 0.99), 2),
+            'mean_queries': round(sum(sample[1] for sample in samples) / count, 1),
+            'mean_sql_ms': round(sum(sample[2] for sample in samples) / count, 2),
+            'mean_serializer_ms': round(sum(sample[3] for sample in samples) / count, 2),
+            'cache_hit_ratio': round(sum(sample[5] for sample in samples) / gets, 3) if gets else None,
+        }
+    return dict(sorted(report.items(), key=lambda item: -item[1]['p95_ms']))
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+
+
+class PerformanceMiddleware:
+    """
+    Sample requests at PERFORMANCE_SAMPLE_RATE, add a Server-Timing header
+    and record per-view timings. Place it first so the whole stack is timed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_caches()
+        instrument_serializers()
+
+    def __call__(self, request):
+        if random.random() >= settings.PERFORMANCE_SAMPLE_RATE:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_time_sql))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+
+        response['Server-Timing'] = metrics.server_timing(total)
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            record(match.view_name, metrics, total)
+        return response
@@ -0,0 +1,201 @@
+"""
+Prometheus metrics, served in the text exposition format at ``/metrics``.
+
+- HTTP: request latency and SQL queries per request, labelled by view name
+  (one per DRF action, e.g. ``post-feed``) and method; responses by status.
+- Cache: reads by cache (from the key prefix, see CACHE_NAMES) and hit/miss.
+- Celery: task run time by task and final state, and queue wait (publish to
+  start; only known for tasks published with these signal handlers loaded).
+- Websockets: open connections per consumer.
+
+With several worker processes (gunicorn, Celery prefork), set the
+PROMETHEUS_MULTIPROC_DIR environment variable to a directory shared by all
+of them: every process then writes its values to files there and a scrape
+aggregates them, whichever process serves it. gunicorn.conf.py empties the
+directory on start and drops the gauges of exited workers.
+
+Celery workers usually run on other hosts or containers than the web
+server, so their task metrics are not part of ``/metrics``: with
+CELERY_METRICS_PORT set, the main worker process serves them over HTTP on
+that port, aggregated over its pool processes. It empties its own
+PROMETHEUS_MULTIPROC_DIR on start, which must therefore not be the one of
+a gunicorn server.
+"""
+import os
+import time
+from collections import Counter as Tally
+from contextlib import ExitStack
+from pathlib import Path
+
+from celery.signals import (
+    before_task_publish, task_postrun, task_prerun, worker_init, worker_process_shutdown,
+)
+from django.conf import settings
+from django.db import connections
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess, start_http_server,
+)
+
+# Key prefix -> cache name; the first match wins
+CACHE_NAMES = (
+    ('feed_version_', 'feed_version'),
+    ('feed_author_posts_', 'feed_pull'),
+    ('feed_mention_posts_', 'feed_pull'),
+    ('feed_', 'feed'),
+    ('trending_', 'trending'),
+    ('post_render:', 'post_render'),
+    ('throttle_', 'throttle'),
+)
+
+# Anything else is reported as 'other', so clients cannot create label values
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to handle a request.', ['view', 'method'],
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries run while handling a request.', ['view', 'method'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+RESPONSES = Counter(
+    'http_responses', 'Responses sent.', ['view', 'method', 'status'],
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests', 'Cache reads by cache and result.', ['cache', 'result'],
+)
+TASK_DURATION = Histogram(
+    'celery_task_duration_seconds', 'Time to run a Celery task.', ['task', 'state'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+TASK_QUEUE_WAIT = Histogram(
+    'celery_task_queue_wait_seconds', 'Time between publishing a Celery task and a worker starting it.',
+    ['task'], buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    'websocket_connections', 'Open websocket connections.', ['consumer'],
+    multiprocess_mode='livesum',
+)
+
+
+def cache_name(key):
+    for prefix, name in CACHE_NAMES:
+        if key.startswith(prefix):
+            return name
+    return 'other'
+
+
+def record_cache_reads(keys, found):
+    """Count the reads of ``keys``; those in ``found`` were hits."""
+    tally = Tally((cache_name(key), key in found) for key in keys)
+    for (name, hit), count in tally.items():
+        CACHE_REQUESTS.labels(name, 'hit' if hit else 'miss').inc(count)
+
+
+class QueryCounter:
+    """A database execute wrapper counting the queries it sees."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Record the latency, query count and status of every request."""
+
+    def __init__(self, get_response):
+        from .instrumentation import instrument_caches
+
+        self.get_response = get_response
+        instrument_caches()
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        # Unmatched URLs share one label value, so scanners cannot inflate the series
+        view = match.view_name if match is not None else 'unmatched'
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        REQUEST_LATENCY.labels(view, method).observe(duration)
+        REQUEST_QUERIES.labels(view, method).observe(queries.count)
+        RESPONSES.labels(view, method, str(response.status_code)).inc()
+        return response
+
+
+def scrape_registry():
+    """The registry to scrape, aggregating all processes in multiprocess mode."""
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def generate_metrics():
+    """Return (body, content type) for a scrape."""
+    return generate_latest(scrape_registry()), CONTENT_TYPE_LATEST
+
+
+# Celery. Task start times are kept per process, keyed by task ID.
+_task_started = {}
+
+
+@worker_init.connect
+def _instrument_worker(**kwargs):
+    from .instrumentation import instrument_caches
+
+    instrument_caches()
+    if settings.CELERY_METRICS_PORT:
+        start_worker_metrics_server(settings.CELERY_METRICS_PORT)
+
+
+def start_worker_metrics_server(port):
+    """
+    Serve the worker's metrics on ``port``. Runs in the main worker process,
+    before the pool processes are forked, and empties PROMETHEUS_MULTIPROC_DIR
+    of the values of a previous run.
+    """
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        for path in Path(directory).glob('*.db'):
+            path.unlink()
+    start_http_server(port, registry=scrape_registry())
+
+
+@worker_process_shutdown.connect
+def _forget_worker_process(pid=None, **kwargs):
+    # Drop the live (summed) gauges of the exited pool process
+    if pid is not None and 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+@before_task_publish.connect
+def _stamp_published_at(headers=None, **kwargs):
+    # Message headers become attributes of the task's request in the worker
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+@task_prerun.connect
+def _task_started_handler(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at is not None:
+        TASK_QUEUE_WAIT.labels(task.name).observe(max(0, time.time() - published_at))
+
+
+@task_postrun.connect
+def _task_finished_handler(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_DURATION.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - started)
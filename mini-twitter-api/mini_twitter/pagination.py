@@ -0,0 +1,194 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over ``(created_at, id)``.
+
+    Pages are addressed by opaque cursors holding the position of the last or
+    first row of the current page: ``?after=<cursor>`` returns the next page
+    and ``?before=<cursor>`` the previous one. Every page is a single indexed
+    range scan with no OFFSET and no COUNT(*), so deep pages cost the same
+    as the first one.
+
+    Besides querysets, any object exposing ``keyset_page(position, reverse, limit)``
+    can be paginated (see the home feed engines in ``posts.feeds``).
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    after_query_param = 'after'
+    before_query_param = 'before'
+    ordering_field = 'created_at'
+    descending = True
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def cursor_value(self, instance):
+        """JSON-serializable form of the instance's ordering field."""
+        return getattr(instance, self.ordering_field).isoformat()
+
+    def parse_cursor_value(self, value):
+        position = parse_datetime(value)
+        if position is None:
+            raise ValueError(value)
+        return position
+
+    def encode_cursor(self, instance):
+        position = [self.cursor_value(instance), instance.pk]
+        return urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, encoded):
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            value, pk = json.loads(urlsafe_b64decode(padded.encode()).decode())
+            return self.parse_cursor_value(value), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_position(self, request):
+        """Return ``(position, reverse)`` for the requested page."""
+        after = request.query_params.get(self.after_query_param)
+        before = request.query_params.get(self.before_query_param)
+        if before:
+            return self.decode_cursor(before), True
+        if after:
+            return self.decode_cursor(after), False
+        return None, False
+
+    def seek(self, queryset, position, reverse):
+        """Order the queryset for traversal and filter it to rows past ``position``."""
+        field = self.ordering_field
+        # Walking "forward" means descending on a descending list
+        walk_descending = self.descending != reverse
+        if walk_descending:
+            queryset = queryset.order_by(f'-{field}', '-pk')
+        else:
+            queryset = queryset.order_by(field, 'pk')
+
+        if position is not None:
+            value, pk = position
+            op = 'lt' if walk_descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk})
+            )
+        return queryset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        limit = self.get_page_size(request)
+        position, reverse = self.get_position(request)
+
+        if hasattr(queryset, 'keyset_page'):
+            rows = list(queryset.keyset_page(position, reverse, limit + 1))
+        else:
+            rows = list(self.seek(queryset, position, reverse)[:limit + 1])
+
+        has_more = len(rows) > limit
+        page = rows[:limit]
+        if reverse:
+            page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = page
+        return page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = remove_query_param(self.base_url, self.before_query_param)
+        return replace_query_param(url, self.after_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        url = remove_query_param(self.base_url, self.after_query_param)
+        return replace_query_param(url, self.before_query_param, self.encode_cursor(self.page[0]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.after_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor of the last item of the previous page.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.before_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor of the first item of the next page.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class AscendingKeysetPagination(KeysetPagination):
+    """Keyset pagination for oldest-first lists such as conversation messages."""
+    descending = False
+
+
+class UserKeysetPagination(KeysetPagination):
+    """Keyset pagination for ``User`` lists, which have no ``created_at``."""
+    ordering_field = 'date_joined'
+
+
+class RankedKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination over ``(search_rank, id)`` for relevance-ranked results
+    (see ``posts.search``), best match first.
+    """
+    ordering_field = 'search_rank'
+
+    def cursor_value(self, instance):
+        return float(instance.search_rank)
+
+    def parse_cursor_value(self, value):
+        return float(value)
@@ -35,9 +35,13 @@ INSTALLED_APPS = [
     'posts',
     'notifications',
     'direct_messages',  # Changed from 'messages.apps.MessagesConfig'
+    'uploads',
 ]
 
 MIDDLEWARE = [
+    # First, so the timings cover the whole stack
+    'mini_twitter.instrumentation.PerformanceMiddleware',
+    'mini_twitter.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -105,6 +109,97 @@ CACHES = {
     }
 }
 
+# Home feed engine: 'timeline' (fan-out on write), 'pull' (merge on read) or 'query'
+FEED_ENGINE = os.environ.get('FEED_ENGINE', 'timeline')
+
+# Home timeline (fan-out on write)
+# Each user's home feed is materialized as a capped Redis sorted set of post IDs.
+# Authors with at least FEED_FANOUT_FOLLOWER_THRESHOLD followers are not fanned
+# out; their posts are merged into the timeline at read time instead.
+FEED_TIMELINE_MAX_LENGTH = int(os.environ.get('FEED_TIMELINE_MAX_LENGTH', 800))
+FEED_TIMELINE_TTL = int(os.environ.get('FEED_TIMELINE_TTL', 60 * 60 * 24 * 7))
+FEED_FANOUT_FOLLOWER_THRESHOLD = int(os.environ.get('FEED_FANOUT_FOLLOWER_THRESHOLD', 10000))
+FEED_FANOUT_BATCH_SIZE = 1000
+
+# Pull feed engine (FEED_ENGINE = 'pull')
+# Keeps a short cached list of recent post IDs per author and merges them at read time.
+FEED_PULL_AUTHOR_CACHE_SIZE = int(os.environ.get('FEED_PULL_AUTHOR_CACHE_SIZE', 20))
+FEED_PULL_CACHE_TIMEOUT = int(os.environ.get('FEED_PULL_CACHE_TIMEOUT', 60 * 15))
+
+# Feed page post IDs are cached per user and page, keyed by a per-user feed version
+FEED_CACHE_TIMEOUT = int(os.environ.get('FEED_CACHE_TIMEOUT', 60 * 5))
+FEED_CACHE_VERSION_TTL = 60 * 60 * 24 * 7
+
+# Rendered post snapshots shared by all viewers (see posts.render_cache)
+POST_RENDER_CACHE_TIMEOUT = int(os.environ.get('POST_RENDER_CACHE_TIMEOUT', 60 * 60))
+
+# Like/retweet/reply counters are buffered in Redis and flushed to the
+# database by Celery beat every POST_COUNTER_FLUSH_INTERVAL seconds
+POST_COUNTER_FLUSH_INTERVAL = float(os.environ.get('POST_COUNTER_FLUSH_INTERVAL', 5))
+POST_COUNTER_FLUSH_BATCH_SIZE = 1000
+# Batches flushed per run at most, so a run ends even under a steady stream of updates
+POST_COUNTER_FLUSH_MAX_BATCHES = int(os.environ.get('POST_COUNTER_FLUSH_MAX_BATCHES', 10))
+
+# Trending hashtags: hourly usage buckets over a sliding window, each hour
+# weighted by TRENDING_DECAY ** age_in_hours. The top TRENDING_TOP_N are
+# recomputed every TRENDING_REFRESH_INTERVAL seconds.
+TRENDING_WINDOW_HOURS = int(os.environ.get('TRENDING_WINDOW_HOURS', 24 * 7))
+TRENDING_DECAY = float(os.environ.get('TRENDING_DECAY', 0.95))
+TRENDING_TOP_N = 10
+TRENDING_REFRESH_INTERVAL = float(os.environ.get('TRENDING_REFRESH_INTERVAL', 60))
+TRENDING_CACHE_TIMEOUT = 60 * 60
+
+# Engagement sets: each user's liked and retweeted post IDs mirrored in Redis
+# for O(1) viewer-state lookups, keeping at most ENGAGEMENT_SET_MAX_SIZE of the
+# most recent posts per user (older ones are looked up in the database)
+ENGAGEMENT_SET_MAX_SIZE = int(os.environ.get('ENGAGEMENT_SET_MAX_SIZE', 10000))
+ENGAGEMENT_SET_TTL = 60 * 60 * 24 * 7
+
+# Text search configuration used for post full-text search on PostgreSQL
+POST_SEARCH_CONFIG = os.environ.get('POST_SEARCH_CONFIG', 'english')
+
+# Typeahead: in-process username/hashtag prefix indexes, rebuilt from the
+# database by a background thread every AUTOCOMPLETE_REBUILD_INTERVAL
+# seconds (0 disables the thread; the indexes are then only built by
+# posts.autocomplete.rebuild())
+AUTOCOMPLETE_REBUILD_INTERVAL = int(os.environ.get('AUTOCOMPLETE_REBUILD_INTERVAL', 300))
+AUTOCOMPLETE_MAX_RESULTS = 10
+AUTOCOMPLETE_PREFIX_CACHE_LENGTH = 2
+
+# Bulk post ingestion (POST /api/posts/bulk/ and the import_posts command)
+POST_INGEST_MAX_RECORDS = 10000
+POST_INGEST_BATCH_SIZE = 1000
+
+# Request instrumentation: the share of requests measured (and given a
+# Server-Timing header) and the number of samples kept per view for the
+# staff performance report
+PERFORMANCE_SAMPLE_RATE = float(os.environ.get('PERFORMANCE_SAMPLE_RATE', 0.01))
+PERFORMANCE_RING_SIZE = 1000
+
+# Prometheus metrics at /metrics. If METRICS_TOKEN is set, scrapes must send
+# "Authorization: Bearer <token>". With several worker processes, also set the
+# PROMETHEUS_MULTIPROC_DIR environment variable (see mini_twitter.metrics).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Celery workers serve their task metrics on this port (0 disables it), as
+# they are not part of the web server's /metrics
+CELERY_METRICS_PORT = int(os.environ.get('CELERY_METRICS_PORT', 0))
+
+# Uploaded images larger than this (width x height) are rejected when
+# processed (see mini_twitter.images)
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 40_000_000))
+
+# Chunked uploads (see uploads.views): the largest file a session may
+# declare, the largest chunk accepted per request, and how long (seconds)
+# an upload may sit idle or unattached before it is deleted
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 50 * 1024 * 1024))
+UPLOAD_CHUNK_MAX_SIZE = int(os.environ.get('UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024))
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+# Encode feed, post list, notification and conversation responses with orjson
+# (same bytes as DRF's JSONRenderer; see mini_twitter.renderers)
+FAST_JSON_RENDERER = bool(int(os.environ.get('FAST_JSON_RENDERER', 1)))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -153,7 +248,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'mini_twitter.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
 }
 
@@ -192,6 +287,20 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'flush-post-counters': {
+        'task': 'posts.tasks.flush_post_counters',
+        'schedule': POST_COUNTER_FLUSH_INTERVAL,
+    },
+    'refresh-trending-hashtags': {
+        'task': 'posts.tasks.refresh_trending_hashtags',
+        'schedule': TRENDING_REFRESH_INTERVAL,
+    },
+    'delete-expired-uploads': {
+        'task': 'uploads.tasks.delete_expired_uploads',
+        'schedule': 60 * 60,
+    },
+}
 
 # Rate limiting
 REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = [
@@ -0,0 +1,61 @@
+"""
+Query plan assertions shared by the app test suites.
+
+``QueryPlanTestMixin.assertIndexedEndpoint`` requests an endpoint, runs
+EXPLAIN on the queries it issued against the given tables and fails if the
+plan contains a sequential scan or a sort, i.e. if an index regressed or a
+query stopped matching one.
+"""
+import re
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+FROM_TABLE = re.compile(r'\bFROM "?(\w+)"?')
+
+# SQLite reports a full table scan as a bare "SCAN <table>"; scans that walk
+# an index in order (top-N reads) mention the index.
+SQLITE_PROBLEMS = (re.compile(r'^SCAN \w+$'), re.compile(r'TEMP B-TREE'))
+POSTGRES_PROBLEMS = (re.compile(r'Seq Scan'), re.compile(r'\bSort\b'))
+
+
+def explain(sql):
+    """Return the plan lines for an executed query."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Test tables are tiny, so make the planner use any usable index
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    patterns = POSTGRES_PROBLEMS if connection.vendor == 'postgresql' else SQLITE_PROBLEMS
+    return [line for line in plan if any(pattern.search(line.strip()) for pattern in patterns)]
+
+
+class QueryPlanTestMixin:
+    def assertIndexedEndpoint(self, url, tables):
+        """Request ``url`` and check the plans of its queries on ``tables``."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        checked = 0
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            match = FROM_TABLE.search(sql)
+            if not sql.startswith('SELECT') or not match or match.group(1) not in tables:
+                continue
+            plan = explain(sql)
+            problems = plan_problems(plan)
+            if problems:
+                self.fail(
+                    f"{url} ran a query without a usable index:\n{sql}\n\nPlan:\n" + '\n'.join(plan)
+                )
+            checked += 1
+        self.assertTrue(checked, f"{url} ran no queries on {', '.join(tables)}")
+        return response
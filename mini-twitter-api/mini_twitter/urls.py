@@ -5,7 +5,7 @@ from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
-from .views import app_settings, api_root, root_redirect
+from .views import app_settings, api_root, metrics, root_redirect
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -28,6 +28,7 @@ urlpatterns = [
     path('api/', api_root, name='api-root'),
     
     # Admin URLs
+    path('admin/tools/', include('mini_twitter.admin_urls')),
     path('admin/', admin.site.urls),
     
     # API endpoints
@@ -35,8 +36,12 @@ urlpatterns = [
     path('api/posts/', include('posts.urls')),
     path('api/notifications/', include('notifications.urls')),
     path('api/direct-messages/', include('direct_messages.urls')),
+    path('api/uploads/', include('uploads.urls')),
     path('api/settings/', app_settings, name='app-settings'),
     
+    # Prometheus scrape endpoint
+    path('metrics', metrics, name='metrics'),
+    
     # Swagger documentation
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
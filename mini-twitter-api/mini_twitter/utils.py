@@ -16,4 +16,16 @@ def get_mini_twitter_settings():
             # If it's not JSON, return as a string
             return {'value': mini_twitter_env}
     
-    return {}
\ No newline at end of file
+    return {}
+
+def get_redis_connection(alias='default'):
+    """
+    Return the raw Redis client behind a django-redis cache alias.
+    Returns None when the cache is not backed by Redis (e.g. local memory
+    caches in tests), so callers can fall back to the database.
+    """
+    try:
+        from django_redis import get_redis_connection as _get_redis_connection
+        return _get_redis_connection(alias)
+    except (ImportError, NotImplementedError):
+        return None
@@ -1,8 +1,11 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from django.conf import settings as django_settings
 from django.shortcuts import redirect, render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from .metrics import generate_metrics
 from .utils import get_mini_twitter_settings
 
 @api_view(['GET'])
@@ -40,6 +43,7 @@ def api_root(request):
         'endpoints': {
             'users': request.build_absolute_uri('/api/users/'),
             'posts': request.build_absolute_uri('/api/posts/'),
+            'uploads': request.build_absolute_uri('/api/uploads/'),
             'settings': request.build_absolute_uri('/api/settings/'),
         }
     })
@@ -48,4 +52,14 @@ def root_redirect(request):
     """
     Render the welcome page for the root URL.
     """
-    return render(request, 'index.html')
\ No newline at end of file
+    return render(request, 'index.html')
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint (text exposition format).
+    """
+    token = django_settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    body, content_type = generate_metrics()
+    return HttpResponse(body, content_type=content_type)
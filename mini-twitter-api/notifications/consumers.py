@@ -2,8 +2,11 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
+from mini_twitter.metrics import WEBSOCKET_CONNECTIONS
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    connected = False
+    
     async def connect(self):
         self.user = self.scope["user"]
         
@@ -22,8 +25,16 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        self.connected = True
+        WEBSOCKET_CONNECTIONS.labels('notifications').inc()
     
     async def disconnect(self, close_code):
+        # Rejected connections are disconnected too, but were never counted
+        if not self.connected:
+            return
+        self.connected = False
+        WEBSOCKET_CONNECTIONS.labels('notifications').dec()
+        
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -25,6 +25,10 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', 'created_at', 'id'], name='notification_recipient_idx'),
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notification_unread_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username} {self.notification_type} notification to {self.recipient.username}"
\ No newline at end of file
@@ -18,4 +18,14 @@ def create_notification(recipient, sender, notification_type, content_object, te
         text=text
     )
     
-    return notification
\ No newline at end of file
+    return notification
+
+def create_notifications(notifications, content_type_id):
+    """
+    Create many notifications in one batch. Each item is a dict with
+    recipient_id, sender_id, notification_type, object_id and text.
+    """
+    return Notification.objects.bulk_create(
+        [Notification(content_type_id=content_type_id, **fields) for fields in notifications],
+        batch_size=1000
+    )
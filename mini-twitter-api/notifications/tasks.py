@@ -0,0 +1,7 @@
+from celery import shared_task
+from .services import create_notifications
+
+@shared_task
+def send_bulk_notifications(notifications, content_type_id):
+    """Create a batch of notifications (e.g. for a bulk post import) off the request path."""
+    return len(create_notifications(notifications, content_type_id))
@@ -0,0 +1,63 @@
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.contrib.auth.models import AnonymousUser, User
+from prometheus_client import REGISTRY
+from mini_twitter.testing import QueryPlanTestMixin
+from users.models import Follow
+from .consumers import NotificationConsumer
+from .services import create_notification
+
+class NotificationQueryPlanTests(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='recipient')
+        self.client.force_authenticate(user=self.user)
+        for i in range(5):
+            sender = User.objects.create_user(username=f'sender{i}')
+            follow = Follow.objects.create(follower=sender, following=self.user)
+            create_notification(
+                recipient=self.user,
+                sender=sender,
+                notification_type='follow',
+                content_object=follow,
+                text=f"{sender.username} is now following you."
+            )
+    
+    def test_list(self):
+        response = self.assertIndexedEndpoint(
+            reverse('notification-list') + '?page_size=2', ['notifications_notification']
+        )
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIndexedEndpoint(response.data['next'], ['notifications_notification'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class NotificationConsumerMetricsTests(TestCase):
+    def test_connection_gauge(self):
+        def open_connections():
+            return REGISTRY.get_sample_value('websocket_connections', {'consumer': 'notifications'}) or 0
+        
+        user = User.objects.create_user(username='listener')
+        
+        async def connect_and_close(user):
+            communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notifications/')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            count = open_connections()
+            await communicator.disconnect()
+            return connected, count
+        
+        before = open_connections()
+        connected, during = async_to_sync(connect_and_close)(user)
+        self.assertTrue(connected)
+        self.assertEqual(during, before + 1)
+        self.assertEqual(open_connections(), before)
+        
+        # Rejected (anonymous) connections are not counted
+        connected, during = async_to_sync(connect_and_close)(AnonymousUser())
+        self.assertFalse(connected)
+        self.assertEqual(during, before)
+        self.assertEqual(open_connections(), before)
@@ -2,12 +2,14 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from mini_twitter.renderers import FAST_RENDERER_CLASSES
 from .models import Notification
 from .serializers import NotificationSerializer
 
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = FAST_RENDERER_CLASSES
     
     def get_queryset(self):
         return Notification.objects.filter(recipient=self.request.user)
@@ -0,0 +1,273 @@
+"""
+In-process typeahead index for usernames and hashtags.
+
+Each index is a single list of ``(key, weight, id, name)`` tuples sorted by
+the lowercased name, so the entries sharing a prefix are one contiguous
+slice found with two binary searches. Users are weighted by follower count
+and hashtags by ``post_count``. The best matches for every prefix of up to
+AUTOCOMPLETE_PREFIX_CACHE_LENGTH characters are precomputed, since short
+prefixes match the widest ranges.
+
+Lookups never touch the database, and never wait for it: a background
+thread in each process builds the indexes and rebuilds them every
+AUTOCOMPLETE_REBUILD_INTERVAL seconds, to pick up weights and entries
+created by other processes, then swaps each new index in at once. Until
+the first build finishes, lookups return nothing. New users and hashtags
+are added as they are created (see the receivers in ``posts.models``);
+changes made while a rebuild runs are replayed onto the new index before
+it is swapped in. Counted hashtag uses are replayed as the weights they
+led to, since the rebuild may already have read them from the database.
+
+``PostViewSet.search`` suggests users and hashtags from the same indexes,
+and queries the database only before the first build.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+
+from .models import Hashtag
+
+MAX_CHAR = '\U0010ffff'
+
+
+def rank(entry):
+    return entry[1]
+
+
+class PrefixIndex:
+    def __init__(self, entries, top_size, cached_length):
+        self.top_size = top_size
+        self.cached_length = cached_length
+        self.entries = sorted(entries)
+        self.by_id = {entry[2]: entry for entry in self.entries}
+        self.lock = threading.Lock()
+
+        groups = defaultdict(list)
+        for entry in self.entries:
+            for prefix in self._cached_prefixes(entry[0]):
+                groups[prefix].append(entry)
+        self.top = {
+            prefix: heapq.nlargest(top_size, group, key=rank)
+            for prefix, group in groups.items()
+        }
+
+    def _cached_prefixes(self, key):
+        return [key[:length] for length in range(1, min(len(key), self.cached_length) + 1)]
+
+    def _range(self, prefix):
+        lo = bisect_left(self.entries, (prefix,))
+        hi = bisect_left(self.entries, (prefix + MAX_CHAR,))
+        return self.entries[lo:hi]
+
+    def lookup(self, prefix, limit):
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        if len(prefix) <= self.cached_length and limit <= self.top_size:
+            return self.top.get(prefix, [])[:limit]
+        return heapq.nlargest(limit, self._range(prefix), key=rank)
+
+    def add(self, entry_id, name, weight=0):
+        with self.lock:
+            self._remove(entry_id)
+            entry = (name.lower(), weight, entry_id, name)
+            insort(self.entries, entry)
+            self.by_id[entry_id] = entry
+            for prefix in self._cached_prefixes(entry[0]):
+                self.top[prefix] = heapq.nlargest(
+                    self.top_size, self.top.get(prefix, []) + [entry], key=rank
+                )
+
+    def remove(self, entry_id):
+        with self.lock:
+            self._remove(entry_id)
+
+    def count_use(self, entry_id, name):
+        """Add one to the weight of an entry, adding it if it is new. Returns the new weight."""
+        entry = self.by_id.get(entry_id)
+        weight = (entry[1] if entry else 0) + 1
+        self.add(entry_id, name, weight)
+        return weight
+
+    def raise_weight(self, entry_id, name, weight):
+        """Raise the weight of an entry to at least ``weight``, adding it if it is new."""
+        entry = self.by_id.get(entry_id)
+        if entry is None or entry[1] < weight:
+            self.add(entry_id, name, weight)
+
+    def _remove(self, entry_id):
+        entry = self.by_id.pop(entry_id, None)
+        if entry is None:
+            return
+        index = bisect_left(self.entries, entry)
+        if index < len(self.entries) and self.entries[index] == entry:
+            del self.entries[index]
+        for prefix in self._cached_prefixes(entry[0]):
+            if entry in self.top.get(prefix, ()):
+                self.top[prefix] = heapq.nlargest(self.top_size, self._range(prefix), key=rank)
+
+
+def build_user_index():
+    rows = User.objects.filter(is_active=True).values_list(
+        'username', 'profile__followers_count', 'id'
+    ).iterator(chunk_size=10000)
+    return PrefixIndex(
+        ((username.lower(), followers or 0, user_id, username) for username, followers, user_id in rows),
+        settings.AUTOCOMPLETE_MAX_RESULTS, settings.AUTOCOMPLETE_PREFIX_CACHE_LENGTH
+    )
+
+
+def build_hashtag_index():
+    rows = Hashtag.objects.values_list('name', 'post_count', 'id').iterator(chunk_size=10000)
+    return PrefixIndex(
+        ((name.lower(), post_count, hashtag_id, name) for name, post_count, hashtag_id in rows),
+        settings.AUTOCOMPLETE_MAX_RESULTS, settings.AUTOCOMPLETE_PREFIX_CACHE_LENGTH
+    )
+
+
+INDEX_BUILDERS = {
+    'users': build_user_index,
+    'hashtags': build_hashtag_index,
+}
+
+_indexes = {}
+# Changes made while a rebuild runs, replayed onto the new index: {kind: [(method, args)]}
+_pending = {}
+_swap_lock = threading.Lock()
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def rebuild(kinds=tuple(INDEX_BUILDERS)):
+    """Build fresh indexes from the database and swap them in."""
+    for kind in kinds:
+        with _swap_lock:
+            _pending[kind] = []
+        try:
+            index = INDEX_BUILDERS[kind]()
+        except BaseException:
+            with _swap_lock:
+                _pending.pop(kind, None)
+            raise
+        with _swap_lock:
+            for method, args in _pending.pop(kind):
+                getattr(index, method)(*args)
+            _indexes[kind] = index
+
+
+def _refresh():
+    while True:
+        try:
+            rebuild()
+        except Exception:
+            # The database is unavailable; the current indexes stay in use
+            pass
+        finally:
+            # This thread's connections, which would otherwise stay open
+            connections.close_all()
+        time.sleep(settings.AUTOCOMPLETE_REBUILD_INTERVAL)
+
+
+def start_refresher():
+    """Start this process's rebuild thread, unless AUTOCOMPLETE_REBUILD_INTERVAL is 0."""
+    global _refresher
+    if settings.AUTOCOMPLETE_REBUILD_INTERVAL <= 0 or (_refresher is not None and _refresher.is_alive()):
+        return
+    with _refresher_lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = threading.Thread(target=_refresh, name='autocomplete-refresh', daemon=True)
+            _refresher.start()
+
+
+def get_index(kind):
+    """Return the current index for ``kind``, or None before the first build."""
+    start_refresher()
+    return _indexes.get(kind)
+
+
+def reset():
+    """Drop the built indexes; they are rebuilt by the next rebuild()."""
+    with _swap_lock:
+        _indexes.clear()
+
+
+def _update(kind, method, *args):
+    # Indexes that were never built will load the change when they are
+    with _swap_lock:
+        index = _indexes.get(kind)
+        if index is not None:
+            getattr(index, method)(*args)
+        if kind in _pending:
+            _pending[kind].append((method, args))
+
+
+def index_user(user_id, username, followers_count=0):
+    _update('users', 'add', user_id, username, followers_count)
+
+
+def remove_user(user_id):
+    _update('users', 'remove', user_id)
+
+
+def count_hashtag_uses(hashtags):
+    """Record one more post for each ``(id, name)`` hashtag, adding new ones."""
+    with _swap_lock:
+        index = _indexes.get('hashtags')
+        for hashtag_id, name in hashtags:
+            weight = index.count_use(hashtag_id, name) if index is not None else 1
+            # Replaying the increment would count it twice if the rebuild read it
+            if 'hashtags' in _pending:
+                _pending['hashtags'].append(('raise_weight', (hashtag_id, name, weight)))
+
+
+def remove_hashtag(hashtag_id):
+    _update('hashtags', 'remove', hashtag_id)
+
+
+def _lookup(kind, prefix, limit):
+    index = get_index(kind)
+    return index.lookup(prefix, limit) if index is not None else []
+
+
+def suggest_users(prefix, limit):
+    return [
+        {'id': user_id, 'username': username, 'followers_count': followers}
+        for _, followers, user_id, username in _lookup('users', prefix, limit)
+    ]
+
+
+def suggest_hashtags(prefix, limit):
+    return [
+        {'id': hashtag_id, 'name': name, 'post_count': post_count}
+        for _, post_count, hashtag_id, name in _lookup('hashtags', prefix, limit)
+    ]
+
+
+def matching_users(prefix, limit):
+    """
+    Users whose username starts with ``prefix``, with their profiles, most
+    followed first. Before the first index build, they are queried instead.
+    """
+    users = User.objects.select_related('profile')
+    index = get_index('users')
+    if index is None:
+        return list(users.filter(username__istartswith=prefix)[:limit])
+    user_ids = [user_id for _, _, user_id, _ in index.lookup(prefix, limit)]
+    found = users.in_bulk(user_ids)
+    return [found[user_id] for user_id in user_ids if user_id in found]
+
+
+def matching_hashtags(prefix, limit):
+    """As suggest_hashtags, but queried before the first index build."""
+    if get_index('hashtags') is None:
+        # Hashtag names are stored lowercased
+        return list(
+            Hashtag.objects.filter(name__startswith=prefix.lower()).values('id', 'name', 'post_count')[:limit]
+        )
+    return suggest_hashtags(prefix, limit)
@@ -0,0 +1,125 @@
+"""
+Write-behind buffer for post engagement counters.
+
+Likes, retweets and replies no longer read-modify-write the Post row.
+Deltas are accumulated atomically in a Redis hash per post (HINCRBY) and
+the post is marked dirty; ``flush_counters`` (run periodically by Celery
+beat) drains the dirty set and applies the deltas with batched
+``UPDATE ... SET x = x + delta`` statements. Reads add the pending deltas
+so counts stay live.
+
+Without Redis, deltas are applied to the database immediately.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from mini_twitter.utils import get_redis_connection
+from .models import Post
+
+COUNTER_FIELDS = ('likes_count', 'retweets_count', 'replies_count')
+COUNTERS_KEY = 'post_counters:{post_id}'
+DIRTY_KEY = 'post_counters:dirty'
+
+
+def counters_key(post_id):
+    return COUNTERS_KEY.format(post_id=post_id)
+
+
+def apply_deltas(deltas_by_post):
+    """
+    Apply {post_id: {field: delta}} to the database. Posts sharing the same
+    deltas are updated by a single statement, so a like storm across many
+    posts becomes a handful of UPDATEs.
+    """
+    groups = defaultdict(list)
+    for post_id, deltas in deltas_by_post.items():
+        key = tuple(sorted((field, delta) for field, delta in deltas.items() if delta))
+        if key:
+            groups[key].append(post_id)
+
+    with transaction.atomic():
+        for key, post_ids in groups.items():
+            Post.objects.filter(id__in=post_ids).update(**{
+                field: Greatest(F(field) + delta, 0) for field, delta in key
+            })
+
+
+def incr_counter(post_id, field, delta=1):
+    """Record a change to one of a post's counters."""
+    if field not in COUNTER_FIELDS:
+        raise ValueError(f"Unknown counter field: {field}")
+
+    redis = get_redis_connection()
+    if redis is None:
+        apply_deltas({post_id: {field: delta}})
+        return
+
+    pipe = redis.pipeline()
+    pipe.hincrby(counters_key(post_id), field, delta)
+    pipe.sadd(DIRTY_KEY, post_id)
+    pipe.execute()
+
+
+def pending_counters(post_ids):
+    """Return {post_id: {field: delta}} for deltas not yet flushed to the database."""
+    redis = get_redis_connection()
+    post_ids = list(post_ids)
+    if redis is None or not post_ids:
+        return {}
+
+    pipe = redis.pipeline(transaction=False)
+    for post_id in post_ids:
+        pipe.hgetall(counters_key(post_id))
+    pending = {}
+    for post_id, values in zip(post_ids, pipe.execute()):
+        deltas = {field.decode(): int(delta) for field, delta in values.items() if int(delta)}
+        if deltas:
+            pending[post_id] = deltas
+    return pending
+
+
+def flush_counters(batch_size=None):
+    """
+    Drain up to ``batch_size`` dirty posts and apply their deltas.
+    Returns the number of posts flushed.
+    """
+    redis = get_redis_connection()
+    if redis is None:
+        return 0
+
+    batch_size = batch_size or settings.POST_COUNTER_FLUSH_BATCH_SIZE
+    post_ids = [int(post_id) for post_id in redis.spop(DIRTY_KEY, batch_size) or []]
+    if not post_ids:
+        return 0
+
+    # Read and reset each hash atomically; increments that land afterwards
+    # start a new hash and re-mark the post dirty for the next flush.
+    pipe = redis.pipeline()
+    for post_id in post_ids:
+        pipe.hgetall(counters_key(post_id))
+        pipe.delete(counters_key(post_id))
+    results = pipe.execute()
+
+    deltas_by_post = {}
+    for post_id, values in zip(post_ids, results[::2]):
+        deltas = {field.decode(): int(delta) for field, delta in values.items()}
+        if deltas:
+            deltas_by_post[post_id] = deltas
+
+    try:
+        apply_deltas(deltas_by_post)
+    except Exception:
+        # Put the deltas back so the next flush retries them
+        pipe = redis.pipeline()
+        for post_id, deltas in deltas_by_post.items():
+            for field, delta in deltas.items():
+                pipe.hincrby(counters_key(post_id), field, delta)
+            pipe.sadd(DIRTY_KEY, post_id)
+        pipe.execute()
+        raise
+
+    return len(post_ids)
@@ -0,0 +1,552 @@
+"""
+Synthetic social graphs for load tests and benchmarks.
+
+``DatasetGenerator`` builds a dataset of any size that looks like real
+traffic where it matters for performance:
+
+- follower counts follow a power law (a few accounts have most followers)
+- authors post at rates skewed towards popular accounts, over a time span
+- replies and retweets point at recent earlier posts, so reply chains form
+- content carries hashtags drawn from a Zipf-distributed vocabulary and
+  mentions of popular users; replies mention the author they answer
+- likes go to posts in proportion to their author's popularity
+- direct message conversations are held between users who follow each other
+
+The same seed and options always produce the same graph (timestamps are
+relative to ``end``). The graph is planned with NumPy before anything is
+written, so every denormalized counter (profile followers/following/posts,
+post likes/retweets/replies, hashtag post counts) is known when its row is
+inserted. Rows are written in chunks with ``bulk_create``, or with ``COPY``
+on PostgreSQL.
+"""
+import io
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from users.models import Follow, Profile
+from .ingest import NOTIFICATION_TEXTS
+from .models import Hashtag, Like, Mention, Post, PostHashtag, Retweet
+
+try:
+    from notifications.models import Notification
+    NOTIFICATIONS_ENABLED = True
+except ImportError:
+    NOTIFICATIONS_ENABLED = False
+
+try:
+    from direct_messages.models import Conversation, Message
+    MESSAGES_ENABLED = True
+except ImportError:
+    MESSAGES_ENABLED = False
+
+ORIGINAL, REPLY, RETWEET = 0, 1, 2
+
+# Replies and retweets target one of roughly this many preceding posts
+TARGET_RECENCY = 500
+
+WORDS = (
+    'about after again always another back because before best better big '
+    'call coffee code could day different does done down early even every '
+    'feel find first food friends game going good great happy have help '
+    'home idea just keep know last later life little long look love made '
+    'make many maybe meeting morning much music need never new news next '
+    'night nothing now old only other people place play please post pretty '
+    'project really right same see should since something soon start still '
+    'sure team thanks thing think time today together tomorrow tonight '
+    'travel true trying want watch weather week weekend well what when '
+    'where while why work world write year yesterday'
+).split()
+
+
+def hashtag_names(count):
+    """A deterministic vocabulary of ``count`` hashtag names."""
+    return [
+        WORDS[i % len(WORDS)] + (str(i // len(WORDS)) if i >= len(WORDS) else '')
+        for i in range(count)
+    ]
+
+
+def sample(rng, cdf, size):
+    """Draw ``size`` indexes with probabilities given by a cumulative distribution."""
+    return np.minimum(np.searchsorted(cdf, rng.random(size) * cdf[-1]), len(cdf) - 1)
+
+
+def cumulative(weights):
+    return np.cumsum(weights, dtype=np.float64)
+
+
+@contextmanager
+def explicit_timestamps(*model_classes):
+    """Let bulk_create keep given values for auto_now/auto_now_add fields."""
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for model in model_classes for field in model._meta.concrete_fields
+        if isinstance(field, models.DateTimeField) and (field.auto_now or field.auto_now_add)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class RowWriter:
+    """Insert model instances with bulk_create, or with COPY on PostgreSQL."""
+
+    def __init__(self, use_copy=True, batch_size=1000):
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.batch_size = batch_size
+        self.next_ids = {}
+
+    def reserve_ids(self, model, count):
+        """Allocate primary keys up front so rows can reference each other."""
+        if connection.vendor == 'postgresql':
+            table = model._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                    [table, model._meta.pk.column, count]
+                )
+                return [row[0] for row in cursor.fetchall()]
+
+        if model not in self.next_ids:
+            last = model.objects.aggregate(last=models.Max('pk'))['last'] or 0
+            self.next_ids[model] = last + 1
+        start = self.next_ids[model]
+        self.next_ids[model] += count
+        return list(range(start, start + count))
+
+    def write(self, model, objs):
+        if not objs:
+            return
+        if self.use_copy:
+            self._copy(model, objs)
+        else:
+            model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def _copy(self, model, objs):
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not (field.primary_key and getattr(objs[0], field.attname) is None)
+        ]
+        buffer = io.StringIO()
+        for obj in objs:
+            values = [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+            # Unquoted empty fields are NULL in CSV COPY, quoted ones are strings
+            buffer.write(','.join(
+                '' if value is None else '"' + str(value).replace('"', '""') + '"'
+                for value in values
+            ) + '\n')
+        buffer.seek(0)
+
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+
+
+class DatasetGenerator:
+    def __init__(self, users=1000, posts=10000, avg_following=50, reply_ratio=0.2,
+                 retweet_ratio=0.1, avg_likes=5, mention_ratio=0.1, hashtag_ratio=0.3,
+                 hashtags=500, conversations=None, avg_messages=10, days=30,
+                 popularity_exponent=1.0, seed=0, prefix='user_',
+                 password='password', chunk_size=10000, use_copy=True, end=None,
+                 log=None):
+        self.n_users = users
+        self.n_posts = posts
+        self.avg_following = avg_following
+        self.reply_ratio = reply_ratio
+        self.retweet_ratio = retweet_ratio
+        self.avg_likes = avg_likes
+        self.mention_ratio = mention_ratio
+        self.hashtag_ratio = hashtag_ratio
+        self.n_hashtags = hashtags
+        self.n_conversations = users if conversations is None else conversations
+        self.avg_messages = avg_messages
+        self.created_conversations = self.created_messages = 0
+        self.popularity_exponent = popularity_exponent
+        self.prefix = prefix
+        self.password = password
+        self.chunk_size = chunk_size
+        self.writer = RowWriter(use_copy, batch_size=min(chunk_size, 1000))
+        self.end = end or timezone.now().replace(minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.span = (self.end - self.start).total_seconds()
+        self.rng = np.random.default_rng(seed)
+        self.log = log or (lambda message: None)
+
+    def username(self, index):
+        return f'{self.prefix}{index}'
+
+    def timestamp(self, offset):
+        return self.start + timedelta(seconds=float(offset))
+
+    # Planning
+
+    def plan_users(self):
+        rng, n = self.rng, self.n_users
+        # Zipf-like popularity over a random ranking of the users
+        rank = rng.permutation(n)
+        self.popularity = 1.0 / (rank + 1.0) ** self.popularity_exponent
+        self.popularity_cdf = cumulative(self.popularity)
+        # Popular accounts post and like more, but less than proportionally
+        activity = np.sqrt(self.popularity)
+        self.activity_cdf = cumulative(activity)
+        # Mean author popularity per post, to scale likes to avg_likes per post
+        self.post_popularity = (activity * self.popularity).sum() / activity.sum()
+
+        following = np.zeros(n, dtype=np.int64)
+        if self.avg_following > 0 and n > 1:
+            following = np.minimum(rng.geometric(1.0 / (self.avg_following + 1), n) - 1, n - 1)
+        sources = np.repeat(np.arange(n, dtype=np.int64), following)
+        targets = sample(rng, self.popularity_cdf, len(sources))
+        edges = np.unique(sources[sources != targets] * n + targets[sources != targets])
+        self.follow_sources, self.follow_targets = edges // n, edges % n
+        self.followers_count = np.bincount(self.follow_targets, minlength=n)
+        self.following_count = np.bincount(self.follow_sources, minlength=n)
+
+        # Users join during the first half of the span
+        self.joined = rng.random(n) * self.span / 2
+
+    def plan_posts(self):
+        rng, m = self.rng, self.n_posts
+        self.post_times = np.sort(rng.random(m)) * self.span
+        self.authors = sample(rng, self.activity_cdf, m)
+        # Nobody posts before joining
+        np.minimum.at(self.joined, self.authors, self.post_times)
+
+        draw = rng.random(m)
+        kinds = np.full(m, ORIGINAL, dtype=np.int8)
+        kinds[draw < self.reply_ratio + self.retweet_ratio] = RETWEET
+        kinds[draw < self.reply_ratio] = REPLY
+        kinds[:1] = ORIGINAL
+
+        index = np.arange(m)
+        targets = np.maximum(index - 1 - rng.exponential(TARGET_RECENCY, m).astype(np.int64), 0)
+        targets[kinds == ORIGINAL] = -1
+
+        # Replies and retweets of a retweet go to the retweeted post
+        while True:
+            pointing = np.flatnonzero((targets >= 0) & (kinds[np.maximum(targets, 0)] == RETWEET))
+            if not len(pointing):
+                break
+            targets[pointing] = targets[targets[pointing]]
+
+        # A user retweets a post at most once, and never their own
+        retweets = np.flatnonzero(kinds == RETWEET)
+        own = self.authors[retweets] == self.authors[targets[retweets]]
+        _, first = np.unique(self.authors[retweets] * m + targets[retweets], return_index=True)
+        repeated = np.ones(len(retweets), dtype=bool)
+        repeated[first] = False
+        demoted = retweets[own | repeated]
+        kinds[demoted] = ORIGINAL
+        targets[demoted] = -1
+
+        self.kinds, self.targets = kinds, targets
+        self.replies_count = np.bincount(targets[kinds == REPLY], minlength=m)
+        self.retweets_count = np.bincount(targets[kinds == RETWEET], minlength=m)
+        self.posts_count = np.bincount(self.authors, minlength=self.n_users)
+
+    # Writing
+
+    def write_users(self):
+        hashed = make_password(self.password)
+        self.user_ids = np.array(self.writer.reserve_ids(User, self.n_users), dtype=np.int64)
+        for start in range(0, self.n_users, self.chunk_size):
+            stop = min(start + self.chunk_size, self.n_users)
+            users, profiles = [], []
+            for i in range(start, stop):
+                joined = self.timestamp(self.joined[i])
+                username = self.username(i)
+                users.append(User(
+                    id=int(self.user_ids[i]), username=username, email=f'{username}@example.com',
+                    password=hashed, date_joined=joined,
+                ))
+                profiles.append(Profile(
+                    user_id=int(self.user_ids[i]),
+                    bio=' '.join(self.rng.choice(WORDS, 8)).capitalize(),
+                    followers_count=int(self.followers_count[i]),
+                    following_count=int(self.following_count[i]),
+                    posts_count=int(self.posts_count[i]),
+                    created_at=joined, updated_at=joined,
+                ))
+            with transaction.atomic():
+                self.writer.write(User, users)
+                self.writer.write(Profile, profiles)
+            self.log(f"users: {stop}/{self.n_users}")
+
+    def write_follows(self):
+        total = len(self.follow_sources)
+        for start in range(0, total, self.chunk_size):
+            sources = self.follow_sources[start:start + self.chunk_size]
+            targets = self.follow_targets[start:start + self.chunk_size]
+            since = np.maximum(self.joined[sources], self.joined[targets])
+            created = since + self.rng.random(len(sources)) * (self.span - since)
+            with transaction.atomic():
+                self.writer.write(Follow, [
+                    Follow(
+                        follower_id=int(self.user_ids[source]),
+                        following_id=int(self.user_ids[target]),
+                        created_at=self.timestamp(offset),
+                    )
+                    for source, target, offset in zip(sources, targets, created)
+                ])
+            self.log(f"follows: {min(start + self.chunk_size, total)}/{total}")
+
+    def write_hashtags(self):
+        names = hashtag_names(self.n_hashtags)
+        Hashtag.objects.bulk_create(
+            [Hashtag(name=name, created_at=self.start) for name in names], ignore_conflicts=True
+        )
+        ids = dict(Hashtag.objects.filter(name__in=names).values_list('name', 'id'))
+        self.hashtag_ids = np.array([ids[name] for name in names], dtype=np.int64)
+        self.hashtag_names = names
+        self.hashtag_cdf = cumulative(1.0 / np.arange(1, self.n_hashtags + 1))
+
+    def write_posts(self):
+        self.post_ids = np.zeros(self.n_posts, dtype=np.int64)
+        self.content_type_id = ContentType.objects.get_for_model(Post).id if NOTIFICATIONS_ENABLED else None
+        self.created = {'likes': 0, 'mentions': 0, 'post_hashtags': 0, 'notifications': 0}
+        self.trending = {}
+        for start in range(0, self.n_posts, self.chunk_size):
+            stop = min(start + self.chunk_size, self.n_posts)
+            self.post_ids[start:stop] = self.writer.reserve_ids(Post, stop - start)
+            with transaction.atomic():
+                self._write_post_chunk(start, stop)
+            self.log(f"posts: {stop}/{self.n_posts}")
+
+        # Fill the hourly trending buckets the posts would have bumped
+        from .trending import record_hashtag_counts, refresh_trending
+        record_hashtag_counts(self.trending)
+        refresh_trending()
+
+    def _likes(self, start, stop):
+        """Return (post index, user index) like pairs for posts start..stop."""
+        rng = self.rng
+        authors = self.authors[start:stop]
+        expected = self.avg_likes * self.popularity[authors] / self.post_popularity
+        counts = rng.poisson(np.minimum(expected, self.n_users))
+        counts[self.kinds[start:stop] == RETWEET] = 0
+        posts = np.repeat(np.arange(start, stop), counts)
+        likers = sample(rng, self.activity_cdf, len(posts))
+        pairs = np.unique(posts * self.n_users + likers)
+        return pairs // self.n_users, pairs % self.n_users
+
+    def _write_post_chunk(self, start, stop):
+        rng = self.rng
+        size = stop - start
+        like_posts, like_users = self._likes(start, stop)
+        likes_count = np.bincount(like_posts - start, minlength=size)
+
+        word_counts = rng.integers(4, 16, size)
+        words = rng.choice(WORDS, int(word_counts.sum()))
+        tag_counts = rng.binomial(3, self.hashtag_ratio / 3, size) if self.n_hashtags else np.zeros(size, int)
+        tags = sample(rng, self.hashtag_cdf, int(tag_counts.sum())) if self.n_hashtags else []
+        mentioned = np.where(
+            rng.random(size) < self.mention_ratio, sample(rng, self.popularity_cdf, size), -1
+        )
+
+        posts, post_hashtags, mentions, retweets, notifications = [], [], [], [], []
+        used_tags = []
+        hours = (self.start.timestamp() + self.post_times[start:stop]) // 3600
+        word_at = tag_at = 0
+        for offset in range(size):
+            i = start + offset
+            kind, target, author = int(self.kinds[i]), int(self.targets[i]), int(self.authors[i])
+            target_author = int(self.authors[target]) if target >= 0 else None
+            created_at = self.timestamp(self.post_times[i])
+            post_tags = {int(tag) for tag in tags[tag_at:tag_at + tag_counts[offset]]}
+            post_words = words[word_at:word_at + word_counts[offset]]
+            word_at += word_counts[offset]
+            tag_at += tag_counts[offset]
+
+            post = Post(
+                id=int(self.post_ids[i]), user_id=int(self.user_ids[author]), content='',
+                likes_count=int(likes_count[offset]),
+                retweets_count=int(self.retweets_count[i]),
+                replies_count=int(self.replies_count[i]),
+                is_reply=kind == REPLY, is_retweet=kind == RETWEET,
+                created_at=created_at, updated_at=created_at,
+            )
+            posts.append(post)
+
+            if kind == RETWEET:
+                # Retweets carry no content of their own, like PostViewSet.retweet
+                post.original_post_id = int(self.post_ids[target])
+                retweets.append(Retweet(
+                    user_id=post.user_id, post_id=post.original_post_id, created_at=created_at
+                ))
+                notifications.append((target_author, author, post, 'retweet'))
+                continue
+
+            mentioned_users = set()
+            if kind == REPLY:
+                post.parent_id = int(self.post_ids[target])
+                mentioned_users.add(target_author)
+                notifications.append((target_author, author, post, 'reply'))
+            if mentioned[offset] >= 0:
+                mentioned_users.add(int(mentioned[offset]))
+
+            post.content = ' '.join(
+                [f'@{self.username(user)}' for user in sorted(mentioned_users)] +
+                list(post_words) +
+                [f'#{self.hashtag_names[tag]}' for tag in sorted(post_tags)]
+            )
+            used_tags.extend(post_tags)
+            hour_counts = self.trending.setdefault(int(hours[offset]), {})
+            for tag in post_tags:
+                hashtag_id = int(self.hashtag_ids[tag])
+                hour_counts[hashtag_id] = hour_counts.get(hashtag_id, 0) + 1
+            post_hashtags += [
+                PostHashtag(post_id=post.id, hashtag_id=int(self.hashtag_ids[tag])) for tag in post_tags
+            ]
+            for user in mentioned_users:
+                mentions.append(Mention(
+                    post_id=post.id, user_id=int(self.user_ids[user]), created_at=created_at
+                ))
+                notifications.append((user, author, post, 'mention'))
+
+        likes = []
+        like_times = self.post_times[like_posts]
+        like_times = like_times + rng.random(len(like_posts)) * np.minimum(self.span - like_times, 3 * 86400)
+        for post_index, user, offset in zip(like_posts, like_users, like_times):
+            likes.append(Like(
+                user_id=int(self.user_ids[user]), post_id=int(self.post_ids[post_index]),
+                created_at=self.timestamp(offset),
+            ))
+
+        self.writer.write(Post, posts)
+        self.writer.write(Retweet, retweets)
+        self.writer.write(PostHashtag, post_hashtags)
+        self.writer.write(Mention, mentions)
+        self.writer.write(Like, likes)
+        if NOTIFICATIONS_ENABLED:
+            rows = self._notifications(notifications)
+            self.writer.write(Notification, rows)
+            self.created['notifications'] += len(rows)
+
+        # Hashtag usage: one UPDATE per distinct increment
+        uses = np.bincount(np.array(used_tags, dtype=np.int64), minlength=self.n_hashtags)
+        by_increment = {}
+        for tag in np.flatnonzero(uses):
+            by_increment.setdefault(int(uses[tag]), []).append(int(self.hashtag_ids[tag]))
+        for count, hashtag_ids in by_increment.items():
+            Hashtag.objects.filter(id__in=hashtag_ids).update(post_count=F('post_count') + count)
+
+        from .search import index_posts
+        index_posts([post for post in posts if post.content])
+
+        self.created['likes'] += len(likes)
+        self.created['mentions'] += len(mentions)
+        self.created['post_hashtags'] += len(post_hashtags)
+
+    def _notifications(self, notifications):
+        rows = []
+        for recipient, sender, post, notification_type in notifications:
+            if recipient == sender:
+                continue
+            rows.append(Notification(
+                recipient_id=int(self.user_ids[recipient]), sender_id=post.user_id,
+                notification_type=notification_type, content_type_id=self.content_type_id,
+                object_id=post.id, created_at=post.created_at,
+                text=NOTIFICATION_TEXTS[notification_type].format(username=self.username(sender)),
+            ))
+        return rows
+
+    def write_conversations(self):
+        """Conversations between users and accounts they follow, with a few messages each."""
+        rng = self.rng
+        if not self.n_conversations or not len(self.follow_sources):
+            return
+        picked = rng.choice(len(self.follow_sources), min(self.n_conversations, len(self.follow_sources)), replace=False)
+        first = np.minimum(self.follow_sources[picked], self.follow_targets[picked])
+        second = np.maximum(self.follow_sources[picked], self.follow_targets[picked])
+        pairs = np.unique(first * self.n_users + second)
+        total = len(pairs)
+
+        Participant = Conversation.participants.through
+        for start in range(0, total, self.chunk_size):
+            chunk = pairs[start:start + self.chunk_size]
+            ids = self.writer.reserve_ids(Conversation, len(chunk))
+            counts = rng.poisson(self.avg_messages, len(chunk)) + 1
+            conversations, participants, messages = [], [], []
+            for conversation_id, pair, count in zip(ids, chunk, counts):
+                users = (int(pair // self.n_users), int(pair % self.n_users))
+                since = max(self.joined[users[0]], self.joined[users[1]])
+                times = np.sort(since + rng.random(count) * (self.span - since))
+                senders = rng.integers(0, 2, count)
+                conversations.append(Conversation(
+                    id=conversation_id,
+                    created_at=self.timestamp(times[0]), updated_at=self.timestamp(times[-1]),
+                ))
+                participants += [
+                    Participant(conversation_id=conversation_id, user_id=int(self.user_ids[user]))
+                    for user in users
+                ]
+                for index, (offset, sender) in enumerate(zip(times, senders)):
+                    messages.append(Message(
+                        conversation_id=conversation_id,
+                        sender_id=int(self.user_ids[users[sender]]),
+                        content=' '.join(rng.choice(WORDS, rng.integers(3, 15))).capitalize(),
+                        # The latest message is sometimes still unread
+                        is_read=bool(index < count - 1 or rng.random() < 0.5),
+                        created_at=self.timestamp(offset),
+                    ))
+            with transaction.atomic():
+                self.writer.write(Conversation, conversations)
+                self.writer.write(Participant, participants)
+                self.writer.write(Message, messages)
+            self.created_conversations += len(conversations)
+            self.created_messages += len(messages)
+            self.log(f"conversations: {min(start + self.chunk_size, total)}/{total}")
+
+    def generate(self):
+        """Plan and write the dataset; returns row counts and timings."""
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise ValueError(f"Users named {self.prefix}* exist already; choose another prefix.")
+
+        started = time.perf_counter()
+        self.plan_users()
+        self.plan_posts()
+        planned = time.perf_counter()
+        self.log(f"planned in {planned - started:.1f}s")
+
+        timestamped = [Profile, Follow, Post, Like, Retweet, Mention, Hashtag]
+        if NOTIFICATIONS_ENABLED:
+            timestamped.append(Notification)
+        if MESSAGES_ENABLED:
+            timestamped += [Conversation, Message]
+        with explicit_timestamps(*timestamped):
+            self.write_users()
+            self.write_follows()
+            self.write_hashtags()
+            self.write_posts()
+            if MESSAGES_ENABLED:
+                self.write_conversations()
+
+        elapsed = time.perf_counter() - started
+        return {
+            'users': self.n_users,
+            'follows': len(self.follow_sources),
+            'posts': self.n_posts,
+            'replies': int((self.kinds == REPLY).sum()),
+            'retweets': int((self.kinds == RETWEET).sum()),
+            **self.created,
+            'conversations': self.created_conversations,
+            'messages': self.created_messages,
+            'seconds': round(elapsed, 1),
+        }
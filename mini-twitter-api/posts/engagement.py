@@ -0,0 +1,127 @@
+"""
+Per-user engagement sets: which posts a user has liked or retweeted.
+
+Each user's liked (and retweeted) post IDs are mirrored in a Redis sorted
+set scored by post ID, so "has the viewer liked these posts" is one
+pipelined round trip of O(1) lookups instead of a query on the Like table.
+Sets are built lazily from the database on first read, written through on
+like/unlike and retweet/unretweet, and expire after ENGAGEMENT_SET_TTL.
+
+Sets are space-bounded: only the ENGAGEMENT_SET_MAX_SIZE highest (most
+recent) post IDs are kept. A per-user floor records the lowest post ID the
+set is still complete for; lookups of older posts fall back to the
+database, so answers stay exact. Without Redis every lookup is a query.
+"""
+from django.conf import settings
+
+from mini_twitter.utils import get_redis_connection
+from .models import Like, Retweet
+
+ENGAGEMENT_KEY = 'engagement:{user_id}:{kind}'
+# The lowest post ID the set is complete for (0: complete). Its presence
+# marks the set as built.
+ENGAGEMENT_FLOOR_KEY = 'engagement:{user_id}:{kind}:floor'
+
+
+class EngagementSet:
+    def __init__(self, kind, model):
+        self.kind = kind
+        self.model = model
+
+    def key(self, user_id):
+        return ENGAGEMENT_KEY.format(user_id=user_id, kind=self.kind)
+
+    def floor_key(self, user_id):
+        return ENGAGEMENT_FLOOR_KEY.format(user_id=user_id, kind=self.kind)
+
+    def _query(self, user_id, post_ids):
+        return set(self.model.objects.filter(
+            user_id=user_id, post_id__in=post_ids
+        ).values_list('post_id', flat=True))
+
+    def _build(self, redis, user_id):
+        """Load the user's most recent post IDs from the database; returns (post IDs, floor)."""
+        size = settings.ENGAGEMENT_SET_MAX_SIZE
+        post_ids = list(self.model.objects.filter(user_id=user_id).order_by(
+            '-post_id'
+        ).values_list('post_id', flat=True)[:size + 1])
+        floor = 0
+        if len(post_ids) > size:
+            post_ids = post_ids[:size]
+            floor = post_ids[-1]
+
+        key, ttl = self.key(user_id), settings.ENGAGEMENT_SET_TTL
+        pipe = redis.pipeline()
+        pipe.delete(key)
+        if post_ids:
+            pipe.zadd(key, {str(post_id): post_id for post_id in post_ids})
+            pipe.expire(key, ttl)
+        pipe.set(self.floor_key(user_id), floor, ex=ttl)
+        pipe.execute()
+        return set(post_ids), floor
+
+    def filter(self, user_id, post_ids):
+        """Return the subset of ``post_ids`` the user has engaged with."""
+        post_ids = list(post_ids)
+        if not post_ids:
+            return set()
+        redis = get_redis_connection()
+        if redis is None:
+            return self._query(user_id, post_ids)
+
+        key = self.key(user_id)
+        pipe = redis.pipeline(transaction=False)
+        pipe.get(self.floor_key(user_id))
+        for post_id in post_ids:
+            pipe.zscore(key, post_id)
+        floor, *scores = pipe.execute()
+
+        if floor is None:
+            engaged, floor = self._build(redis, user_id)
+            found = {post_id for post_id in post_ids if post_id in engaged}
+        else:
+            floor = int(floor)
+            found = {post_id for post_id, score in zip(post_ids, scores) if score is not None}
+        # Posts below the floor may have been trimmed from the set
+        older = [post_id for post_id in post_ids if post_id < floor and post_id not in found]
+        if older:
+            found |= self._query(user_id, older)
+        return found
+
+    def contains(self, user_id, post_id):
+        return post_id in self.filter(user_id, [post_id])
+
+    def add(self, user_id, post_id):
+        redis = get_redis_connection()
+        if redis is None:
+            return
+        key, floor_key = self.key(user_id), self.floor_key(user_id)
+        # An unbuilt set is rebuilt from the database on its next read, so
+        # adding to it is harmless; the TTL keeps it from lingering
+        pipe = redis.pipeline()
+        pipe.zadd(key, {str(post_id): post_id})
+        pipe.zremrangebyrank(key, 0, -(settings.ENGAGEMENT_SET_MAX_SIZE + 1))
+        pipe.zrange(key, 0, 0, withscores=True)
+        pipe.expire(key, settings.ENGAGEMENT_SET_TTL)
+        pipe.expire(floor_key, settings.ENGAGEMENT_SET_TTL)
+        _, trimmed, lowest, _, built = pipe.execute()
+        if trimmed and built:
+            redis.set(floor_key, int(lowest[0][1]), ex=settings.ENGAGEMENT_SET_TTL)
+
+    def remove(self, user_id, post_id):
+        redis = get_redis_connection()
+        if redis is not None:
+            redis.zrem(self.key(user_id), post_id)
+
+    def invalidate(self, user_ids):
+        """Drop the sets of the given users, e.g. after writing rows in bulk."""
+        redis = get_redis_connection()
+        user_ids = list(user_ids)
+        if redis is not None and user_ids:
+            redis.delete(*[
+                key for user_id in user_ids for key in (self.key(user_id), self.floor_key(user_id))
+            ])
+
+
+likes = EngagementSet('likes', Like)
+retweets = EngagementSet('retweets', Retweet)
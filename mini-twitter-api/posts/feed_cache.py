@@ -0,0 +1,77 @@
+"""
+Versioned, per-page home feed cache.
+
+Each user has a feed version counter. The post IDs and links of each feed
+page are cached under keys that embed the current version, so invalidating
+every cached page of a user is a single INCR: old entries simply stop being
+read and expire. The posts themselves are rendered on every read (see
+posts.render_cache), with live counters and viewer state.
+Versions are bumped on follow/unfollow, on the viewer's own likes and
+retweets, and for all followers when a followee posts or deletes a post.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+from mini_twitter.utils import get_redis_connection
+from users.models import Follow
+from .timeline import chunked
+
+FEED_VERSION_KEY = 'feed_version_{user_id}'
+FEED_PAGE_KEY = 'feed_{user_id}_v{version}_{params}'
+
+
+def feed_version_key(user_id):
+    return FEED_VERSION_KEY.format(user_id=user_id)
+
+
+def get_feed_version(user_id):
+    return cache.get(feed_version_key(user_id), 0)
+
+
+def feed_page_key(user_id, version, query_params):
+    """Cache key for one feed page: the user, their feed version and the page's query string."""
+    params = urlencode(sorted(
+        (key, value) for key, values in query_params.lists() for value in values
+    ))
+    digest = hashlib.md5(params.encode()).hexdigest()
+    return FEED_PAGE_KEY.format(user_id=user_id, version=version, params=digest)
+
+
+def bump_feed_versions(user_ids):
+    """Invalidate every cached feed page of the given users in one pipelined round trip."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    redis = get_redis_connection()
+    if redis is not None:
+        pipe = redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            # django-redis stores integers unpickled, so the raw counter stays
+            # readable through cache.get()
+            key = cache.make_key(feed_version_key(user_id))
+            pipe.incr(key)
+            pipe.expire(key, settings.FEED_CACHE_VERSION_TTL)
+        pipe.execute()
+        return
+
+    for user_id in user_ids:
+        key = feed_version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, settings.FEED_CACHE_VERSION_TTL)
+
+
+def bump_follower_feed_versions(author_id, user_ids=()):
+    """Invalidate the feeds of an author, their followers and any extra users (e.g. mentioned)."""
+    bump_feed_versions({author_id, *user_ids})
+    batch_size = settings.FEED_FANOUT_BATCH_SIZE
+    follower_ids = Follow.objects.filter(following_id=author_id).values_list(
+        'follower_id', flat=True
+    ).iterator(chunk_size=batch_size)
+    for batch in chunked(follower_ids, batch_size):
+        bump_feed_versions(batch)
@@ -0,0 +1,261 @@
+"""
+Home feed engines.
+
+FEED_ENGINE selects how ``PostViewSet.feed`` builds a user's home feed:
+
+- ``timeline``: read the user's materialized fan-out timeline (see timeline.py)
+- ``pull``: k-way merge of short per-author recent-post lists at read time
+- ``query``: run a single query over followed users' posts and mentions
+
+Engines that need Redis fall back to ``query`` when the cache is not Redis.
+"""
+import heapq
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from mini_twitter.utils import get_redis_connection
+from users.models import Follow
+from .models import Mention, Post
+from .timeline import HomeTimeline, hydrate
+
+
+def query_feed(user):
+    # Get IDs of users that the current user follows
+    following_ids = Follow.objects.filter(follower=user).values_list('following_id', flat=True)
+
+    # Include the user's own posts in the feed
+    following_ids = list(following_ids) + [user.id]
+
+    # Get posts from followed users and the user's own posts. Mentions are
+    # matched with a subquery rather than a join, so no DISTINCT is needed
+    return Post.objects.for_rendering().filter(
+        Q(user_id__in=following_ids) |  # Posts from followed users
+        Q(id__in=Mention.objects.filter(user=user).values('post_id'))  # Posts where the user is mentioned
+    ).order_by('-created_at')
+
+
+def timeline_feed(user):
+    redis = get_redis_connection()
+    if redis is None:
+        return query_feed(user)
+    return HomeTimeline(redis, user)
+
+
+AUTHOR_POSTS_KEY = 'feed_author_posts_{user_id}'
+MENTION_POSTS_KEY = 'feed_mention_posts_{user_id}'
+
+
+def author_posts_key(user_id):
+    return AUTHOR_POSTS_KEY.format(user_id=user_id)
+
+
+def mention_posts_key(user_id):
+    return MENTION_POSTS_KEY.format(user_id=user_id)
+
+
+def invalidate_recent_posts(author_id, mentioned_ids=()):
+    """Drop the cached recent-post lists touched by a post being written or deleted."""
+    cache.delete_many(
+        [author_posts_key(author_id)] +
+        [mention_posts_key(user_id) for user_id in mentioned_ids]
+    )
+
+
+def _entries(rows):
+    return [(post_id, created_at.timestamp()) for post_id, created_at in rows]
+
+
+def _recent_author_posts(author_ids):
+    """
+    Return {author_id: [(post_id, score), ...]} with each author's most recent
+    posts, newest first. Served from the cache with one get_many; misses are
+    filled with a single windowed query and written back with set_many.
+    """
+    size = settings.FEED_PULL_AUTHOR_CACHE_SIZE
+    keys = {author_posts_key(author_id): author_id for author_id in author_ids}
+    cached = cache.get_many(keys.keys())
+    recent = {keys[key]: entries for key, entries in cached.items()}
+
+    missing = [author_id for author_id in author_ids if author_id not in recent]
+    if missing:
+        rows = Post.objects.filter(user_id__in=missing).annotate(
+            rank=Window(
+                expression=RowNumber(),
+                partition_by=F('user_id'),
+                order_by=[F('created_at').desc(), F('id').desc()],
+            )
+        ).filter(rank__lte=size).order_by('user_id', '-created_at', '-id').values_list(
+            'user_id', 'id', 'created_at'
+        )
+        filled = {author_id: [] for author_id in missing}
+        for author_id, post_id, created_at in rows:
+            filled[author_id].append((post_id, created_at.timestamp()))
+        cache.set_many(
+            {author_posts_key(author_id): entries for author_id, entries in filled.items()},
+            settings.FEED_PULL_CACHE_TIMEOUT
+        )
+        recent.update(filled)
+    return recent
+
+
+def _recent_mention_posts(user_id):
+    key = mention_posts_key(user_id)
+    entries = cache.get(key)
+    if entries is None:
+        entries = _entries(
+            Post.objects.filter(mentions__user_id=user_id).order_by(
+                '-created_at', '-id'
+            ).values_list('id', 'created_at')[:settings.FEED_PULL_AUTHOR_CACHE_SIZE]
+        )
+        cache.set(key, entries, settings.FEED_PULL_CACHE_TIMEOUT)
+    return entries
+
+
+def _key(created_at, post_id):
+    return created_at.timestamp(), post_id
+
+
+def _older_rows(queryset, last_score, last_id):
+    """
+    Yield (score, post_id, is_post) triples for the rows of ``queryset``
+    older than (last_score, last_id), newest first, paged with keyset
+    queries.
+
+    Before each query it yields a bound (``is_post`` false) whose key no
+    later row can exceed. The merge only resumes the stream, running the
+    query, once the bound is the newest entry left, so streams whose older
+    posts cannot reach the page are never queried. Scores are created_at
+    timestamps, which convert back to the datetime exactly.
+    """
+    last = datetime.fromtimestamp(last_score, tz=dt_timezone.utc)
+    batch_size = settings.FEED_PULL_AUTHOR_CACHE_SIZE
+    while True:
+        yield last_score, last_id, False
+        rows = list(queryset.filter(
+            Q(created_at__lt=last) | Q(created_at=last, id__lt=last_id)
+        ).order_by('-created_at', '-id').values_list('id', 'created_at')[:batch_size])
+        for post_id, created_at in rows:
+            yield (*_key(created_at, post_id), True)
+        if len(rows) < batch_size:
+            return
+        last_id, last = rows[-1]
+        last_score = last.timestamp()
+
+
+def _used_up(entries, cursor):
+    """Whether a full cached list lies entirely above the cursor, so reading on needs the database."""
+    if cursor is None or len(entries) < settings.FEED_PULL_AUTHOR_CACHE_SIZE:
+        return False
+    post_id, score = entries[-1]
+    return cursor < (score, post_id)
+
+
+def _stream(entries, queryset, cursor=None):
+    """
+    Yield (score, post_id, is_post) triples newest first, below ``cursor``:
+    the cached entries, then, if the cached list was full, older rows from
+    the database (see ``_older_rows``).
+    """
+    for post_id, score in entries:
+        if cursor is None or (score, post_id) < cursor:
+            yield score, post_id, True
+    if len(entries) < settings.FEED_PULL_AUTHOR_CACHE_SIZE:
+        return
+    post_id, score = entries[-1]
+    yield from _older_rows(queryset, score, post_id)
+
+
+class PullFeed:
+    """
+    Read-time home feed built by a heap-based k-way merge over each followed
+    author's cached recent posts (plus the user's own posts and mentions).
+
+    Only as many entries as the requested page needs are pulled from the
+    merge, so the cost depends on the page size rather than on how many
+    posts the followed accounts have written.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        author_ids = list(
+            Follow.objects.filter(follower=user).values_list('following_id', flat=True)
+        ) + [user.id]
+        self.recent = _recent_author_posts(author_ids)
+        self.mentions = _recent_mention_posts(user.id)
+
+    def _streams(self, position=None):
+        cursor = _key(*position) if position is not None else None
+        streams = []
+        # Authors whose cached posts are all above the cursor (common on
+        # deep pages) are read on from the database with one shared keyset
+        # query below the cursor, rather than one query each
+        used_up = []
+        for author_id, entries in self.recent.items():
+            if _used_up(entries, cursor):
+                used_up.append(author_id)
+            elif entries:
+                streams.append(_stream(entries, Post.objects.filter(user_id=author_id), cursor))
+        if used_up:
+            streams.append(_older_rows(Post.objects.filter(user_id__in=used_up), *cursor))
+        
+        if _used_up(self.mentions, cursor):
+            streams.append(_older_rows(Post.objects.filter(mentions__user_id=self.user.id), *cursor))
+        elif self.mentions:
+            streams.append(_stream(
+                self.mentions, Post.objects.filter(mentions__user_id=self.user.id), cursor
+            ))
+        return streams
+
+    def merged(self, position=None):
+        seen = set()
+        for score, post_id, is_post in heapq.merge(*self._streams(position), reverse=True):
+            if is_post and post_id not in seen:
+                seen.add(post_id)
+                yield score, post_id
+
+    def page_ids(self, position=None, reverse=False, limit=20):
+        """
+        Return up to ``limit`` post IDs past ``position`` in traversal order:
+        newest first, or oldest first when walking backwards (``reverse``).
+        """
+        if not reverse:
+            return [post_id for score, post_id in islice(self.merged(position), limit)]
+
+        # Previous pages sit above the cursor: merge from the top down to it
+        # and keep the ``limit`` entries closest to it.
+        cursor = _key(*position) if position is not None else None
+        window = deque(maxlen=limit)
+        for score, post_id in self.merged():
+            if cursor is not None and (score, post_id) <= cursor:
+                break
+            window.append(post_id)
+        return list(reversed(window))
+
+    def keyset_page(self, position, reverse, limit):
+        return hydrate(self.page_ids(position, reverse, limit))
+
+    def __iter__(self):
+        return iter(self.keyset_page(None, False, settings.FEED_TIMELINE_MAX_LENGTH))
+
+
+def pull_feed(user):
+    return PullFeed(user)
+
+
+FEED_ENGINES = {
+    'pull': pull_feed,
+    'query': query_feed,
+    'timeline': timeline_feed,
+}
+
+
+def get_home_feed(user):
+    """Return a sliceable sequence of the user's home feed posts, newest first."""
+    engine = FEED_ENGINES.get(settings.FEED_ENGINE, query_feed)
+    return engine(user)
@@ -0,0 +1,384 @@
+"""
+Bulk post ingestion for content migrated from other systems.
+
+Records are dicts with the author's ``user`` (username) and ``content``,
+plus optionally:
+
+- ``ref``: a caller-chosen key other records of the import can point at
+- ``parent`` / ``original_post``: ID of an existing post to reply to / retweet
+- ``parent_ref`` / ``original_post_ref``: ``ref`` of a post in the import
+- ``created_at``: ISO 8601 timestamp (defaults to now)
+
+Retweets are saved without content, as ``create_retweet`` saves them, so
+their hashtags and mentions are neither linked nor counted.
+
+Posts are inserted with ``bulk_create`` in dependency order (a reply is
+inserted after the post it answers), hashtags and mentions are resolved with
+one set-based query each, counters are adjusted with batched updates, and
+notifications and timeline fan-out are deferred to one task each.
+"""
+import re
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, engagement
+from .trending import current_hour
+from .models import HASHTAG_PATTERN, MENTION_PATTERN, Hashtag, Mention, Post, PostHashtag, Retweet
+
+try:
+    from notifications.tasks import send_bulk_notifications
+    NOTIFICATIONS_ENABLED = True
+except ImportError:
+    NOTIFICATIONS_ENABLED = False
+
+REFERENCE_FIELDS = ('parent', 'original_post')
+
+NOTIFICATION_TEXTS = {
+    'reply': "{username} replied to your post.",
+    'retweet': "{username} retweeted your post.",
+    'mention': "{username} mentioned you in a post.",
+}
+
+
+class IngestError(Exception):
+    """Raised with a list of per-record errors when an import is rejected."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid records")
+        self.errors = errors
+
+
+def _validate(records, refs):
+    """Check records and resolve authors and existing posts with one query each."""
+    errors = []
+    usernames = {record.get('user') for record in records if isinstance(record, dict)}
+    users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    existing_ids = {
+        record.get(field) for record in records if isinstance(record, dict)
+        for field in REFERENCE_FIELDS if record.get(field) is not None
+    }
+    # Posts referenced by refs of earlier batches are existing posts too
+    existing_ids |= {
+        refs[record[f'{field}_ref']] for record in records if isinstance(record, dict)
+        for field in REFERENCE_FIELDS if record.get(f'{field}_ref') in refs
+    }
+    existing = dict(Post.objects.filter(id__in=[
+        post_id for post_id in existing_ids if isinstance(post_id, int)
+    ]).values_list('id', 'user_id'))
+
+    import_refs = {record.get('ref') for record in records if isinstance(record, dict)}
+    ref_authors = {
+        record['ref']: users.get(record.get('user')) for record in records
+        if isinstance(record, dict) and record.get('ref') is not None
+    }
+    # Retweets are unique per user and post, as in create_retweet
+    retweeted = set(Retweet.objects.filter(
+        user_id__in=users.values(), post_id__in=list(existing)
+    ).values_list('user_id', 'post_id'))
+    batch_refs = set()
+    batch_retweets = set()
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({'index': index, 'error': "Record must be an object."})
+            continue
+        if record.get('user') not in users:
+            errors.append({'index': index, 'error': f"Unknown user: {record.get('user')}"})
+        if not isinstance(record.get('content', ''), str):
+            errors.append({'index': index, 'error': "content must be a string."})
+        if record.get('created_at') is not None and parse_datetime(str(record['created_at'])) is None:
+            errors.append({'index': index, 'error': "created_at must be an ISO 8601 timestamp."})
+        for field in REFERENCE_FIELDS:
+            post_id, ref = record.get(field), record.get(f'{field}_ref')
+            if post_id is not None and post_id not in existing:
+                errors.append({'index': index, 'error': f"{field} {post_id} does not exist."})
+            if ref is not None and ref not in refs and ref not in import_refs:
+                errors.append({'index': index, 'error': f"{field}_ref {ref} does not exist."})
+        error = _retweet_error(record, users, refs, ref_authors, existing, retweeted, batch_retweets)
+        if error:
+            errors.append({'index': index, 'error': error})
+        ref = record.get('ref')
+        if ref is not None:
+            if ref in refs or ref in batch_refs:
+                errors.append({'index': index, 'error': f"Duplicate ref: {ref}"})
+            batch_refs.add(ref)
+
+    if errors:
+        raise IngestError(errors)
+    return users, existing
+
+
+def _retweet_error(record, users, refs, ref_authors, existing, retweeted, batch_retweets):
+    """Refuse retweets of one's own post and second retweets of the same post."""
+    user_id = users.get(record.get('user'))
+    ref = record.get('original_post_ref')
+    if ref in refs:
+        target, author = refs[ref], existing.get(refs[ref])
+    elif ref is not None:
+        target, author = ('ref', ref), ref_authors.get(ref)
+    else:
+        target = record.get('original_post')
+        author = existing.get(target)
+    if user_id is None or target is None:
+        return None
+
+    if author == user_id:
+        return "Cannot retweet your own post."
+    if (user_id, target) in retweeted or (user_id, target) in batch_retweets:
+        return "Duplicate retweet: the user already retweeted this post."
+    batch_retweets.add((user_id, target))
+    return None
+
+
+def _levels(records):
+    """
+    Split record indexes into insertion levels: every record only references
+    posts that exist already or belong to an earlier level.
+    """
+    ref_index = {
+        record['ref']: index for index, record in enumerate(records)
+        if record.get('ref') is not None
+    }
+    parents = {
+        index: [
+            ref_index[record[f'{field}_ref']] for field in REFERENCE_FIELDS
+            if record.get(f'{field}_ref') in ref_index
+        ]
+        for index, record in enumerate(records)
+    }
+
+    # Records usually come parents first, making this a single pass
+    depth = {}
+    remaining = list(range(len(records)))
+    while remaining:
+        pending = []
+        for index in remaining:
+            if all(parent in depth for parent in parents[index]):
+                depth[index] = 1 + max((depth[parent] for parent in parents[index]), default=-1)
+            else:
+                pending.append(index)
+        if len(pending) == len(remaining):
+            raise IngestError([{'index': index, 'error': "Circular reference."} for index in pending])
+        remaining = pending
+
+    levels = {}
+    for index in range(len(records)):
+        levels.setdefault(depth[index], []).append(index)
+    return [levels[level] for level in sorted(levels)]
+
+
+def _link_hashtags(posts):
+    """
+    Link posts to their hashtags. Returns the (id, name) of the hashtags
+    used and the uses per hour of creation, {hour: {hashtag_id: count}},
+    for the trending buckets.
+    """
+    names_by_post = {
+        post.id: {name.lower() for name in re.findall(HASHTAG_PATTERN, post.content)}
+        for post in posts
+    }
+    names = set().union(*names_by_post.values())
+    if not names:
+        return [], {}
+
+    Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+    hashtags = dict(Hashtag.objects.filter(name__in=names).values_list('name', 'id'))
+    PostHashtag.objects.bulk_create([
+        PostHashtag(post_id=post_id, hashtag_id=hashtags[name])
+        for post_id, post_names in names_by_post.items() for name in post_names
+    ], ignore_conflicts=True, batch_size=1000)
+
+    # One UPDATE per distinct increment rather than one per hashtag
+    uses = Counter(name for post_names in names_by_post.values() for name in post_names)
+    by_increment = {}
+    for name, count in uses.items():
+        by_increment.setdefault(count, []).append(hashtags[name])
+    for count, hashtag_ids in by_increment.items():
+        Hashtag.objects.filter(id__in=hashtag_ids).update(post_count=F('post_count') + count)
+
+    trending = {}
+    for post in posts:
+        hour_counts = trending.setdefault(current_hour(post.created_at.timestamp()), Counter())
+        hour_counts.update(hashtags[name] for name in names_by_post[post.id])
+    return [(hashtag_id, name) for name, hashtag_id in hashtags.items()], trending
+
+
+def _link_mentions(posts):
+    usernames_by_post = {post.id: set(re.findall(MENTION_PATTERN, post.content)) for post in posts}
+    usernames = set().union(*usernames_by_post.values())
+    if not usernames:
+        return []
+
+    users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    mentions = [
+        Mention(post_id=post_id, user_id=users[username])
+        for post_id, post_usernames in usernames_by_post.items()
+        for username in post_usernames if username in users
+    ]
+    Mention.objects.bulk_create(mentions, ignore_conflicts=True, batch_size=1000)
+    return mentions
+
+
+def ingest_posts(records, refs=None, notify=True):
+    """
+    Insert a batch of post records in one transaction.
+
+    ``refs`` maps refs from earlier batches to post IDs, so a large import
+    can be split into batches; it is updated in place. Returns a report
+    with the created count, the ref -> ID map of this batch and the
+    throughput in posts/sec. Raises IngestError if any record is invalid;
+    nothing is inserted in that case.
+    """
+    started = time.perf_counter()
+    refs = refs if refs is not None else {}
+    if not records:
+        return {'created': 0, 'refs': {}, 'seconds': 0, 'posts_per_second': None}
+    users, existing = _validate(records, refs)
+    authors = dict(existing)
+    known_refs = dict(refs)
+
+    posts = [None] * len(records)
+    with transaction.atomic():
+        for level in _levels(records):
+            batch = []
+            for index in level:
+                record = records[index]
+                post = Post(
+                    user_id=users[record['user']],
+                    content=record.get('content', ''),
+                )
+                for field in REFERENCE_FIELDS:
+                    ref = record.get(f'{field}_ref')
+                    target = known_refs[ref] if ref is not None else record.get(field)
+                    if target is not None:
+                        setattr(post, f'{field}_id', target)
+                post.is_reply = post.parent_id is not None
+                post.is_retweet = post.original_post_id is not None
+                if post.is_retweet:
+                    post.content = ''
+                batch.append(post)
+                posts[index] = post
+
+            Post.objects.bulk_create(batch, batch_size=1000)
+            for index, post in zip(level, batch):
+                authors[post.id] = post.user_id
+                ref = records[index].get('ref')
+                if ref is not None:
+                    known_refs[ref] = post.id
+
+        # auto_now_add overrides values given to bulk_create, so historical
+        # timestamps are written in one batched update
+        dated = []
+        for record, post in zip(records, posts):
+            if record.get('created_at'):
+                created_at = parse_datetime(str(record['created_at']))
+                if timezone.is_naive(created_at):
+                    created_at = timezone.make_aware(created_at)
+                post.created_at = post.updated_at = created_at
+                dated.append(post)
+        if dated:
+            Post.objects.bulk_update(dated, ['created_at', 'updated_at'], batch_size=1000)
+
+        authored = [post for post in posts if not post.is_retweet]
+        hashtags, trending = _link_hashtags(authored)
+        mentions = _link_mentions(authored)
+
+        retweets = [post for post in posts if post.is_retweet]
+        Retweet.objects.bulk_create(
+            [Retweet(user_id=post.user_id, post_id=post.original_post_id) for post in retweets],
+            ignore_conflicts=True, batch_size=1000
+        )
+        # Rebuilt from the database on their next read, once the rows are visible
+        retweeter_ids = {post.user_id for post in retweets}
+        if retweeter_ids:
+            transaction.on_commit(lambda: engagement.retweets.invalidate(retweeter_ids))
+
+        deltas = {}
+        for post in posts:
+            if post.is_reply:
+                deltas.setdefault(post.parent_id, Counter())['replies_count'] += 1
+            if post.is_retweet:
+                deltas.setdefault(post.original_post_id, Counter())['retweets_count'] += 1
+        counters.apply_deltas(deltas)
+
+        from .search import index_posts
+        index_posts(posts)
+
+        author_ids = sorted({post.user_id for post in posts})
+        mentioned_ids = {mention.user_id for mention in mentions}
+
+        # (recipient ID, post, notification type), as created by PostViewSet
+        notifications = []
+        for post in posts:
+            if post.is_reply and authors[post.parent_id] != post.user_id:
+                notifications.append((authors[post.parent_id], post, 'reply'))
+            if post.is_retweet and authors[post.original_post_id] != post.user_id:
+                notifications.append((authors[post.original_post_id], post, 'retweet'))
+        posts_by_id = {post.id: post for post in posts}
+        for mention in mentions:
+            post = posts_by_id[mention.post_id]
+            if mention.user_id != post.user_id:
+                notifications.append((mention.user_id, post, 'mention'))
+
+        post_ids = [post.id for post in posts]
+        _defer_side_effects(
+            post_ids, author_ids, mentioned_ids, hashtags, trending, notifications if notify else []
+        )
+
+    refs.update(known_refs)
+    elapsed = time.perf_counter() - started
+    return {
+        'created': len(posts),
+        'refs': {
+            record['ref']: post.id for record, post in zip(records, posts)
+            if record.get('ref') is not None
+        },
+        'seconds': round(elapsed, 3),
+        'posts_per_second': round(len(posts) / elapsed, 1) if elapsed else None,
+    }
+
+
+def _invalidate_recent_posts(author_ids, mentioned_ids):
+    from .feeds import invalidate_recent_posts
+    invalidate_recent_posts(author_ids[0], mentioned_ids)
+    for author_id in author_ids[1:]:
+        invalidate_recent_posts(author_id)
+
+
+def _defer_side_effects(post_ids, author_ids, mentioned_ids, hashtags, trending, notifications):
+    from .autocomplete import count_hashtag_uses
+    from .tasks import fanout_posts
+    from .trending import record_hashtag_counts
+
+    # After commit, so a concurrent pull-feed read cannot cache the lists
+    # from before the import
+    transaction.on_commit(lambda: _invalidate_recent_posts(author_ids, mentioned_ids))
+    transaction.on_commit(lambda: fanout_posts.delay(post_ids))
+    if hashtags:
+        transaction.on_commit(lambda: count_hashtag_uses(hashtags))
+        # Recent imported posts count towards trending, by their creation hour
+        transaction.on_commit(lambda: record_hashtag_counts(trending))
+
+    if NOTIFICATIONS_ENABLED and notifications:
+        usernames = dict(User.objects.filter(
+            id__in={post.user_id for _, post, _ in notifications}
+        ).values_list('id', 'username'))
+        rows = [
+            {
+                'recipient_id': recipient_id,
+                'sender_id': post.user_id,
+                'notification_type': notification_type,
+                'object_id': post.id,
+                'text': NOTIFICATION_TEXTS[notification_type].format(username=usernames[post.user_id]),
+            }
+            for recipient_id, post, notification_type in notifications
+        ]
+        content_type_id = ContentType.objects.get_for_model(Post).id
+        transaction.on_commit(lambda: send_bulk_notifications.delay(rows, content_type_id))
@@ -0,0 +1,63 @@
+"""
+Liking and unliking.
+
+Every like path (the post's like/unlike actions and the likes endpoint)
+goes through these functions, which keep the ``Like`` rows, the user's
+engagement set, the buffered ``likes_count`` and the viewer's cached feed
+pages in step.
+"""
+from django.db import IntegrityError, transaction
+
+from . import counters, engagement
+from .feed_cache import bump_feed_versions
+from .models import Like
+
+try:
+    from notifications.services import create_notification
+    NOTIFICATIONS_ENABLED = True
+except ImportError:
+    NOTIFICATIONS_ENABLED = False
+
+
+class LikeError(Exception):
+    pass
+
+
+def like_post(user, post):
+    """Like ``post`` as ``user`` and return the Like."""
+    # Membership comes from the user's engagement set; the unique
+    # (user, post) index still settles concurrent likes
+    if engagement.likes.contains(user.id, post.id):
+        raise LikeError("You have already liked this post.")
+    try:
+        with transaction.atomic():
+            like = Like.objects.create(user=user, post=post)
+    except IntegrityError:
+        raise LikeError("You have already liked this post.")
+
+    engagement.likes.add(user.id, post.id)
+    counters.incr_counter(post.id, 'likes_count', 1)
+    # The viewer's cached feed pages show their like state
+    bump_feed_versions([user.id])
+
+    if NOTIFICATIONS_ENABLED and post.user_id != user.id:
+        create_notification(
+            recipient=post.user,
+            sender=user,
+            notification_type='like',
+            content_object=like,
+            text=f"{user.username} liked your post."
+        )
+    return like
+
+
+def unlike_post(user_id, post_id):
+    """Undo ``user_id``'s like of ``post_id``."""
+    # A single DELETE on the unique (user, post) index
+    deleted, _ = Like.objects.filter(user_id=user_id, post_id=post_id).delete()
+    if not deleted:
+        raise LikeError("You have not liked this post.")
+
+    engagement.likes.remove(user_id, post_id)
+    counters.incr_counter(post_id, 'likes_count', -1)
+    bump_feed_versions([user_id])
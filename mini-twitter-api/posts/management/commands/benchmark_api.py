@@ -0,0 +1,110 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mini_twitter.benchmarks import SCENARIO_NAMES, BenchmarkError, compare, run_benchmarks
+
+COLUMNS = (
+    f"{'scenario':<18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'queries':>8} "
+    f"{'ser ms':>8} {'bytes':>9}"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API hot paths (feed and post list, also normalized, post retrieve, search, "
+        "trending, like/unlike, follow, notifications, conversations) against the current dataset, optionally "
+        "comparing with a baseline saved by an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios', nargs='+', choices=SCENARIO_NAMES,
+            help="Scenarios to run (default: all)."
+        )
+        parser.add_argument('--iterations', type=int, default=50, help="Timed requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=5, help="Untimed requests per scenario.")
+        parser.add_argument('--user', help="Username to send requests as (default: the user following the most accounts).")
+        parser.add_argument('--query', help="Search query (default: the most used hashtag).")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="Compare with results saved by an earlier run.")
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help="Relative latency/size increase reported as a regression (default: 0.2)."
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help="Exit with an error if any scenario regressed."
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        self.stdout.write(COLUMNS)
+        try:
+            results = run_benchmarks(
+                names=options['scenarios'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                username=options['user'],
+                query=options['query'],
+                log=self.write_row,
+            )
+        except BenchmarkError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            self.report_comparison(results, baseline, options)
+
+    def write_row(self, name, result):
+        self.stdout.write(
+            f"{name:<18} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+            f"{result['requests_per_s']:>8.1f} {result['queries']:>8.1f} {result['serialize_ms']:>8.2f} "
+            f"{result['bytes']:>9}"
+        )
+
+    def report_comparison(self, results, baseline, options):
+        if baseline.get('environment', {}) != results['environment']:
+            self.stdout.write(self.style.WARNING(
+                "The baseline was recorded in a different environment or dataset: "
+                f"{baseline.get('environment')}"
+            ))
+
+        self.stdout.write(f"\nCompared with {options['baseline']}:")
+        self.stdout.write(f"{'scenario':<18} {'p50':>8} {'p95':>8} {'queries':>8} {'bytes':>8}")
+        for name, current in results['scenarios'].items():
+            previous = baseline.get('scenarios', {}).get(name)
+            if previous is None:
+                self.stdout.write(f"{name:<18} (not in baseline)")
+                continue
+            self.stdout.write(
+                f"{name:<18} {change(current['p50_ms'], previous['p50_ms']):>8} "
+                f"{change(current['p95_ms'], previous['p95_ms']):>8} "
+                f"{current['queries'] - previous['queries']:>+8.1f} "
+                f"{change(current['bytes'], previous['bytes']):>8}"
+            )
+
+        regressions = compare(results, baseline, options['threshold'])
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS("No regressions."))
+            return
+        summary = '; '.join(f"{name}: {', '.join(metrics)}" for name, metrics in regressions.items())
+        if options['fail_on_regression']:
+            raise CommandError(f"Regressions: {summary}")
+        self.stdout.write(self.style.ERROR(f"Regressions: {summary}"))
+
+
+def change(current, previous):
+    if not previous:
+        return 'n/a'
+    return f"{(current - previous) / previous:+.0%}"
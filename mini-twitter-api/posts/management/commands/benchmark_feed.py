@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from mini_twitter.pagination import KeysetPagination
+from posts.feeds import FEED_ENGINES
+
+
+def read_pages(feed, pages, page_size):
+    """Walk the first pages of a feed the way KeysetPagination does."""
+    paginator = KeysetPagination()
+    position = None
+    for _ in range(pages):
+        if hasattr(feed, 'keyset_page'):
+            page = feed.keyset_page(position, False, page_size)
+        else:
+            page = list(paginator.seek(feed, position, False)[:page_size])
+        if not page:
+            return
+        position = (page[-1].created_at, page[-1].pk)
+
+
+class Command(BaseCommand):
+    help = "Compare home feed engines by building feed pages for a sample of users."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engines', nargs='+', default=sorted(FEED_ENGINES),
+            help="Feed engines to compare (default: all)."
+        )
+        parser.add_argument(
+            '--users', nargs='+', type=int,
+            help="User IDs to benchmark. Defaults to the users following the most accounts."
+        )
+        parser.add_argument('--sample', type=int, default=10, help="Number of users to sample.")
+        parser.add_argument('--pages', type=int, default=3, help="Pages to read per user.")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per user and engine.")
+
+    def handle(self, *args, **options):
+        unknown = set(options['engines']) - set(FEED_ENGINES)
+        if unknown:
+            raise CommandError(f"Unknown feed engines: {', '.join(sorted(unknown))}")
+
+        if options['users']:
+            users = list(User.objects.filter(id__in=options['users']))
+        else:
+            users = list(
+                User.objects.annotate(following_total=Count('following'))
+                .order_by('-following_total')[:options['sample']]
+            )
+        if not users:
+            raise CommandError("No users to benchmark.")
+
+        page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+        self.stdout.write(
+            f"Benchmarking {len(users)} users, {options['pages']} pages of {page_size}, "
+            f"{options['repeat']} runs each"
+        )
+        self.stdout.write(f"{'engine':<10} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'queries':>8}")
+
+        for name in options['engines']:
+            engine = FEED_ENGINES[name]
+            timings, queries = [], []
+            for user in users:
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as ctx:
+                        started = time.perf_counter()
+                        read_pages(engine(user), options['pages'], page_size)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    queries.append(len(ctx.captured_queries))
+
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f"{name:<10} {statistics.median(timings):>9.2f} {p95:>9.2f} "
+                f"{timings[-1]:>9.2f} {statistics.mean(queries):>8.1f}"
+            )
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.dataset import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic social graph for load tests and benchmarks: power-law "
+        "followers, reply/retweet chains, hashtags, mentions and likes. The same seed "
+        "and options produce the same dataset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Number of users.")
+        parser.add_argument('--posts', type=int, default=10000, help="Number of posts (including replies and retweets).")
+        parser.add_argument('--avg-following', type=float, default=50, help="Mean number of accounts each user follows.")
+        parser.add_argument('--reply-ratio', type=float, default=0.2, help="Share of posts that are replies.")
+        parser.add_argument('--retweet-ratio', type=float, default=0.1, help="Share of posts that are retweets.")
+        parser.add_argument('--avg-likes', type=float, default=5, help="Mean likes per post.")
+        parser.add_argument('--mention-ratio', type=float, default=0.1, help="Share of posts mentioning a popular user.")
+        parser.add_argument('--hashtag-ratio', type=float, default=0.3, help="Mean hashtags per post.")
+        parser.add_argument('--hashtags', type=int, default=500, help="Size of the hashtag vocabulary.")
+        parser.add_argument(
+            '--conversations', type=int,
+            help="Number of direct message conversations (default: one per user)."
+        )
+        parser.add_argument('--avg-messages', type=float, default=10, help="Mean messages per conversation.")
+        parser.add_argument('--days', type=float, default=30, help="Time span the posts are spread over, ending now.")
+        parser.add_argument(
+            '--popularity-exponent', type=float, default=1.0,
+            help="Zipf exponent of the follower distribution (higher is more skewed)."
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+        parser.add_argument('--prefix', default='user_', help="Username prefix of the generated users.")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Rows written per transaction.")
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help="Use bulk_create on PostgreSQL too, instead of COPY."
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['posts'] < 0:
+            raise CommandError("--users must be positive and --posts non-negative.")
+        if options['reply_ratio'] + options['retweet_ratio'] > 1:
+            raise CommandError("--reply-ratio and --retweet-ratio must add up to at most 1.")
+
+        generator = DatasetGenerator(
+            users=options['users'],
+            posts=options['posts'],
+            avg_following=options['avg_following'],
+            reply_ratio=options['reply_ratio'],
+            retweet_ratio=options['retweet_ratio'],
+            avg_likes=options['avg_likes'],
+            mention_ratio=options['mention_ratio'],
+            hashtag_ratio=options['hashtag_ratio'],
+            hashtags=options['hashtags'],
+            conversations=options['conversations'],
+            avg_messages=options['avg_messages'],
+            days=options['days'],
+            popularity_exponent=options['popularity_exponent'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            password=options['password'],
+            chunk_size=options['chunk_size'],
+            use_copy=not options['no_copy'],
+            log=self.stdout.write,
+        )
+        try:
+            report = generator.generate()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {report['users']} users, {report['follows']} follows, "
+            f"{report['posts']} posts ({report['replies']} replies, {report['retweets']} retweets), "
+            f"{report['likes']} likes, {report['mentions']} mentions, "
+            f"{report['notifications']} notifications, {report['conversations']} conversations "
+            f"with {report['messages']} messages in {report['seconds']}s"
+        ))
@@ -0,0 +1,81 @@
+import json
+import sys
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.ingest import IngestError, ingest_posts
+
+
+def read_records(stream, file_format):
+    if file_format == 'json':
+        data = json.load(stream)
+        yield from data.get('posts', []) if isinstance(data, dict) else data
+        return
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            raise CommandError(f"Line {line_number}: {exc}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import posts from a JSON or NDJSON file (see posts.ingest for the record "
+        "format). Records referencing others by ref must come after them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument(
+            '--format', choices=['json', 'ndjson'],
+            help="Input format (default: from the file extension, NDJSON for stdin)."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.POST_INGEST_BATCH_SIZE,
+            help="Posts inserted per transaction."
+        )
+        parser.add_argument(
+            '--no-notify', action='store_true',
+            help="Do not create reply/retweet/mention notifications."
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('json' if path.endswith('.json') else 'ndjson')
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+
+        refs = {}
+        created = 0
+        started = time.perf_counter()
+        try:
+            records = read_records(stream, file_format)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                try:
+                    report = ingest_posts(batch, refs=refs, notify=not options['no_notify'])
+                except IngestError as exc:
+                    for error in exc.errors[:20]:
+                        error = dict(error, index=created + error['index'])
+                        self.stderr.write(f"Record {error['index']}: {error['error']}")
+                    raise CommandError(f"Import stopped after {created} posts: {exc}")
+                created += report['created']
+                self.stdout.write(
+                    f"{created} posts imported ({report['posts_per_second']} posts/sec in this batch)"
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        rate = created / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created} posts in {elapsed:.2f}s ({rate:.1f} posts/sec)"
+        ))
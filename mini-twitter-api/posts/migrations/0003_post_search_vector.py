@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:05
+
+from django.conf import settings
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX posts_post_search_vector_gin ON posts_post USING GIN (search_vector)'
+        )
+        schema_editor.execute(
+            'UPDATE posts_post SET search_vector = to_tsvector(%s::regconfig, content)',
+            [settings.POST_SEARCH_CONFIG]
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE posts_post_fts USING fts5(content, tokenize = 'porter unicode61')"
+        )
+        schema_editor.execute(
+            "INSERT INTO posts_post_fts (rowid, content) SELECT id, content FROM posts_post WHERE content != ''"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS posts_post_search_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_hashtag_post_count_post_is_reply_post_is_retweet_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
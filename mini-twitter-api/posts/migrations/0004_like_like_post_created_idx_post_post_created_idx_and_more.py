@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_post_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='like_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['created_at', 'id'], name='post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='post_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['parent', 'created_at', 'id'], name='post_parent_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['original_post', 'user', 'is_retweet'], name='post_retweet_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='retweet',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='retweet_post_created_idx'),
+        ),
+    ]
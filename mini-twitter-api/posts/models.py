@@ -1,11 +1,74 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from users.models import Follow
+from mini_twitter.images import track_uploads
 import re
 
+HASHTAG_PATTERN = r'#(\w+)'
+MENTION_PATTERN = r'@(\w+)'
+
+class PostQuerySet(models.QuerySet):
+    def for_serialization(self):
+        """
+        Load everything PostSerializer renders in a fixed number of queries:
+        authors and their profiles, retweeted and parent posts with their
+        authors, and the hashtags and mentions of all of them.
+        """
+        return self.select_related(
+            'user__profile',
+            'original_post__user__profile',
+            'parent__user__profile',
+        ).defer(
+            'original_post__search_vector',
+            'parent__search_vector',
+        ).prefetch_related(
+            *entity_prefetches(''),
+            *entity_prefetches('original_post__'),
+            *entity_prefetches('parent__'),
+        )
+
+    def for_rendering(self):
+        """
+        Load only what the post render cache needs to find and complete
+        cached snapshots (see posts.render_cache): versions, counters and
+        the IDs of retweeted and parent posts.
+        """
+        return self.select_related('user__profile').only(
+            'id', 'created_at', 'updated_at',
+            'likes_count', 'retweets_count', 'replies_count',
+            'is_retweet', 'original_post', 'is_reply', 'parent',
+            'user__profile__updated_at',
+        )
+
+class PostManager(models.Manager.from_queryset(PostQuerySet)):
+    def get_queryset(self):
+        # The full-text search vector is only used inside the database
+        return super().get_queryset().defer('search_vector')
+
+def entity_prefetches(prefix):
+    return [
+        models.Prefetch(
+            f'{prefix}hashtags',
+            queryset=PostHashtag.objects.select_related('hashtag')
+        ),
+        models.Prefetch(
+            f'{prefix}mentions',
+            queryset=Mention.objects.select_related('user__profile')
+        ),
+    ]
+
 class Post(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     content = models.TextField()
     image = models.ImageField(upload_to='posts/', null=True, blank=True)
+    # Dimensions and resized/WebP variants, recorded once the image has been
+    # processed (see mini_twitter.images)
+    image_variants = models.JSONField(null=True, blank=True, editable=False)
     likes_count = models.PositiveIntegerField(default=0)
     retweets_count = models.PositiveIntegerField(default=0)
     replies_count = models.PositiveIntegerField(default=0)
@@ -21,49 +84,139 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Full-text search (PostgreSQL); see posts.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    objects = PostManager()
+    
     class Meta:
         ordering = ['-created_at']
+        # Keyset pagination walks (created_at, id), so the sort columns end every index
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='post_created_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='post_user_created_idx'),
+            models.Index(fields=['parent', 'created_at', 'id'], name='post_parent_created_idx'),
+            models.Index(fields=['original_post', 'user', 'is_retweet'], name='post_retweet_lookup_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}'s post: {self.content[:50]}"
 
-    def extract_and_save_hashtags(self):
-        # Extract hashtags using regex
-        hashtag_pattern = r'#(\w+)'
-        hashtags = re.findall(hashtag_pattern, self.content)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored content so save() can tell whether it changed
+        instance._loaded_content = instance.__dict__.get('content')
+        return instance
+
+    def content_changed(self):
+        return self.pk is None or self.content != getattr(self, '_loaded_content', None)
+
+    def extract_and_save_hashtags(self, existing=True):
+        """
+        Sync the post's hashtags with its content, touching only the tags that
+        were added or removed. Returns the IDs of the hashtags that changed.
+        """
+        names = {name.lower() for name in re.findall(HASHTAG_PATTERN, self.content)}
+        current = dict(self.hashtags.values_list('hashtag__name', 'hashtag_id')) if existing else {}
+        
+        removed_ids = [hashtag_id for name, hashtag_id in current.items() if name not in names]
+        if removed_ids:
+            PostHashtag.objects.filter(post=self, hashtag_id__in=removed_ids).delete()
+            Hashtag.objects.filter(id__in=removed_ids).update(
+                post_count=Greatest(F('post_count') - 1, 0)
+            )
+        
+        added = names - current.keys()
+        added_ids = []
+        if added:
+            Hashtag.objects.bulk_create(
+                [Hashtag(name=name) for name in added], ignore_conflicts=True
+            )
+            added_tags = list(Hashtag.objects.filter(name__in=added).values_list('id', 'name'))
+            added_ids = [hashtag_id for hashtag_id, name in added_tags]
+            PostHashtag.objects.bulk_create(
+                [PostHashtag(post=self, hashtag_id=hashtag_id) for hashtag_id in added_ids],
+                ignore_conflicts=True
+            )
+            Hashtag.objects.filter(id__in=added_ids).update(post_count=F('post_count') + 1)
+            
+            from .autocomplete import count_hashtag_uses
+            transaction.on_commit(lambda: count_hashtag_uses(added_tags))
         
-        # Clear existing hashtags
-        self.hashtags.all().delete()
+        return removed_ids + added_ids
+    
+    def extract_and_save_mentions(self, existing=True):
+        """
+        Sync the post's mentions with its content, touching only the users that
+        were added or removed. Mentions of non-existent users are skipped.
+        Returns the IDs of the users whose mention changed.
+        """
+        usernames = set(re.findall(MENTION_PATTERN, self.content))
+        current = dict(self.mentions.values_list('user__username', 'user_id')) if existing else {}
         
-        # Create new hashtags
-        for tag_name in hashtags:
-            tag, created = Hashtag.objects.get_or_create(name=tag_name.lower())
-            PostHashtag.objects.create(post=self, hashtag=tag)
-    
-    def extract_and_save_mentions(self):
-        # Extract mentions using regex
-        mention_pattern = r'@(\w+)'
-        mentions = re.findall(mention_pattern, self.content)
+        removed_ids = [user_id for username, user_id in current.items() if username not in usernames]
+        if removed_ids:
+            Mention.objects.filter(post=self, user_id__in=removed_ids).delete()
         
-        # Clear existing mentions
-        self.mentions.all().delete()
+        added = usernames - current.keys()
+        added_ids = []
+        if added:
+            added_ids = list(User.objects.filter(username__in=added).values_list('id', flat=True))
+            Mention.objects.bulk_create(
+                [Mention(post=self, user_id=user_id) for user_id in added_ids],
+                ignore_conflicts=True
+            )
         
-        # Create new mentions
-        for username in mentions:
-            try:
-                user = User.objects.get(username=username)
-                Mention.objects.create(post=self, user=user)
-            except User.DoesNotExist:
-                # Skip mentions of non-existent users
-                pass
+        return removed_ids + added_ids
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
+        update_fields = kwargs.get('update_fields')
+        content_changed = self.content_changed() and (
+            update_fields is None or 'content' in update_fields
+        )
+        uploads = track_uploads(self, ['image'])
         super().save(*args, **kwargs)
         
-        # Extract hashtags and mentions after saving
-        self.extract_and_save_hashtags()
-        self.extract_and_save_mentions()
+        # Process a new image off the request thread
+        if uploads:
+            from .tasks import process_post_image
+            post_id, name, stale = self.pk, self.image.name, uploads[0][1]
+            transaction.on_commit(lambda: process_post_image.delay(post_id, name, stale))
+        
+        # Extract hashtags and mentions only when the content changed.
+        # Retweets have no content of their own, so they skip extraction.
+        if content_changed and not self.is_retweet:
+            hashtag_ids = self.extract_and_save_hashtags(existing=not is_new)
+            mentioned_ids = self.extract_and_save_mentions(existing=not is_new)
+            self._loaded_content = self.content
+            
+            from .search import index_post
+            index_post(self)
+            
+            # Drop the cached recent-post lists read by the pull feed engine,
+            # once committed so a concurrent read cannot cache the old lists
+            from .feeds import invalidate_recent_posts
+            user_id = self.user_id
+            transaction.on_commit(lambda: invalidate_recent_posts(user_id, mentioned_ids))
+            
+            # Count the hashtags of new posts towards trending
+            if is_new and hashtag_ids:
+                from .trending import record_hashtags
+                transaction.on_commit(lambda: record_hashtags(hashtag_ids))
+        elif is_new:
+            # A new retweet still changes its author's recent posts
+            from .feeds import invalidate_recent_posts
+            user_id = self.user_id
+            transaction.on_commit(lambda: invalidate_recent_posts(user_id))
+        
+        # Push new posts to home timelines once the transaction commits,
+        # so the worker sees the post and its mentions
+        if is_new:
+            from .tasks import fanout_post
+            post_id = self.pk
+            transaction.on_commit(lambda: fanout_post.delay(post_id))
 
 class Like(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes')
@@ -72,6 +225,9 @@ class Like(models.Model):
     
     class Meta:
         unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='like_post_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} likes {self.post.id}"
@@ -83,6 +239,9 @@ class Retweet(models.Model):
     
     class Meta:
         unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='retweet_post_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} retweeted {self.post.id}"
@@ -111,13 +270,13 @@ class PostHashtag(models.Model):
         
         # Update hashtag post count
         if is_new:
-            self.hashtag.post_count += 1
-            self.hashtag.save()
+            Hashtag.objects.filter(pk=self.hashtag_id).update(post_count=F('post_count') + 1)
     
     def delete(self, *args, **kwargs):
         # Update hashtag post count
-        self.hashtag.post_count -= 1
-        self.hashtag.save()
+        Hashtag.objects.filter(pk=self.hashtag_id).update(
+            post_count=Greatest(F('post_count') - 1, 0)
+        )
         super().delete(*args, **kwargs)
 
 class Mention(models.Model):
@@ -129,4 +288,49 @@ class Mention(models.Model):
         unique_together = ('post', 'user')
     
     def __str__(self):
-        return f"{self.post.id} mentions {self.user.username}"
\ No newline at end of file
+        return f"{self.post.id} mentions {self.user.username}"
+
+@receiver(post_delete, sender=Post)
+def retract_post_from_timelines(sender, instance, **kwargs):
+    from .tasks import retract_post
+    from .feeds import invalidate_recent_posts
+    post_id, author_id = instance.pk, instance.user_id
+    transaction.on_commit(lambda: invalidate_recent_posts(author_id))
+    transaction.on_commit(lambda: retract_post.delay(post_id, author_id))
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_search_index(sender, instance, **kwargs):
+    from .search import remove_post
+    remove_post(instance.pk)
+
+@receiver(post_save, sender=User)
+def add_user_to_autocomplete(sender, instance, created, **kwargs):
+    if created:
+        from .autocomplete import index_user
+        user_id, username = instance.id, instance.username
+        transaction.on_commit(lambda: index_user(user_id, username))
+
+@receiver(post_delete, sender=User)
+def remove_user_from_autocomplete(sender, instance, **kwargs):
+    from .autocomplete import remove_user
+    user_id = instance.id
+    transaction.on_commit(lambda: remove_user(user_id))
+
+@receiver(post_delete, sender=Hashtag)
+def remove_hashtag_from_autocomplete(sender, instance, **kwargs):
+    from .autocomplete import remove_hashtag
+    hashtag_id = instance.id
+    transaction.on_commit(lambda: remove_hashtag(hashtag_id))
+
+@receiver(post_save, sender=Follow)
+def merge_author_into_timeline(sender, instance, created, **kwargs):
+    if created:
+        from .tasks import merge_followed_author
+        follower_id, following_id = instance.follower_id, instance.following_id
+        transaction.on_commit(lambda: merge_followed_author.delay(follower_id, following_id))
+
+@receiver(post_delete, sender=Follow)
+def purge_author_from_timeline(sender, instance, **kwargs):
+    from .tasks import purge_unfollowed_author
+    follower_id, following_id = instance.follower_id, instance.following_id
+    transaction.on_commit(lambda: purge_unfollowed_author.delay(follower_id, following_id))
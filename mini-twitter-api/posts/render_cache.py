@@ -0,0 +1,222 @@
+"""
+Rendered post snapshots, shared by all viewers.
+
+Lists of posts (feeds, post lists, replies, hashtag and search pages) are
+not serialized post by post. Each post's PostSerializer output is cached
+as a snapshot under a key made of the post ID and its version: the post's
+``updated_at`` and its author's profile ``updated_at``. Editing a post, or
+changing the author's profile (which saving the user also touches), moves
+either timestamp and thereby retires every snapshot of the post. Deleted
+posts are never looked up again and their snapshots simply expire.
+
+Snapshots hold neither viewer state nor the retweeted/parent post. A page
+is assembled from rows loaded with ``Post.objects.for_rendering()``:
+
+1. the retweeted and parent posts are loaded the same way, level by level;
+2. one ``cache.get_many`` fetches every snapshot, and misses are rendered
+   in one batch (three queries) and written back with ``set_many``;
+3. live counters (the row's counts plus deltas buffered in Redis) and the
+   viewer's like/retweet state are overlaid, and nested posts are attached.
+
+Snapshots always hold every field; sparse fieldsets (``?fields=`` and
+``?expand=``, see mini_twitter.fieldsets) are applied while assembling, and
+only expanded nested posts are loaded. ``render_entities`` assembles the
+same page normalized, each post and user once.
+
+Hashtag post counts and mentioned users' details inside a snapshot may lag
+by up to POST_RENDER_CACHE_TIMEOUT.
+"""
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import engagement
+from .counters import COUNTER_FIELDS, pending_counters
+from .models import Post, entity_prefetches
+
+# Bump when PostSerializer's output changes, so old snapshots are not served
+RENDER_SCHEMA = 2
+RENDER_KEY = 'post_render:{schema}:{post_id}:{version}'
+
+NESTED_FIELDS = (
+    # (flag, reference, rendered field)
+    ('is_retweet', 'original_post_id', 'original_post_data'),
+    ('is_reply', 'parent_id', 'parent_data'),
+)
+
+
+def render_key(post):
+    profile = getattr(post.user, 'profile', None)
+    author_version = profile.updated_at.timestamp() if profile is not None else 0
+    return RENDER_KEY.format(
+        schema=RENDER_SCHEMA,
+        post_id=post.id,
+        version=f'{post.updated_at.timestamp():.6f}-{author_version:.6f}',
+    )
+
+
+def references(post, fieldset=None):
+    """
+    (rendered field, post ID, fieldset) of the posts embedded in ``post``
+    (its retweeted and parent post), unless the fieldset only references them.
+    """
+    return [
+        (field, getattr(post, reference), fieldset.embedded(field) if fieldset is not None else None)
+        for flag, reference, field in NESTED_FIELDS
+        if getattr(post, flag) and getattr(post, reference) is not None
+        and (fieldset is None or fieldset.expands(field))
+    ]
+
+
+def load_related(posts, fieldset=None):
+    """Return {post_id: post} for ``posts`` and, recursively, the posts embedded in them."""
+    rows = {post.id: post for post in posts}
+    level = [(post, fieldset) for post in posts]
+    while level:
+        embedded = [
+            (post_id, child)
+            for post, post_fieldset in level
+            for _, post_id, child in references(post, post_fieldset)
+        ]
+        missing = {post_id for post_id, _ in embedded} - rows.keys()
+        if missing:
+            rows.update(Post.objects.for_rendering().in_bulk(missing))
+        level = [(rows[post_id], child) for post_id, child in embedded if post_id in rows]
+    return rows
+
+
+def render_snapshots(post_ids, context):
+    """Serialize posts without viewer state or nested posts, in three queries."""
+    from .serializers import PostSerializer
+
+    posts = Post.objects.select_related('user__profile').prefetch_related(
+        *entity_prefetches('')
+    ).in_bulk(post_ids)
+    snapshot_context = {'request': context.get('request'), 'render_snapshot': True, 'fieldset': None}
+    return {
+        post_id: dict(PostSerializer(post, context=snapshot_context).data)
+        for post_id, post in posts.items()
+    }
+
+
+def get_snapshots(rows, context):
+    keys = {render_key(post): post_id for post_id, post in rows.items()}
+    snapshots = {keys[key]: data for key, data in cache.get_many(list(keys)).items()}
+
+    missing = [post_id for post_id in rows if post_id not in snapshots]
+    if missing:
+        rendered = render_snapshots(missing, context)
+        cache.set_many(
+            {render_key(rows[post_id]): data for post_id, data in rendered.items()},
+            settings.POST_RENDER_CACHE_TIMEOUT
+        )
+        snapshots.update(rendered)
+    return snapshots
+
+
+def viewer_state(rows, context, fieldset=None):
+    """
+    Like/retweet state and pending counter deltas for every row, reusing
+    what the view already resolved (see PostViewSet.get_serializer).
+    """
+    covered = context.get('viewer_post_ids', set())
+    liked = set(context.get('liked_post_ids', ()))
+    retweeted = set(context.get('retweeted_post_ids', ()))
+    pending = dict(context.get('pending_counters', {}))
+
+    uncovered = [post_id for post_id in rows if post_id not in covered]
+    if uncovered:
+        request = context.get('request')
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            if fieldset is None or fieldset.requests('is_liked'):
+                liked |= engagement.likes.filter(user.id, uncovered)
+            if fieldset is None or fieldset.requests('is_retweeted'):
+                retweeted |= engagement.retweets.filter(user.id, uncovered)
+        pending.update(pending_counters(uncovered))
+    return liked, retweeted, pending
+
+
+def page_renderer(posts, context, fieldset=None):
+    """
+    Load and fetch everything a page of ``posts`` renders. Returns the rows
+    by ID and a function rendering one post with live counters and viewer
+    state, its nested posts as {'id': ...} references (None once deleted).
+    """
+    rows = load_related(posts, fieldset)
+    snapshots = get_snapshots(rows, context)
+    liked, retweeted, pending = viewer_state(rows, context, fieldset)
+
+    def render(post_id):
+        snapshot = snapshots.get(post_id)
+        if snapshot is None:
+            return None
+        post = rows[post_id]
+        data = dict(snapshot)
+        deltas = pending.get(post_id, {})
+        for field in COUNTER_FIELDS:
+            data[field] = max(getattr(post, field) + deltas.get(field, 0), 0)
+        data['is_liked'] = post_id in liked
+        data['is_retweeted'] = post_id in retweeted
+        for flag, reference, field in NESTED_FIELDS:
+            if getattr(post, flag) and getattr(post, reference) is not None:
+                data[field] = {'id': getattr(post, reference)}
+        return data
+
+    return rows, render
+
+
+def render_posts(posts, context, fieldset=None):
+    """Render posts as PostSerializer(posts, many=True) would, from cached snapshots."""
+    rows, render = page_renderer(posts, context, fieldset)
+
+    def assemble(post_id, fieldset):
+        data = render(post_id)
+        if data is None:
+            return None
+        for field, nested_id, child in references(rows[post_id], fieldset):
+            data[field] = assemble(nested_id, child)
+        return fieldset.trim(data) if fieldset is not None else data
+
+    # Posts deleted since the page was listed are left out
+    rendered = (assemble(post.id, fieldset) for post in posts)
+    return [data for data in rendered if data is not None]
+
+
+def render_entities(posts, context, fieldset=None):
+    """
+    Render posts normalized: {'results': [post IDs], 'posts': {ID: post},
+    'users': {ID: user}}. Every post and user appears once; posts refer to
+    their author and mentioned users by ID, and to their retweeted and
+    parent post through the ``original_post`` and ``parent`` IDs (the
+    ``*_data`` fields are left out). Nested posts are included as
+    PostSerializer would embed them.
+    """
+    rows, render = page_renderer(posts, context, fieldset)
+    entities, users = {}, {}
+    pending = deque((post.id, fieldset) for post in posts)
+    while pending:
+        post_id, post_fieldset = pending.popleft()
+        if str(post_id) in entities:
+            continue
+        data = render(post_id)
+        if data is None:
+            continue
+        for _, _, field in NESTED_FIELDS:
+            data.pop(field, None)
+        user = data.get('user')
+        if isinstance(user, dict):
+            data['user'] = user['id']
+            if post_fieldset is None or post_fieldset.includes('user'):
+                users[str(user['id'])] = post_fieldset.child('user').trim(user) if post_fieldset else user
+        if 'mentions' in data:
+            for mention in data['mentions']:
+                users.setdefault(str(mention['user']['id']), mention['user'])
+            data['mentions'] = [{**mention, 'user': mention['user']['id']} for mention in data['mentions']]
+        entities[str(post_id)] = post_fieldset.trim(data) if post_fieldset is not None else data
+        pending.extend((nested_id, child) for _, nested_id, child in references(rows[post_id], post_fieldset))
+
+    # Posts deleted since the page was listed are left out
+    results = [post.id for post in posts if str(post.id) in entities]
+    return {'results': results, 'posts': entities, 'users': users}
@@ -0,0 +1,78 @@
+"""
+Retweeting and unretweeting.
+
+A retweet is stored twice: a ``Retweet`` row (unique per user and post,
+which is what "already retweeted" checks) and a contentless ``Post`` with
+``is_retweet`` set, which is what timelines show. Both are written or
+removed in one transaction, together with the notification and the
+original post's counter change. Retweets have no content of their own, so
+``Post.save`` skips hashtag/mention extraction and search indexing for them.
+"""
+from django.db import IntegrityError, transaction
+
+from . import counters, engagement
+from .feed_cache import bump_feed_versions
+from .models import Post, Retweet
+
+try:
+    from notifications.services import create_notification
+    NOTIFICATIONS_ENABLED = True
+except ImportError:
+    NOTIFICATIONS_ENABLED = False
+
+
+class RetweetError(Exception):
+    pass
+
+
+def create_retweet(user, post):
+    """Retweet ``post`` as ``user`` and return the retweet post."""
+    with transaction.atomic():
+        # The unique (user, post) index rejects duplicates, also under
+        # concurrent requests, without a separate existence check
+        try:
+            with transaction.atomic():
+                Retweet.objects.create(user=user, post=post)
+        except IntegrityError:
+            raise RetweetError("You have already retweeted this post.")
+
+        retweet_post = Post.objects.create(
+            user=user,
+            content="",
+            is_retweet=True,
+            original_post=post
+        )
+
+        if NOTIFICATIONS_ENABLED and post.user_id != user.id:
+            create_notification(
+                recipient=post.user,
+                sender=user,
+                notification_type='retweet',
+                content_object=retweet_post,
+                text=f"{user.username} retweeted your post."
+            )
+
+        # Last, as a buffered counter change is not rolled back with the transaction
+        counters.incr_counter(post.id, 'retweets_count', 1)
+
+    engagement.retweets.add(user.id, post.id)
+    # The viewer's cached feed pages show their retweet state
+    bump_feed_versions([user.id])
+    return retweet_post
+
+
+def delete_retweet(user_id, post_id):
+    """Undo ``user_id``'s retweet of ``post_id``, removing the Retweet row and the retweet post."""
+    with transaction.atomic():
+        # A single DELETE on the unique (user, post) index, which also
+        # tells whether there was a retweet to undo
+        deleted, _ = Retweet.objects.filter(user_id=user_id, post_id=post_id).delete()
+        if not deleted:
+            raise RetweetError("You have not retweeted this post.")
+
+        Post.objects.filter(original_post_id=post_id, user_id=user_id, is_retweet=True).delete()
+
+        counters.incr_counter(post_id, 'retweets_count', -1)
+
+    engagement.retweets.remove(user_id, post_id)
+    bump_feed_versions([user_id])
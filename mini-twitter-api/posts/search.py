@@ -0,0 +1,172 @@
+"""
+Ranked full-text search over post content.
+
+On PostgreSQL every post carries a ``search_vector`` tsvector (GIN indexed)
+ranked with ts_rank. On SQLite the content is mirrored into an FTS5 table
+ranked with bm25. Both are kept up to date incrementally when a post is
+created, edited or deleted, and both return posts annotated with a
+``search_rank`` (higher is better) for ``RankedKeysetPagination``.
+
+Other databases fall back to unranked substring matching.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .timeline import hydrate
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)
+
+
+class PostgresSearchBackend:
+    def _query(self, query):
+        from django.contrib.postgres.search import SearchQuery
+        return SearchQuery(query, config=settings.POST_SEARCH_CONFIG, search_type='websearch')
+
+    def index(self, posts):
+        from django.contrib.postgres.search import SearchVector
+        Post.objects.filter(pk__in=[post.pk for post in posts]).update(
+            search_vector=SearchVector('content', config=settings.POST_SEARCH_CONFIG)
+        )
+
+    def remove(self, post_id):
+        # The vector is stored on the post row itself
+        pass
+
+    def filter(self, queryset, query):
+        return queryset.filter(search_vector=self._query(query))
+
+    def ranked(self, query):
+        from django.contrib.postgres.search import SearchRank
+        search_query = self._query(query)
+        # ts_rank returns real (float4), which does not survive the round trip
+        # through a float cursor; as double precision the keyset predicates
+        # compare equal to the value the cursor stores
+        return Post.objects.for_rendering().filter(search_vector=search_query).annotate(
+            search_rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+        )
+
+
+class SQLiteSearchBackend:
+    def _match(self, query):
+        # Quote every term so user input is never parsed as FTS5 syntax
+        return ' '.join(f'"{term}"' for term in search_terms(query))
+
+    def index(self, posts):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[post.pk] for post in posts]
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, content) VALUES (%s, %s)',
+                [[post.pk, post.content] for post in posts if post.content]
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+    def filter(self, queryset, query):
+        match = self._match(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]
+        ))
+
+    def ranked(self, query):
+        return FTSResults(self._match(query))
+
+
+class FTSResults:
+    """Keyset-paginated FTS5 matches, best bm25 score first."""
+
+    def __init__(self, match):
+        self.match = match
+
+    def keyset_page(self, position, reverse, limit):
+        if not self.match:
+            return []
+        params = [self.match]
+        where = ''
+        if position is not None:
+            rank, pk = position
+            op = '>' if reverse else '<'
+            where = f'WHERE score {op} %s OR (score = %s AND id {op} %s)'
+            params += [rank, rank, pk]
+        direction = 'ASC' if reverse else 'DESC'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, score FROM ('
+                f'SELECT rowid AS id, -bm25({FTS_TABLE}) AS score '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+                f') {where} ORDER BY score {direction}, id {direction} LIMIT %s',
+                params + [limit]
+            )
+            scores = dict(cursor.fetchall())
+
+        posts = hydrate(list(scores))
+        for post in posts:
+            post.search_rank = scores[post.id]
+        return posts
+
+
+class SubstringSearchBackend:
+    def index(self, posts):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def filter(self, queryset, query):
+        condition = Q()
+        for term in search_terms(query):
+            condition &= Q(content__icontains=term)
+        return queryset.filter(condition) if condition else queryset.none()
+
+    def ranked(self, query):
+        return self.filter(Post.objects.for_rendering(), query).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend():
+    return SEARCH_BACKENDS.get(connection.vendor, SubstringSearchBackend)()
+
+
+def index_post(post):
+    get_search_backend().index([post])
+
+
+def index_posts(posts):
+    """Index a batch of new or edited posts (e.g. from a bulk import)."""
+    get_search_backend().index(posts)
+
+
+def remove_post(post_id):
+    get_search_backend().remove(post_id)
+
+
+def search_posts(query):
+    """Posts matching ``query``, to be paginated with ``RankedKeysetPagination``."""
+    return get_search_backend().ranked(query)
+
+
+def filter_posts(queryset, query):
+    """Restrict a post queryset to posts matching ``query``, keeping its ordering."""
+    return get_search_backend().filter(queryset, query)
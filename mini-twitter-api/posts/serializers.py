@@ -1,4 +1,10 @@
+from django.db import models
 from rest_framework import serializers
+from rest_framework.utils.serializer_helpers import ReturnDict
+from mini_twitter.fieldsets import SparseFieldsetMixin, get_fieldset
+from mini_twitter.images import variant_urls
+from uploads.serializers import UploadField, UploadReferenceMixin
+from . import engagement
 from .models import Post, Like, Hashtag, PostHashtag, Retweet, Mention
 from users.serializers import UserSerializer
 
@@ -14,19 +20,91 @@ class MentionSerializer(serializers.ModelSerializer):
         model = Mention
         fields = ('id', 'user')
 
-class PostSerializer(serializers.ModelSerializer):
+def _related_posts(post):
+    """Yield the retweeted and parent posts that are already loaded on a post."""
+    for field_name in ('original_post', 'parent'):
+        field = Post._meta.get_field(field_name)
+        if field.is_cached(post) and getattr(post, field_name) is not None:
+            yield getattr(post, field_name)
+
+def collect_post_ids(posts):
+    """Return the IDs of the given posts and of their nested retweeted/parent posts."""
+    post_ids = set()
+    pending = list(posts)
+    while pending:
+        post = pending.pop()
+        if post.id in post_ids:
+            continue
+        post_ids.add(post.id)
+        for post_id in (post.original_post_id, post.parent_id):
+            if post_id is not None:
+                post_ids.add(post_id)
+        pending.extend(_related_posts(post))
+    return post_ids
+
+def resolve_viewer_state(user, posts, fieldset=None):
+    """
+    Resolve which of the given posts (and their nested retweeted/parent posts)
+    the user has liked and retweeted, from the engagement sets (one query each
+    without Redis). The result is meant to be merged into the PostSerializer
+    context. States the fieldset leaves out are not looked up.
+    """
+    post_ids = collect_post_ids(posts)
+    state = {
+        'viewer_post_ids': post_ids,
+        'liked_post_ids': set(),
+        'retweeted_post_ids': set(),
+    }
+    if not post_ids or user is None or not user.is_authenticated:
+        return state
+    
+    if fieldset is None or fieldset.requests('is_liked'):
+        state['liked_post_ids'] = engagement.likes.filter(user.id, post_ids)
+    if fieldset is None or fieldset.requests('is_retweeted'):
+        state['retweeted_post_ids'] = engagement.retweets.filter(user.id, post_ids)
+    return state
+
+class PostListSerializer(serializers.ListSerializer):
+    """
+    Render lists of posts from shared, cached snapshots (see posts.render_cache),
+    or normalized into ordered IDs plus posts and users by ID with ?entities=1.
+    """
+    
+    @property
+    def entities(self):
+        if 'entities' in self.context:
+            return self.context['entities']
+        request = self.context.get('request')
+        return getattr(request, 'query_params', {}).get('entities') in ('1', 'true')
+    
+    def to_representation(self, data):
+        from .render_cache import render_entities, render_posts
+        posts = data.all() if isinstance(data, models.Manager) else data
+        render = render_entities if self.entities else render_posts
+        return render(list(posts), self.context, get_fieldset(self.child))
+    
+    @property
+    def data(self):
+        if not self.entities:
+            return super().data
+        # Skip ListSerializer.data, which would turn the normalized dict into a list of its keys
+        return ReturnDict(serializers.BaseSerializer.data.fget(self), serializer=self)
+
+class PostSerializer(UploadReferenceMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    image_upload = UploadField()
     is_liked = serializers.SerializerMethodField()
     is_retweeted = serializers.SerializerMethodField()
     hashtags = serializers.SerializerMethodField()
     mentions = serializers.SerializerMethodField()
     original_post_data = serializers.SerializerMethodField()
     parent_data = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
         fields = (
-            'id', 'user', 'content', 'image', 'likes_count', 'retweets_count', 
+            'id', 'user', 'content', 'image', 'image_upload', 'image_variants', 'likes_count', 'retweets_count', 
             'replies_count', 'is_liked', 'is_retweeted', 'hashtags', 'mentions',
             'is_retweet', 'original_post', 'original_post_data',
             'is_reply', 'parent', 'parent_data',
@@ -37,19 +115,43 @@ class PostSerializer(serializers.ModelSerializer):
             'is_liked', 'is_retweeted', 'hashtags', 'mentions',
             'created_at', 'updated_at'
         )
+        list_serializer_class = PostListSerializer
+    
+    upload_fields = {'image_upload': 'image'}
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Add counter deltas that are still buffered in Redis (see posts.counters)
+        for field, delta in self.context.get('pending_counters', {}).get(instance.id, {}).items():
+            if field in data:
+                data[field] = max(data[field] + delta, 0)
+        return data
     
     def get_is_liked(self, obj):
+        # Render snapshots are shared by all viewers; the state is added per response
+        if self.context.get('render_snapshot'):
+            return False
+        # Use the state resolved in bulk by the view when it covers this post
+        if obj.id in self.context.get('viewer_post_ids', ()):
+            return obj.id in self.context['liked_post_ids']
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return Like.objects.filter(user=request.user, post=obj).exists()
+            return engagement.likes.contains(request.user.id, obj.id)
         return False
     
     def get_is_retweeted(self, obj):
+        if self.context.get('render_snapshot'):
+            return False
+        if obj.id in self.context.get('viewer_post_ids', ()):
+            return obj.id in self.context['retweeted_post_ids']
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return Retweet.objects.filter(user=request.user, post=obj).exists()
+            return engagement.retweets.contains(request.user.id, obj.id)
         return False
     
+    def get_image_variants(self, obj):
+        return variant_urls(obj.image, obj.image_variants)
+    
     def get_hashtags(self, obj):
         hashtags = [ph.hashtag for ph in obj.hashtags.all()]
         return HashtagSerializer(hashtags, many=True).data
@@ -59,14 +161,30 @@ class PostSerializer(serializers.ModelSerializer):
         return MentionSerializer(mentions, many=True).data
     
     def get_original_post_data(self, obj):
-        if obj.is_retweet and obj.original_post:
-            return PostSerializer(obj.original_post, context=self.context).data
+        # Snapshots reference nested posts, which are attached when assembled
+        if self.context.get('render_snapshot'):
+            return None
+        if obj.is_retweet and obj.original_post_id is not None:
+            return self.get_nested_post(obj, 'original_post', 'original_post_data')
         return None
     
     def get_parent_data(self, obj):
-        if obj.is_reply and obj.parent:
-            return PostSerializer(obj.parent, context=self.context).data
+        if self.context.get('render_snapshot'):
+            return None
+        if obj.is_reply and obj.parent_id is not None:
+            return self.get_nested_post(obj, 'parent', 'parent_data')
         return None
+    
+    def get_nested_post(self, obj, field_name, data_field):
+        """Embed a retweeted or parent post, or only reference it when not expanded."""
+        fieldset = self.fieldset
+        if fieldset is not None and not fieldset.expands(data_field):
+            return {'id': getattr(obj, f'{field_name}_id')}
+        context = {
+            **self.context,
+            'fieldset': fieldset.embedded(data_field) if fieldset is not None else None,
+        }
+        return PostSerializer(getattr(obj, field_name), context=context).data
 
 class LikeSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
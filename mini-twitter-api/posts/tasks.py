@@ -0,0 +1,91 @@
+from celery import shared_task
+from django.conf import settings
+from mini_twitter.images import process_upload
+from mini_twitter.utils import get_redis_connection
+from .models import Mention, Post
+from .feed_cache import bump_feed_versions, bump_follower_feed_versions
+from . import counters, timeline, trending
+
+@shared_task
+def fanout_post(post_id):
+    try:
+        post = Post.objects.get(id=post_id)
+    except Post.DoesNotExist:
+        return 0
+
+    delivered = 0
+    redis = get_redis_connection()
+    if redis is not None:
+        delivered = timeline.fanout(redis, post)
+
+    # Invalidate cached feed pages only after the timelines were written
+    mentioned_ids = post.mentions.values_list('user_id', flat=True)
+    bump_follower_feed_versions(post.user_id, mentioned_ids)
+    return delivered
+
+@shared_task
+def fanout_posts(post_ids):
+    """Fan out a batch of posts created together, such as a bulk import."""
+    posts = list(Post.objects.filter(id__in=post_ids).only('id', 'user_id', 'created_at'))
+    delivered = 0
+    redis = get_redis_connection()
+    if redis is not None:
+        delivered = timeline.fanout_many(redis, posts)
+    
+    mentioned_ids = Mention.objects.filter(post_id__in=post_ids).values_list('user_id', flat=True)
+    bump_feed_versions(set(mentioned_ids))
+    for author_id in {post.user_id for post in posts}:
+        bump_follower_feed_versions(author_id)
+    return delivered
+
+@shared_task
+def retract_post(post_id, author_id):
+    redis = get_redis_connection()
+    if redis is not None:
+        timeline.retract(redis, post_id, author_id)
+
+    bump_follower_feed_versions(author_id)
+    return True
+
+@shared_task
+def merge_followed_author(follower_id, following_id):
+    redis = get_redis_connection()
+    if redis is not None:
+        timeline.merge_author(redis, follower_id, following_id)
+
+    bump_feed_versions([follower_id])
+    return True
+
+@shared_task
+def purge_unfollowed_author(follower_id, following_id):
+    redis = get_redis_connection()
+    if redis is not None:
+        timeline.purge_author(redis, follower_id, following_id)
+
+    bump_feed_versions([follower_id])
+    return True
+
+@shared_task
+def flush_post_counters():
+    """
+    Apply buffered like/retweet/reply deltas to the posts table (run by Celery
+    beat). Each run flushes at most POST_COUNTER_FLUSH_MAX_BATCHES batches, so
+    a run finishes even while posts keep turning dirty; the rest is left for
+    the next run.
+    """
+    flushed = 0
+    for _ in range(settings.POST_COUNTER_FLUSH_MAX_BATCHES):
+        batch = counters.flush_counters()
+        if not batch:
+            break
+        flushed += batch
+    return flushed
+
+@shared_task
+def refresh_trending_hashtags():
+    return len(trending.refresh_trending())
+
+@shared_task
+def process_post_image(post_id, name, stale=()):
+    """Validate a post's uploaded image, strip its metadata and write its variants."""
+    return process_upload(Post, post_id, 'image', name, 'post', stale) is not None
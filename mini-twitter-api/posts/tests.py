@@ -1,13 +1,36 @@
-from django.test import TestCase
+import os
+import shutil
+import socket
+import tempfile
+import time
+from unittest import skipUnless
+from unittest.mock import patch
+from io import BytesIO
+
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
-from .models import Post, Like
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from .models import Post, Like, Retweet, Hashtag
+from .timeline import timeline_key
+from .feeds import PullFeed, author_posts_key, query_feed
+from .tasks import flush_post_counters
+from .trending import bucket_key, current_hour, get_trending, record_hashtags, refresh_trending
+from . import autocomplete, engagement
+from .dataset import DatasetGenerator
 from users.models import Follow
+from mini_twitter.utils import get_redis_connection
+from mini_twitter.testing import QueryPlanTestMixin
 
 class PostTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             username='testuser',
@@ -40,6 +63,7 @@ class PostTests(TestCase):
         self.assertTrue(Like.objects.filter(user=self.user, post=post).exists())
         
         # Check that likes count was updated
+        flush_post_counters()
         post.refresh_from_db()
         self.assertEqual(post.likes_count, 1)
     
@@ -55,24 +79,1165 @@ class PostTests(TestCase):
         self.assertFalse(Like.objects.filter(user=self.user, post=post).exists())
         
         # Check that likes count was updated
+        flush_post_counters()
         post.refresh_from_db()
         self.assertEqual(post.likes_count, 0)
     
+    def test_counters_are_buffered_and_flushed_in_batches(self):
+        posts = [
+            Post.objects.create(user=self.other_user, content=f'Post {i}') for i in range(3)
+        ]
+        for post in posts:
+            self.client.post(reverse('post-like', args=[post.id]))
+        self.client.post(reverse('post-retweet', args=[posts[0].id]))
+        self.client.post(reverse('post-unlike', args=[posts[0].id]))
+        
+        # Reads include deltas that have not been flushed yet
+        response = self.client.get(reverse('post-detail', args=[posts[0].id]))
+        self.assertEqual(response.data['likes_count'], 0)
+        self.assertEqual(response.data['retweets_count'], 1)
+        response = self.client.get(reverse('post-detail', args=[posts[1].id]))
+        self.assertEqual(response.data['likes_count'], 1)
+        
+        # Posts with identical deltas share a single UPDATE
+        with CaptureQueriesContext(connection) as ctx:
+            flush_post_counters()
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 0 if get_redis_connection() is None else 2)
+        
+        counts = dict(Post.objects.filter(id__in=[p.id for p in posts]).values_list('id', 'likes_count'))
+        self.assertEqual(counts, {posts[0].id: 0, posts[1].id: 1, posts[2].id: 1})
+        posts[0].refresh_from_db()
+        self.assertEqual(posts[0].retweets_count, 1)
+        
+        # Once flushed, nothing is pending and the counts are not applied twice
+        response = self.client.get(reverse('post-detail', args=[posts[1].id]))
+        self.assertEqual(response.data['likes_count'], 1)
+    
+    @override_settings(POST_COUNTER_FLUSH_BATCH_SIZE=1, POST_COUNTER_FLUSH_MAX_BATCHES=2)
+    def test_counter_flush_runs_are_capped(self):
+        posts = [
+            Post.objects.create(user=self.other_user, content=f'Post {i}') for i in range(3)
+        ]
+        for post in posts:
+            self.client.post(reverse('post-like', args=[post.id]))
+        if get_redis_connection() is None:
+            self.assertEqual(flush_post_counters(), 0)
+            return
+        
+        # Each run stops after its batches; the rest waits for the next run
+        self.assertEqual(flush_post_counters(), 2)
+        self.assertEqual(flush_post_counters(), 1)
+        self.assertEqual(flush_post_counters(), 0)
+        self.assertEqual(
+            sorted(Post.objects.filter(id__in=[p.id for p in posts]).values_list('likes_count', flat=True)),
+            [1, 1, 1]
+        )
+    
+    def test_retweet_paths_share_one_service(self):
+        post = Post.objects.create(user=self.other_user, content='Worth sharing #tag @testuser')
+        
+        # Retweets skip hashtag/mention extraction
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('post-retweet', args=[post.id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse([q for q in ctx.captured_queries if 'posts_posthashtag' in q['sql'] or 'posts_mention' in q['sql']])
+        retweet_post = Post.objects.get(is_retweet=True)
+        self.assertEqual((retweet_post.content, retweet_post.original_post_id), ('', post.id))
+        self.assertFalse(retweet_post.hashtags.exists())
+        
+        # Creating a post with original_post is the same retweet, so it is rejected as a duplicate
+        response = self.client.post(reverse('post-list'), {'content': 'Again', 'original_post': post.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Retweet.objects.count(), 1)
+        
+        # Unretweeting deletes the Retweet row without reading it first
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('post-unretweet', args=[post.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        retweet_queries = [q['sql'] for q in ctx.captured_queries if 'posts_retweet' in q['sql']]
+        self.assertTrue(retweet_queries[0].startswith('DELETE'))
+        self.assertFalse([sql for sql in retweet_queries if sql.startswith('SELECT')])
+        self.assertFalse(Post.objects.filter(is_retweet=True).exists())
+        response = self.client.post(reverse('post-unretweet', args=[post.id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.post(reverse('post-list'), {'content': 'Ignored', 'original_post': post.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['is_retweet'], response.data['content']), (True, ''))
+        
+        # Deleting the retweet post undoes the retweet
+        self.client.delete(reverse('post-detail', args=[response.data['id']]))
+        self.assertFalse(Retweet.objects.exists())
+        flush_post_counters()
+        post.refresh_from_db()
+        self.assertEqual(post.retweets_count, 0)
+        
+        # So does the retweets endpoint
+        response = self.client.post(reverse('retweet-list'), {'post': post.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Post.objects.filter(is_retweet=True, original_post=post).exists())
+        self.assertTrue(engagement.retweets.contains(self.user.id, post.id))
+        response = self.client.post(reverse('retweet-list'), {'post': post.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.delete(reverse('retweet-detail', args=[Retweet.objects.get().id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Post.objects.filter(is_retweet=True).exists())
+        self.assertFalse(engagement.retweets.contains(self.user.id, post.id))
+        flush_post_counters()
+        post.refresh_from_db()
+        self.assertEqual(post.retweets_count, 0)
+    
+    @override_settings(ENGAGEMENT_SET_MAX_SIZE=3)
+    def test_engagement_sets(self):
+        posts = [Post.objects.create(user=self.other_user, content=f'Post {i}') for i in range(6)]
+        for post in posts[:4]:
+            Like.objects.create(user=self.user, post=post)
+        ids = [post.id for post in posts]
+        redis = get_redis_connection()
+        
+        # Built lazily from the database, keeping only the 3 most recent likes
+        self.assertEqual(engagement.likes.filter(self.user.id, ids), set(ids[:4]))
+        if redis is not None:
+            self.assertEqual(redis.zcard(engagement.likes.key(self.user.id)), 3)
+            with self.assertNumQueries(0):
+                self.assertEqual(engagement.likes.filter(self.user.id, ids[1:]), set(ids[1:4]))
+            # Posts below the floor are looked up in the database
+            with self.assertNumQueries(1):
+                self.assertTrue(engagement.likes.contains(self.user.id, ids[0]))
+        
+        # Written through on like/unlike; a like that trims the set raises the floor
+        response = self.client.post(reverse('post-like', args=[ids[5]]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('post-like', args=[ids[5]]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.post(reverse('post-unlike', args=[ids[2]]))
+        response = self.client.post(reverse('post-unlike', args=[ids[2]]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        expected = {ids[0], ids[1], ids[3], ids[5]}
+        self.assertEqual(engagement.likes.filter(self.user.id, ids), expected)
+        self.assertEqual(set(Like.objects.filter(user=self.user).values_list('post_id', flat=True)), expected)
+        
+        self.client.post(reverse('post-retweet', args=[ids[4]]))
+        response = self.client.get(reverse('post-detail', args=[ids[4]]))
+        self.assertEqual((response.data['is_liked'], response.data['is_retweeted']), (False, True))
+    
+    def test_likes_endpoint_uses_like_service(self):
+        post = Post.objects.create(user=self.other_user, content='Post to like')
+        response = self.client.post(reverse('like-list'), {'post': post.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('like-list'), {'post': post.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(engagement.likes.contains(self.user.id, post.id))
+        flush_post_counters()
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 1)
+        
+        like = Like.objects.get()
+        response = self.client.delete(reverse('like-detail', args=[like.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(engagement.likes.contains(self.user.id, post.id))
+        self.assertFalse(self.client.get(reverse('post-detail', args=[post.id])).data['is_liked'])
+        flush_post_counters()
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 0)
+        # Liking again through the post action works
+        response = self.client.post(reverse('post-like', args=[post.id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    def test_lists_are_assembled_from_render_snapshots(self):
+        root = Post.objects.create(user=self.other_user, content='Root #render @testuser')
+        reply = Post.objects.create(user=self.user, content='Reply #render', is_reply=True, parent=root)
+        Post.objects.create(user=self.other_user, content='Nested reply', is_reply=True, parent=reply)
+        self.client.post(reverse('post-retweet', args=[reply.id]))
+        self.client.post(reverse('post-like', args=[root.id]))
+        url = reverse('post-list') + '?page_size=20'
+        
+        # Pages match the uncached detail rendering, nested posts included. The
+        # detail view only overlays buffered counters one level deep, so
+        # compare with flushed counters.
+        flush_post_counters()
+        cold = self.client.get(url).data['results']
+        self.assertEqual(len(cold), 4)
+        for item in cold:
+            self.assertEqual(item, self.client.get(reverse('post-detail', args=[item['id']])).data)
+        
+        # Warm pages read no entities; counters and viewer state stay live
+        self.client.post(reverse('post-unlike', args=[root.id]))
+        with CaptureQueriesContext(connection) as ctx:
+            warm = self.client.get(url).data['results']
+        self.assertFalse([q for q in ctx.captured_queries if 'posts_posthashtag' in q['sql'] or 'posts_mention' in q['sql']])
+        warm_root = next(item for item in warm if item['id'] == root.id)
+        self.assertEqual((warm_root['likes_count'], warm_root['is_liked']), (0, False))
+        flush_post_counters()
+        warm = self.client.get(url).data['results']
+        self.assertEqual(warm, [self.client.get(reverse('post-detail', args=[item['id']])).data for item in warm])
+        
+        # Edits and profile changes retire the affected snapshots
+        self.client.patch(reverse('post-detail', args=[reply.id]), {'content': 'Edited #render'}, format='json')
+        self.other_user.username = 'renamed'
+        self.other_user.save()
+        results = self.client.get(url).data['results']
+        self.assertIn('Edited #render', [item['content'] for item in results])
+        self.assertEqual(results[-1]['user']['username'], 'renamed')
+        for item in results:
+            self.assertEqual(item, self.client.get(reverse('post-detail', args=[item['id']])).data)
+    
+    def test_sparse_fieldsets(self):
+        root = Post.objects.create(user=self.other_user, content='Root #sparse')
+        reply = Post.objects.create(user=self.user, content='Reply', is_reply=True, parent=root)
+        self.client.post(reverse('post-retweet', args=[reply.id]))
+        retweet = Post.objects.get(is_retweet=True)
+    
+        # Only the requested fields are returned; nested posts are references
+        url = reverse('post-list') + '?fields=id,content,user.username,parent_data,original_post_data'
+        results = self.client.get(url).data['results']
+        by_id = {item['id']: item for item in results}
+        self.assertEqual(by_id[reply.id], {
+            'id': reply.id, 'content': 'Reply', 'user': {'username': 'testuser'},
+            'parent_data': {'id': root.id}, 'original_post_data': None,
+        })
+        self.assertEqual(by_id[retweet.id]['original_post_data'], {'id': reply.id})
+    
+        # Expanded posts are embedded with the same field selection, level by level
+        expanded = self.client.get(url + '&expand=original_post_data.parent_data').data['results']
+        original = next(item for item in expanded if item['id'] == retweet.id)['original_post_data']
+        self.assertEqual(original['content'], 'Reply')
+        self.assertEqual(original['parent_data'], {
+            'id': root.id, 'content': 'Root #sparse', 'user': {'username': 'otheruser'},
+            'parent_data': None, 'original_post_data': None,
+        })
+    
+        # The detail view renders the same, without evaluating unrequested fields
+        detail_url = reverse('post-detail', args=[retweet.id]) + '?fields=id,content,original_post_data.content'
+        with CaptureQueriesContext(connection) as ctx:
+            detail = self.client.get(detail_url).data
+        self.assertEqual(detail, {'id': retweet.id, 'content': '', 'original_post_data': {'content': 'Reply'}})
+        self.assertFalse([q for q in ctx.captured_queries if 'posts_like' in q['sql']])
+        self.assertEqual(
+            self.client.get(reverse('post-detail', args=[reply.id]) + '?expand=parent_data').data,
+            self.client.get(reverse('post-detail', args=[reply.id]) + '?expand=*').data
+        )
+    
+        # Without either parameter, posts are rendered in full but nested posts are references
+        plain = {item['id']: item for item in self.client.get(reverse('post-list')).data['results']}
+        self.assertIn('email', plain[reply.id]['user'])
+        self.assertEqual(plain[reply.id]['parent_data'], {'id': root.id})
+        self.assertEqual(plain[retweet.id]['original_post_data'], {'id': reply.id})
+    
+        # expand=* embeds nested posts at every level
+        full = self.client.get(reverse('post-detail', args=[retweet.id]) + '?expand=*').data
+        self.assertEqual(full['original_post_data']['parent_data']['content'], 'Root #sparse')
+        self.assertIn('email', full['original_post_data']['parent_data']['user'])
+    
+    def test_entities_response(self):
+        root = Post.objects.create(user=self.other_user, content='Root @testuser')
+        reply = Post.objects.create(user=self.user, content='Reply', is_reply=True, parent=root)
+        self.client.post(reverse('post-retweet', args=[reply.id]))
+        retweet = Post.objects.get(is_retweet=True)
+        url = reverse('post-list') + '?page_size=20'
+        
+        full = self.client.get(url).data
+        normalized = self.client.get(url + '&entities=1').data
+        self.assertEqual(normalized['results'], [item['id'] for item in full['results']])
+        self.assertEqual(normalized['next'], full['next'])
+        # Every post and user appears once, referenced by ID
+        self.assertEqual(set(normalized['posts']), {str(post_id) for post_id in (root.id, reply.id, retweet.id)})
+        self.assertEqual(set(normalized['users']), {str(self.user.id), str(self.other_user.id)})
+        self.assertEqual(normalized['posts'][str(retweet.id)]['original_post'], reply.id)
+        self.assertNotIn('original_post_data', normalized['posts'][str(retweet.id)])
+        self.assertEqual(normalized['posts'][str(root.id)]['mentions'][0]['user'], self.user.id)
+        
+        # Posts are the same as in the full response, minus the embedded objects
+        by_id = {item['id']: item for item in full['results']}
+        for post_id, post in normalized['posts'].items():
+            expected = {key: value for key, value in by_id[int(post_id)].items() if not key.endswith('_data')}
+            self.assertEqual(post['user'], expected['user']['id'])
+            self.assertEqual(normalized['users'][str(post['user'])], expected.pop('user'))
+            self.assertEqual({key: value for key, value in post.items() if key not in ('user', 'mentions')},
+                             {key: value for key, value in expected.items() if key != 'mentions'})
+        
+        # Sparse fieldsets apply, and the feed is normalized too
+        sparse = self.client.get(url + '&entities=1&fields=id,user.username').data
+        self.assertEqual(sparse['posts'][str(reply.id)], {'id': reply.id, 'user': self.user.id})
+        self.assertEqual(sparse['users'][str(self.user.id)], {'username': 'testuser'})
+        self.assertEqual(sparse['results'], normalized['results'])
+        feed = self.client.get(reverse('post-feed') + '?entities=1').data
+        self.assertEqual(feed['results'][:2], [retweet.id, reply.id])
+        self.assertEqual(feed['posts'][str(reply.id)], normalized['posts'][str(reply.id)])
+    
+    def test_entities_are_synced_incrementally(self):
+        post = Post.objects.create(user=self.user, content='#python #django @otheruser #python')
+        self.assertEqual(
+            set(post.hashtags.values_list('hashtag__name', flat=True)), {'python', 'django'}
+        )
+        self.assertEqual(list(post.mentions.values_list('user_id', flat=True)), [self.other_user.id])
+        
+        # Saves that leave the content alone do not touch the entities
+        post = Post.objects.get(id=post.id)
+        with CaptureQueriesContext(connection) as ctx:
+            post.save()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        
+        post.content = '#Python #rust'
+        post.save()
+        counts = dict(Hashtag.objects.values_list('name', 'post_count'))
+        self.assertEqual(counts, {'python': 1, 'django': 0, 'rust': 1})
+        self.assertFalse(post.mentions.exists())
+    
+    def test_trending_hashtags(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(user=self.user, content='#django #python')
+            Post.objects.create(user=self.other_user, content='#python')
+            Post.objects.create(user=self.other_user, content='#rust')
+        refresh_trending()
+        
+        url = reverse('post-trending-hashtags')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [hashtag['name'] for hashtag in response.data]
+        self.assertEqual(names[0], 'python')
+        self.assertEqual(set(names), {'python', 'django', 'rust'})
+        
+        if get_redis_connection() is None:
+            return
+        
+        # Older usage decays: three uses two days ago rank below two uses now
+        old_hour = time.time() - 48 * 3600
+        rust = Hashtag.objects.get(name='rust')
+        for _ in range(2):
+            record_hashtags([rust.id], now=old_hour)
+        with override_settings(TRENDING_DECAY=0.9):
+            self.assertEqual(refresh_trending()[0]['name'], 'python')
+        with override_settings(TRENDING_DECAY=1.0):
+            self.assertEqual(refresh_trending()[0]['name'], 'rust')
+    
+    def test_search_is_ranked_paginated_and_incremental(self):
+        weak = Post.objects.create(user=self.other_user, content='Learning django today with friends and coffee')
+        strong = Post.objects.create(user=self.other_user, content='Django django django')
+        edited = Post.objects.create(user=self.other_user, content='Nothing to see here')
+        Post.objects.create(user=self.other_user, content='Unrelated post')
+        
+        url = reverse('post-search')
+        response = self.client.get(f'{url}?q=django&page_size=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.data['posts']], [strong.id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([p['id'] for p in response.data['posts']], [weak.id])
+        self.assertIsNone(response.data['next'])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([p['id'] for p in response.data['posts']], [strong.id])
+        
+        # Edits and deletes are reflected right away
+        edited.content = 'Now about Django'
+        edited.save()
+        strong.delete()
+        response = self.client.get(f'{url}?q=django')
+        self.assertEqual({p['id'] for p in response.data['posts']}, {weak.id, edited.id})
+        
+        # Search syntax in the query is treated as plain text
+        response = self.client.get(url, {'q': 'django" OR (*'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        response = self.client.get(reverse('post-list'), {'search': 'django'})
+        self.assertEqual({p['id'] for p in response.data['results']}, {weak.id, edited.id})
+        
+        # ?search= also matches authors by username prefix
+        mine = Post.objects.create(user=self.user, content='Unrelated too')
+        response = self.client.get(reverse('post-list'), {'search': 'TEST'})
+        self.assertEqual([p['id'] for p in response.data['results']], [mine.id])
+    
+    @override_settings(AUTOCOMPLETE_REBUILD_INTERVAL=0)
+    def test_autocomplete(self):
+        autocomplete.reset()
+        # Requests never build the index themselves
+        response = self.client.get(reverse('post-autocomplete'), {'q': 'te'})
+        self.assertEqual((response.data['users'], response.data['hashtags']), ([], []))
+        popular = User.objects.create_user(username='Testpopular')
+        popular.profile.followers_count = 50
+        popular.profile.save()
+        Post.objects.create(user=self.user, content='#testing #tea #testing2')
+        Post.objects.create(user=self.user, content='#testing')
+        
+        # Changes made while a rebuild runs are replayed onto the new index
+        build_user_index = autocomplete.INDEX_BUILDERS['users']
+        def build_during_signup():
+            index = build_user_index()
+            autocomplete.index_user(10_000, 'testlate')
+            return index
+        with patch.dict(autocomplete.INDEX_BUILDERS, users=build_during_signup):
+            autocomplete.rebuild()
+        
+        url = reverse('post-autocomplete')
+        response = self.client.get(url, {'q': 'testl'})
+        self.assertEqual([u['username'] for u in response.data['users']], ['testlate'])
+        autocomplete.remove_user(10_000)
+        response = self.client.get(url, {'q': 'te'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [u['username'] for u in response.data['users']], ['Testpopular', 'testuser']
+        )
+        self.assertEqual(response.data['hashtags'][0]['name'], 'testing')
+        self.assertEqual(
+            {h['name'] for h in response.data['hashtags']}, {'testing', 'tea', 'testing2'}
+        )
+        
+        # Lookups are served from memory; new users and hashtags show up
+        # once their transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(username='testnewcomer')
+            Post.objects.create(user=self.user, content='#testnew')
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': '@TESTN', 'limit': 5})
+        self.assertEqual([u['username'] for u in response.data['users']], ['testnewcomer'])
+        self.assertEqual(response.data['hashtags'], [])
+        response = self.client.get(url, {'q': '#testn'})
+        self.assertEqual([h['name'] for h in response.data['hashtags']], ['testnew'])
+        self.assertEqual(response.data['users'], [])
+        
+        # A use counted while a rebuild runs is not counted twice once the
+        # rebuild has read it from the database
+        build_hashtag_index = autocomplete.INDEX_BUILDERS['hashtags']
+        def build_after_use():
+            with self.captureOnCommitCallbacks() as callbacks:
+                Post.objects.create(user=self.user, content='#testing')
+            index = build_hashtag_index()
+            for callback in callbacks:
+                callback()
+            return index
+        with patch.dict(autocomplete.INDEX_BUILDERS, hashtags=build_after_use):
+            autocomplete.rebuild(['hashtags'])
+        response = self.client.get(url, {'q': '#testing'})
+        self.assertEqual(response.data['hashtags'][0]['post_count'], 3)
+        
+        # Search suggests users and hashtags from the indexes too
+        search_url = reverse('post-search')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(search_url, {'q': 'TESTN'})
+        self.assertEqual([u['username'] for u in response.data['users']], ['testnewcomer'])
+        self.assertEqual(response.data['hashtags'], [
+            {'id': Hashtag.objects.get(name='testnew').id, 'name': 'testnew', 'post_count': 1}
+        ])
+        self.assertFalse([q for q in ctx.captured_queries if 'LIKE' in q['sql']])
+        autocomplete.reset()
+        
+        # Before the first build, they are queried instead
+        response = self.client.get(search_url, {'q': 'TESTN'})
+        self.assertEqual([u['username'] for u in response.data['users']], ['testnewcomer'])
+        self.assertEqual([h['name'] for h in response.data['hashtags']], ['testnew'])
+    
     def test_feed(self):
         # Create a post from other_user
-        Post.objects.create(user=self.other_user, content='Post from other user')
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(user=self.other_user, content='Post from other user')
         
         # User is not following other_user yet, so feed should be empty
         url = reverse('post-feed')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)
+        self.assertEqual(len(response.data['results']), 0)
         
         # Follow other_user
-        Follow.objects.create(follower=self.user, following=self.other_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=self.user, following=self.other_user)
         
         # Now feed should contain the post
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['content'], 'Post from other user')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['content'], 'Post from other user')
+    
+    def test_feed_fanout_on_create_and_delete(self):
+        Follow.objects.create(follower=self.user, following=self.other_user)
+        url = reverse('post-feed')
+        self.client.get(url)  # materialize the timeline
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(user=self.other_user, content='Fresh post')
+        
+        redis = get_redis_connection()
+        if redis is not None:
+            self.assertIn(str(post.id).encode(), redis.zrange(timeline_key(self.user.id), 0, -1))
+        response = self.client.get(url)
+        self.assertEqual([p['id'] for p in response.data['results']], [post.id])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 0)
+    
+    @override_settings(FEED_FANOUT_FOLLOWER_THRESHOLD=1)
+    def test_feed_merges_celebrity_posts_on_read(self):
+        Follow.objects.create(follower=self.user, following=self.other_user)
+        self.other_user.profile.followers_count = 1
+        self.other_user.profile.save()
+        self.client.get(reverse('post-feed'))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            own_post = Post.objects.create(user=self.user, content='My post')
+            celebrity_post = Post.objects.create(user=self.other_user, content='Celebrity post')
+        
+        redis = get_redis_connection()
+        if redis is not None:
+            members = redis.zrange(timeline_key(self.user.id), 0, -1)
+            self.assertNotIn(str(celebrity_post.id).encode(), members)
+        response = self.client.get(reverse('post-feed'))
+        self.assertEqual(
+            [p['id'] for p in response.data['results']],
+            [celebrity_post.id, own_post.id]
+        )
+    
+    @override_settings(FEED_PULL_AUTHOR_CACHE_SIZE=2)
+    def test_feed_engines_paginate_identically(self):
+        third_user = User.objects.create_user(username='thirduser')
+        Follow.objects.create(follower=self.user, following=self.other_user)
+        Follow.objects.create(follower=self.user, following=third_user)
+        for i in range(4):
+            Post.objects.create(user=self.other_user, content=f'Other post {i}')
+            Post.objects.create(user=third_user, content=f'Third post {i}')
+        Post.objects.create(user=third_user, content='Hi @testuser')
+        Post.objects.create(user=self.user, content='My own post')
+        
+        expected = [post.id for post in query_feed(self.user).order_by('-created_at', '-id')]
+        self.assertEqual([post.id for post in PullFeed(self.user)], expected)
+        
+        for engine in ('query', 'pull', 'timeline'):
+            with self.settings(FEED_ENGINE=engine):
+                # Walk the feed forward with cursors, then step back one page
+                url = reverse('post-feed') + '?page_size=3'
+                seen = []
+                while url:
+                    response = self.client.get(url)
+                    seen.extend(p['id'] for p in response.data['results'])
+                    previous, url = response.data['previous'], response.data['next']
+                self.assertEqual(seen, expected, engine)
+                response = self.client.get(previous)
+                self.assertEqual([p['id'] for p in response.data['results']], expected[6:9], engine)
+    
+    @override_settings(FEED_PULL_AUTHOR_CACHE_SIZE=2)
+    def test_pull_feed_deep_pages_query_only_what_reaches_the_page(self):
+        # Quiet authors posted long ago and just now; a busy author fills the middle
+        quiet = [User.objects.create_user(username=f'quiet{i}') for i in range(4)]
+        for author in quiet:
+            Follow.objects.create(follower=self.user, following=author)
+            Post.objects.create(user=author, content='Old post')
+        Follow.objects.create(follower=self.user, following=self.other_user)
+        busy = [Post.objects.create(user=self.other_user, content=f'Post {i}') for i in range(10)]
+        for author in quiet:
+            for i in range(2):
+                Post.objects.create(user=author, content=f'New post {i}')
+        
+        feed = PullFeed(self.user)
+        expected = [post.id for post in query_feed(self.user).order_by('-created_at', '-id')]
+        position = (busy[-3].created_at, busy[-3].id)
+        start = expected.index(busy[-3].id) + 1
+        # Every author's cached posts are above the cursor: one keyset query
+        # shared by all of them, instead of one (plus a lookup) per author
+        with self.assertNumQueries(1):
+            self.assertEqual(feed.page_ids(position, limit=2), expected[start:start + 2])
+        self.assertEqual(feed.page_ids(position, limit=20), expected[start:])
+        
+        # Cached lists are dropped once a new post commits, not before
+        key = author_posts_key(self.other_user.id)
+        self.assertIsNotNone(cache.get(key))
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(user=self.other_user, content='Newest')
+            self.assertIsNotNone(cache.get(key))
+        self.assertIsNone(cache.get(key))
+    
+    def test_likes_list_uses_cursor_pagination(self):
+        post = Post.objects.create(user=self.other_user, content='Popular post')
+        likers = [
+            User.objects.create_user(username=f'liker{i}')
+            for i in range(3)
+        ]
+        for liker in likers:
+            Like.objects.create(user=liker, post=post)
+        
+        url = reverse('post-likes', args=[post.id]) + '?page_size=2'
+        response = self.client.get(url)
+        self.assertNotIn('count', response.data)
+        self.assertEqual([u['username'] for u in response.data['results']], ['liker2', 'liker1'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([u['username'] for u in response.data['results']], ['liker0'])
+        self.assertIsNone(response.data['next'])
+    
+    def test_feed_pages_are_cached_until_version_bump(self):
+        Follow.objects.create(follower=self.user, following=self.other_user)
+        post = Post.objects.create(user=self.other_user, content='Cached post')
+        url = reverse('post-feed')
+        self.client.get(url)
+        
+        # The second read takes the page from the cache instead of the feed engine
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertFalse([q for q in ctx.captured_queries if 'users_follow' in q['sql']])
+        self.assertFalse(response.data['results'][0]['is_liked'])
+        
+        # Another user's like does not bump the viewer's feed version, but the
+        # cached page still shows the live count
+        liker = User.objects.create_user(username='liker', password='likerpassword123')
+        liker_client = APIClient()
+        liker_client.force_authenticate(user=liker)
+        liker_client.post(reverse('post-like', args=[post.id]))
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['likes_count'], 1)
+        self.assertFalse(response.data['results'][0]['is_liked'])
+        
+        # Liking bumps the viewer's feed version, so the next read is fresh
+        self.client.post(reverse('post-like', args=[post.id]))
+        response = self.client.get(url)
+        self.assertTrue(response.data['results'][0]['is_liked'])
+        
+        # A followee's new post bumps the follower's version from the fan-out task
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = Post.objects.create(user=self.other_user, content='Newer post')
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['id'], newer.id)
+    
+    def test_viewer_state_is_resolved_in_bulk(self):
+        original = Post.objects.create(user=self.other_user, content='Original')
+        Like.objects.create(user=self.user, post=original)
+        Retweet.objects.create(user=self.user, post=original)
+        for i in range(5):
+            Post.objects.create(user=self.other_user, content=f'Retweet {i}', is_retweet=True, original_post=original)
+            Post.objects.create(user=self.other_user, content=f'Reply {i}', is_reply=True, parent=original)
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('post-list') + '?expand=*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        like_queries = [q for q in ctx.captured_queries if 'posts_like' in q['sql']]
+        retweet_queries = [q for q in ctx.captured_queries if 'posts_retweet' in q['sql']]
+        self.assertEqual(len(like_queries), 1)
+        self.assertEqual(len(retweet_queries), 1)
+        
+        nested = [
+            p['original_post_data'] or p['parent_data'] for p in response.data['results']
+            if p['id'] != original.id
+        ]
+        self.assertTrue(all(n['is_liked'] and n['is_retweeted'] for n in nested))
+        self.assertTrue(all(not p['is_liked'] for p in response.data['results'] if p['id'] != original.id))
+    
+    def test_bulk_import(self):
+        url = reverse('post-bulk')
+        records = [
+            {'ref': 'a', 'user': 'otheruser', 'content': 'Hello #imported @testuser',
+             'created_at': '2020-01-01T12:00:00Z'},
+            {'ref': 'b', 'user': 'testuser', 'content': 'A reply', 'parent_ref': 'a'},
+            {'user': 'testuser', 'content': 'RT #imported @otheruser', 'original_post_ref': 'a'},
+        ]
+        
+        response = self.client.post(url, records, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        
+        self.user.is_staff = True
+        self.user.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, records, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        
+        original = Post.objects.get(id=response.data['refs']['a'])
+        reply = Post.objects.get(id=response.data['refs']['b'])
+        self.assertEqual(original.created_at.year, 2020)
+        self.assertTrue(reply.is_reply and reply.parent_id == original.id)
+        self.assertEqual(original.replies_count, 1)
+        self.assertEqual(original.retweets_count, 1)
+        self.assertTrue(Retweet.objects.filter(user=self.user, post=original).exists())
+        # Retweets carry no content, so their hashtags and mentions are not linked
+        retweet = Post.objects.get(is_retweet=True)
+        self.assertEqual(retweet.content, '')
+        self.assertFalse(retweet.mentions.exists())
+        self.assertEqual(Hashtag.objects.get(name='imported').post_count, 1)
+        self.assertTrue(original.mentions.filter(user=self.user).exists())
+        self.assertEqual(
+            sorted(self.other_user.notifications.values_list('notification_type', flat=True)),
+            ['reply', 'retweet']
+        )
+        self.assertEqual(self.user.notifications.get().notification_type, 'mention')
+        
+        # Invalid records reject the whole batch
+        response = self.client.post(url, [
+            {'user': 'testuser', 'content': 'Fine'},
+            {'user': 'nobody', 'content': 'Unknown author', 'parent_ref': 'missing'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual({error['index'] for error in response.data['errors']}, {1})
+        self.assertEqual(Post.objects.count(), 3)
+        
+        response = self.client.post(
+            url, '{"user": "testuser", "content": "one"}\n{"user": "testuser", "content": "two"}\n',
+            content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Post.objects.count(), 5)
+        
+        # Retweets of one's own post, second retweets and already made retweets are refused
+        response = self.client.post(url, [
+            {'ref': 'c', 'user': 'otheruser', 'content': 'Fresh'},
+            {'user': 'testuser', 'original_post_ref': 'c'},
+            {'user': 'testuser', 'original_post_ref': 'c'},
+            {'user': 'otheruser', 'original_post_ref': 'c'},
+            {'user': 'testuser', 'original_post': original.id},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual({error['index'] for error in response.data['errors']}, {2, 3, 4})
+        
+        # Recent imported hashtags count towards trending
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, [{'user': 'testuser', 'content': 'Now #fresh'}], format='json')
+        redis = get_redis_connection()
+        if redis is not None:
+            fresh = Hashtag.objects.get(name='fresh')
+            self.assertEqual(int(redis.hget(bucket_key(current_hour()), fresh.id)), 1)
+            imported = Hashtag.objects.get(name='imported')
+            self.assertFalse(any(redis.hexists(key, imported.id) for key in redis.keys(bucket_key('*'))))
+    
+    def test_uploaded_images_are_processed(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        # A landscape photo from a camera held upright: EXIF says rotate 90 degrees
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera Maker'
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, format='JPEG', exif=exif)
+        upload = SimpleUploadedFile('photo.jpeg', buffer.getvalue(), content_type='image/jpeg')
+        
+        with override_settings(MEDIA_ROOT=media_root), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('post-list'), {'content': 'A photo', 'image': upload}, format='multipart'
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(response.data['image_variants'])
+        
+        post = Post.objects.get()
+        self.assertEqual(post.image.name, 'posts/photo.jpg')
+        self.assertEqual((post.image_variants['width'], post.image_variants['height']), (1000, 2000))
+        variants = post.image_variants['variants']
+        self.assertEqual((variants['large']['width'], variants['large']['height']), (640, 1280))
+        self.assertEqual((variants['small']['width'], variants['small']['height']), (160, 320))
+        with override_settings(MEDIA_ROOT=media_root):
+            with Image.open(post.image.path) as original:
+                self.assertEqual(len(original.getexif()), 0)
+                self.assertEqual(original.size, (1000, 2000))
+            self.assertFalse(post.image.storage.exists('posts/photo.jpeg'))
+            for variant in variants.values():
+                self.assertTrue(post.image.storage.exists(variant['webp']))
+            with post.image.storage.open(variants['medium']['webp']) as file, Image.open(file) as image:
+                self.assertEqual((image.format, image.size), ('WEBP', (320, 640)))
+            
+            response = self.client.get(reverse('post-detail', args=[post.id]))
+        large = response.data['image_variants']['variants']['large']
+        self.assertTrue(large['webp'].endswith('/posts/variants/photo/large.webp'))
+        self.assertTrue(large['src'].endswith('/posts/variants/photo/large.jpg'))
+        
+        # Oversized and undecodable uploads are removed
+        for content in (buffer.getvalue(), b'not an image'):
+            upload = SimpleUploadedFile('bad.jpg', content, content_type='image/jpeg')
+            post = Post.objects.create(user=self.user, content='Bad image')
+            post.image = upload
+            with override_settings(MEDIA_ROOT=media_root, IMAGE_MAX_PIXELS=100), \
+                    self.captureOnCommitCallbacks(execute=True):
+                post.save()
+            post.refresh_from_db()
+            self.assertFalse(post.image)
+            self.assertIsNone(post.image_variants)
+        self.assertEqual(sorted(os.listdir(os.path.join(media_root, 'posts'))), ['photo.jpg', 'variants'])
+
+@skipUnless(connection.vendor == 'postgresql', 'ts_rank ranking needs PostgreSQL')
+class PostgresSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='searcher')
+        self.client.force_authenticate(user=self.user)
+    
+    def test_pages_through_ranked_ties(self):
+        posts = [
+            Post.objects.create(user=self.user, content=content)
+            for content in ['Django rocks'] * 4 + ['Django django rocks'] * 3
+        ]
+        url = reverse('post-search') + '?q=django&page_size=3'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [p['id'] for p in response.data['posts']]
+            url = response.data['next']
+        
+        # Best rank first, newest first within a rank, every post exactly once
+        self.assertEqual(seen, [post.id for post in reversed(posts[4:])] + [post.id for post in reversed(posts[:4])])
+
+class DatasetGeneratorTests(TestCase):
+    def test_generated_counters_are_consistent(self):
+        from django.db.models import Count
+        from users.models import Profile
+        from .models import PostHashtag
+        
+        cache.clear()
+        report = DatasetGenerator(users=60, posts=600, avg_following=8, chunk_size=128, seed=3).generate()
+        self.assertEqual(Post.objects.count(), 600)
+        self.assertEqual(Post.objects.filter(is_reply=True).count(), report['replies'])
+        self.assertTrue(Post.objects.filter(parent__is_reply=True).exists())  # reply chains
+        
+        for profile in Profile.objects.annotate(
+            followers=Count('user__followers', distinct=True),
+            following=Count('user__following', distinct=True),
+            posts=Count('user__posts', distinct=True),
+        ):
+            self.assertEqual(
+                (profile.followers_count, profile.following_count, profile.posts_count),
+                (profile.followers, profile.following, profile.posts)
+            )
+        for post in Post.objects.annotate(
+            like_rows=Count('likes', distinct=True),
+            retweet_rows=Count('retweets', distinct=True),
+            reply_rows=Count('replies', distinct=True),
+        ):
+            self.assertEqual(
+                (post.likes_count, post.retweets_count, post.replies_count),
+                (post.like_rows, post.retweet_rows, post.reply_rows)
+            )
+        self.assertEqual(Retweet.objects.count(), report['retweets'])
+        for hashtag in Hashtag.objects.annotate(uses=Count('posts')):
+            self.assertEqual(hashtag.post_count, hashtag.uses)
+        self.assertEqual(PostHashtag.objects.count(), report['post_hashtags'])
+        self.assertEqual(report['conversations'], 60)
+        
+        # Recent hashtag uses are counted towards trending
+        if get_redis_connection() is not None:
+            self.assertTrue(get_trending())
+    
+    def test_same_seed_same_graph(self):
+        plans = []
+        for _ in range(2):
+            generator = DatasetGenerator(users=1000, posts=1000, avg_following=5, seed=7)
+            generator.plan_users()
+            generator.plan_posts()
+            plans.append(generator)
+        for name in ('follow_sources', 'follow_targets', 'authors', 'kinds', 'targets'):
+            self.assertTrue((getattr(plans[0], name) == getattr(plans[1], name)).all())
+        # Followers follow a power law: the top 5% of accounts have most of them
+        followers = sorted(plans[0].followers_count, reverse=True)
+        self.assertGreater(sum(followers[:50]), sum(followers) / 2)
+
+
+class BenchmarkTests(TestCase):
+    def test_benchmark_runs_every_scenario_and_compares_with_baseline(self):
+        import json
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from mini_twitter.benchmarks import SCENARIO_NAMES, compare
+        
+        cache.clear()
+        DatasetGenerator(users=30, posts=300, avg_following=5, seed=1).generate()
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as baseline:
+            call_command(
+                'benchmark_api', iterations=3, warmup=1, output=baseline.name, stdout=StringIO()
+            )
+            results = json.load(baseline)
+            self.assertEqual(sorted(results['scenarios']), sorted(SCENARIO_NAMES))
+            self.assertGreater(results['scenarios']['post_list']['queries'], 0)
+            self.assertGreater(results['scenarios']['conversations']['bytes'], 0)
+            self.assertGreater(results['scenarios']['post_list']['serialize_ms'], 0)
+            self.assertLess(
+                results['scenarios']['post_list_entities']['bytes'], results['scenarios']['post_list']['bytes']
+            )
+            self.assertEqual(Like.objects.count(), Post.objects.aggregate(total=models.Sum('likes_count'))['total'])
+            
+            out = StringIO()
+            call_command('benchmark_api', iterations=3, scenarios=['post_list'], baseline=baseline.name, stdout=out)
+            self.assertIn('Compared with', out.getvalue())
+        
+        slower = json.loads(json.dumps(results))
+        slower['scenarios']['feed']['p95_ms'] += 100
+        slower['scenarios']['search']['queries'] += 1
+        self.assertEqual(compare(slower, results), {'feed': ['p95_ms'], 'search': ['queries']})
+
+
+@override_settings(PERFORMANCE_SAMPLE_RATE=1.0)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        from mini_twitter import instrumentation
+        instrumentation.reset()
+        cache.clear()
+        self.user = User.objects.create_user(username='staffer', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        for i in range(3):
+            Post.objects.create(user=self.user, content=f'Post {i} #timed')
+    
+    def test_server_timing_and_report(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('post-list'))
+        timing = dict(
+            (entry.split(';')[0].strip(), entry) for entry in response['Server-Timing'].split(',')
+        )
+        self.assertEqual(set(timing), {'db', 'cache', 'serialize', 'total'})
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing['db'])
+        
+        # The user throttle reads and writes its history on every request;
+        # the trending list is a miss and then a hit
+        response = self.client.get(reverse('post-trending-hashtags'))
+        self.assertRegex(response['Server-Timing'], r'cache;dur=[\d.]+;desc="1/2 hits 2 sets"')
+        response = self.client.get(reverse('post-trending-hashtags'))
+        self.assertRegex(response['Server-Timing'], r'cache;dur=[\d.]+;desc="2/2 hits 1 sets"')
+        
+        self.client.force_login(self.user)
+        report = self.client.get(reverse('performance-report')).json()
+        self.assertEqual(report['views']['post-trending-hashtags']['sampled_requests'], 2)
+        self.assertEqual(report['views']['post-trending-hashtags']['cache_hit_ratio'], 0.75)
+        self.assertGreater(report['views']['post-list']['mean_serializer_ms'], 0)
+        
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.get(reverse('performance-report'))
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+    
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get(reverse('post-list'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='scraped')
+        self.other = User.objects.create_user(username='followed')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        Post.objects.create(user=self.user, content='Counted #metrics')
+    
+    def sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0
+    
+    def test_requests_caches_and_tasks(self):
+        latency = {'view': 'post-feed', 'method': 'GET'}
+        feed_hits = {'cache': 'feed', 'result': 'hit'}
+        feed_misses = {'cache': 'feed', 'result': 'miss'}
+        before = {
+            'count': self.sample('http_request_duration_seconds_count', **latency),
+            'queries': self.sample('http_request_db_queries_sum', **latency),
+            'hits': self.sample('cache_requests_total', **feed_hits),
+            'misses': self.sample('cache_requests_total', **feed_misses),
+        }
+        
+        # The first page is rendered and cached, the second is served from the cache
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('post-feed'))
+        self.client.get(reverse('post-feed'))
+        self.assertEqual(self.sample('http_request_duration_seconds_count', **latency), before['count'] + 2)
+        self.assertGreaterEqual(
+            self.sample('http_request_db_queries_sum', **latency), before['queries'] + len(ctx.captured_queries)
+        )
+        self.assertEqual(self.sample('cache_requests_total', **feed_misses), before['misses'] + 1)
+        self.assertEqual(self.sample('cache_requests_total', **feed_hits), before['hits'] + 1)
+        
+        task = {'task': 'users.tasks.send_follow_notification', 'state': 'SUCCESS'}
+        runs = self.sample('celery_task_duration_seconds_count', **task)
+        self.client.post(reverse('user-follow', args=[self.other.id]))
+        self.assertEqual(self.sample('celery_task_duration_seconds_count', **task), runs + 1)
+        
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_bucket{le="0.005",method="GET",view="post-feed"}', body)
+        self.assertIn('celery_task_duration_seconds_count{state="SUCCESS",task="users.tasks.send_follow_notification"}', body)
+    
+    def test_worker_metrics_server(self):
+        from urllib.request import urlopen
+        from mini_twitter.metrics import start_worker_metrics_server
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        start_worker_metrics_server(port)
+        
+        # Tasks run in this process are scraped from the worker's own endpoint
+        self.client.post(reverse('user-follow', args=[self.other.id]))
+        body = urlopen(f'http://127.0.0.1:{port}/metrics').read().decode()
+        self.assertIn('celery_task_duration_seconds_count{state="SUCCESS",task="users.tasks.send_follow_notification"}', body)
+    
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class PostQueryCountTests(TestCase):
+    """Every posts endpoint must run a constant number of queries per page."""
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader')
+        self.client.force_authenticate(user=self.user)
+        self.authors = [
+            User.objects.create_user(username=f'author{i}')
+            for i in range(3)
+        ]
+        for author in self.authors:
+            Follow.objects.create(follower=self.user, following=author)
+        
+        self.root = Post.objects.create(user=self.authors[0], content='Root #perf @author1')
+        for i in range(12):
+            author = self.authors[i % 3]
+            Post.objects.create(user=author, content=f'Post {i} #perf #tag{i} @author{(i + 1) % 3} @reader')
+            Post.objects.create(user=author, content='', is_retweet=True, original_post=self.root)
+            Post.objects.create(user=author, content=f'Reply {i} #perf @author0', is_reply=True, parent=self.root)
+            liker = User.objects.create_user(username=f'liker{i}')
+            Like.objects.create(user=liker, post=self.root)
+            Retweet.objects.create(user=liker, post=self.root)
+        Like.objects.create(user=self.user, post=self.root)
+    
+    def count_queries(self, url, page_size):
+        cache.clear()
+        separator = '&' if '?' in url else '?'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'{url}{separator}page_size={page_size}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+    
+    def assertConstantQueries(self, url):
+        small = self.count_queries(url, 2)
+        cache.clear()
+        with self.assertNumQueries(small):
+            response = self.client.get(f"{url}{'&' if '?' in url else '?'}page_size=20")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_list(self):
+        self.assertConstantQueries(reverse('post-list'))
+    
+    def test_list_filtered_by_hashtag(self):
+        self.assertConstantQueries(reverse('post-list') + '?hashtag=perf')
+    
+    def test_feed(self):
+        for engine in ('query', 'pull', 'timeline'):
+            with self.settings(FEED_ENGINE=engine):
+                self.assertConstantQueries(reverse('post-feed'))
+    
+    def test_replies(self):
+        self.assertConstantQueries(reverse('post-replies', args=[self.root.id]))
+    
+    def test_likes_and_retweets(self):
+        self.assertConstantQueries(reverse('post-likes', args=[self.root.id]))
+        self.assertConstantQueries(reverse('post-retweets', args=[self.root.id]))
+    
+    def test_retrieve(self):
+        reply = Post.objects.filter(is_reply=True).first()
+        retweet = Post.objects.filter(is_retweet=True).first()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('post-detail', args=[reply.id]))
+        # Start from cold engagement sets again
+        cache.clear()
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            self.client.get(reverse('post-detail', args=[retweet.id]))
+    
+    def test_search(self):
+        self.assertConstantQueries(reverse('post-search') + '?q=perf')
+        self.assertConstantQueries(reverse('post-search') + '?q=%23perf')
+
+
+class PostQueryPlanTests(QueryPlanTestMixin, TestCase):
+    """The main query of every posts endpoint must be served by an index."""
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader')
+        self.client.force_authenticate(user=self.user)
+        self.author = User.objects.create_user(username='author')
+        Follow.objects.create(follower=self.user, following=self.author)
+        self.root = Post.objects.create(user=self.author, content='Root #plan')
+        for i in range(5):
+            Post.objects.create(user=self.author, content=f'Post {i} #plan')
+            Post.objects.create(user=self.user, content=f'Reply {i}', is_reply=True, parent=self.root)
+        liker = User.objects.create_user(username='liker')
+        Like.objects.create(user=liker, post=self.root)
+        Retweet.objects.create(user=liker, post=self.root)
+    
+    def test_list(self):
+        self.assertIndexedEndpoint(reverse('post-list'), ['posts_post'])
+        self.assertIndexedEndpoint(
+            reverse('post-list') + f'?user_id={self.author.id}', ['posts_post']
+        )
+    
+    def test_replies(self):
+        self.assertIndexedEndpoint(reverse('post-replies', args=[self.root.id]), ['posts_post'])
+    
+    def test_likes_and_retweets(self):
+        self.assertIndexedEndpoint(reverse('post-likes', args=[self.root.id]), ['posts_like'])
+        self.assertIndexedEndpoint(reverse('post-retweets', args=[self.root.id]), ['posts_retweet'])
+    
+    @override_settings(FEED_ENGINE='timeline')
+    def test_feed(self):
+        if get_redis_connection() is None:
+            # The query engine merges many authors' ranges, which needs a sort
+            self.skipTest("Materialized timelines need Redis.")
+        self.assertIndexedEndpoint(reverse('post-feed'), ['posts_post'])
+
+
+class FastJSONRendererTests(TestCase):
+    def setUp(self):
+        from direct_messages.models import Conversation, Message
+        from notifications.services import create_notification
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', first_name='Zoë')
+        other = User.objects.create_user(username='writer')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        Follow.objects.create(follower=self.user, following=other)
+        post = Post.objects.create(user=other, content='Ünïcode 😀 "quoted" \\ \u2028 \u2029 \x01 #json @reader')
+        Post.objects.create(user=self.user, content='Reply', is_reply=True, parent=post)
+        create_notification(
+            recipient=self.user, sender=other, notification_type='mention',
+            content_object=post, text='writer mentioned you\u2028'
+        )
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.user, other)
+        Message.objects.create(conversation=conversation, sender=other, content='Hi\tthere')
+    
+    def test_output_matches_json_renderer(self):
+        from rest_framework.renderers import JSONRenderer
+        from mini_twitter.renderers import FastJSONRenderer
+        urls = [
+            reverse('post-feed'), reverse('post-list'), reverse('post-list') + '?entities=1',
+            reverse('notification-list'), reverse('conversation-list'),
+        ]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+            self.assertEqual(response.content, JSONRenderer().render(response.data), url)
+            with override_settings(FAST_JSON_RENDERER=False):
+                self.assertEqual(self.client.get(url).content, response.content, url)
+    
+    def test_native_types_and_fallback(self):
+        import datetime
+        import decimal
+        import uuid
+        from zoneinfo import ZoneInfo
+        from django.utils.translation import gettext_lazy
+        from rest_framework.renderers import JSONRenderer
+        from mini_twitter.renderers import FastJSONRenderer
+        data = {
+            1: 'int key',
+            'aware': datetime.datetime(2024, 1, 2, 3, 4, 5, 6789, tzinfo=datetime.timezone.utc),
+            'offset': datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=ZoneInfo('America/New_York')),
+            'naive': datetime.datetime(2024, 1, 2, 3, 4, 5),
+            'date': datetime.date(2024, 1, 2),
+            'decimal': decimal.Decimal('1.10'),
+            'uuid': uuid.UUID(int=1),
+            'lazy': gettext_lazy('Lazy text'),
+            'duration': datetime.timedelta(seconds=90),
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        # Beyond orjson's 64-bit integers, the stdlib encoder takes over
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+        self.assertEqual(FastJSONRenderer().render(None), b'')
@@ -0,0 +1,299 @@
+"""
+Materialized home timelines (fan-out on write).
+
+Every user's home timeline is a Redis sorted set of post IDs scored by the
+post's creation timestamp and capped to FEED_TIMELINE_MAX_LENGTH entries.
+New posts are pushed to the timelines of the author's followers by a Celery
+task. Authors above FEED_FANOUT_FOLLOWER_THRESHOLD followers are skipped at
+write time and their posts are merged into the timeline when it is read.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+
+from users.models import Follow, Profile
+from .models import Mention, Post
+
+TIMELINE_KEY = 'timeline:{user_id}'
+TIMELINE_READY_KEY = 'timeline:{user_id}:ready'
+
+
+def timeline_key(user_id):
+    return TIMELINE_KEY.format(user_id=user_id)
+
+
+def timeline_ready_key(user_id):
+    return TIMELINE_READY_KEY.format(user_id=user_id)
+
+
+def post_score(post):
+    return post.created_at.timestamp()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def is_celebrity(user_id):
+    followers_count = Profile.objects.filter(user_id=user_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    return (followers_count or 0) >= settings.FEED_FANOUT_FOLLOWER_THRESHOLD
+
+
+def followed_celebrity_ids(user_id):
+    return list(Follow.objects.filter(
+        follower_id=user_id,
+        following__profile__followers_count__gte=settings.FEED_FANOUT_FOLLOWER_THRESHOLD
+    ).values_list('following_id', flat=True))
+
+
+def push_entries(redis, user_ids, entries):
+    """
+    Add (post_id, score) entries to the timelines of the given users and trim
+    each timeline back to its maximum length, in one pipelined round trip.
+    """
+    max_length = settings.FEED_TIMELINE_MAX_LENGTH
+    mapping = {str(post_id): score for post_id, score in entries}
+    if not mapping:
+        return
+    pipe = redis.pipeline(transaction=False)
+    for user_id in user_ids:
+        key = timeline_key(user_id)
+        pipe.zadd(key, mapping)
+        pipe.zremrangebyrank(key, 0, -(max_length + 1))
+        pipe.expire(key, settings.FEED_TIMELINE_TTL)
+    pipe.execute()
+
+
+def remove_entries(redis, user_ids, post_ids):
+    members = [str(post_id) for post_id in post_ids]
+    if not members:
+        return
+    pipe = redis.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.zrem(timeline_key(user_id), *members)
+    pipe.execute()
+
+
+def fanout(redis, post):
+    """
+    Push a new post to every timeline it belongs in: the author's own,
+    the mentioned users' and, unless the author is a celebrity, all followers'.
+    Returns the number of timelines written.
+    """
+    entries = [(post.id, post_score(post))]
+    recipients = {post.user_id}
+    recipients.update(post.mentions.values_list('user_id', flat=True))
+    push_entries(redis, recipients, entries)
+    delivered = len(recipients)
+
+    if is_celebrity(post.user_id):
+        return delivered
+
+    batch_size = settings.FEED_FANOUT_BATCH_SIZE
+    follower_ids = Follow.objects.filter(following_id=post.user_id).exclude(
+        follower_id__in=recipients
+    ).values_list('follower_id', flat=True).iterator(chunk_size=batch_size)
+    for batch in chunked(follower_ids, batch_size):
+        push_entries(redis, batch, entries)
+        delivered += len(batch)
+    return delivered
+
+
+def fanout_many(redis, posts):
+    """
+    Fan out a batch of posts (e.g. from a bulk import) with one pass over
+    each author's followers. Returns the number of timeline writes.
+    """
+    entries_by_author = {}
+    for post in posts:
+        entries_by_author.setdefault(post.user_id, []).append((post.id, post_score(post)))
+    scores = {post.id: post_score(post) for post in posts}
+
+    delivered = 0
+    mentions = Mention.objects.filter(post_id__in=scores).values_list('user_id', 'post_id')
+    entries_by_mentioned = {}
+    for user_id, post_id in mentions:
+        entries_by_mentioned.setdefault(user_id, []).append((post_id, scores[post_id]))
+    for user_id, entries in entries_by_mentioned.items():
+        push_entries(redis, [user_id], entries)
+        delivered += len(entries)
+
+    batch_size = settings.FEED_FANOUT_BATCH_SIZE
+    for author_id, entries in entries_by_author.items():
+        push_entries(redis, [author_id], entries)
+        delivered += len(entries)
+        if is_celebrity(author_id):
+            continue
+        follower_ids = Follow.objects.filter(following_id=author_id).values_list(
+            'follower_id', flat=True
+        ).iterator(chunk_size=batch_size)
+        for batch in chunked(follower_ids, batch_size):
+            push_entries(redis, batch, entries)
+            delivered += len(batch) * len(entries)
+    return delivered
+
+
+def retract(redis, post_id, author_id):
+    """
+    Remove a deleted post from the author's and followers' timelines.
+    Stale IDs left anywhere else are dropped when the timeline is hydrated.
+    """
+    remove_entries(redis, [author_id], [post_id])
+    batch_size = settings.FEED_FANOUT_BATCH_SIZE
+    follower_ids = Follow.objects.filter(following_id=author_id).values_list(
+        'follower_id', flat=True
+    ).iterator(chunk_size=batch_size)
+    for batch in chunked(follower_ids, batch_size):
+        remove_entries(redis, batch, [post_id])
+
+
+def merge_author(redis, user_id, author_id):
+    """Backfill a newly followed author's recent posts into a user's timeline."""
+    if not redis.exists(timeline_ready_key(user_id)) or is_celebrity(author_id):
+        return
+    entries = [
+        (post_id, created_at.timestamp())
+        for post_id, created_at in Post.objects.filter(user_id=author_id).values_list(
+            'id', 'created_at'
+        )[:settings.FEED_TIMELINE_MAX_LENGTH]
+    ]
+    push_entries(redis, [user_id], entries)
+
+
+def purge_author(redis, user_id, author_id):
+    """Remove an unfollowed author's posts, keeping those that mention the user."""
+    post_ids = Post.objects.filter(user_id=author_id).exclude(
+        mentions__user_id=user_id
+    ).values_list('id', flat=True)[:settings.FEED_TIMELINE_MAX_LENGTH]
+    remove_entries(redis, [user_id], list(post_ids))
+
+
+def rebuild(redis, user_id):
+    """
+    Materialize a timeline from the database. Used for users whose timeline
+    was never built or has expired.
+    """
+    celebrity_ids = set(followed_celebrity_ids(user_id))
+    following_ids = [
+        following_id for following_id in Follow.objects.filter(
+            follower_id=user_id
+        ).values_list('following_id', flat=True)
+        if following_id not in celebrity_ids
+    ]
+    rows = Post.objects.filter(
+        Q(user_id__in=following_ids + [user_id]) |
+        Q(mentions__user_id=user_id)
+    ).distinct().order_by('-created_at').values_list(
+        'id', 'created_at'
+    )[:settings.FEED_TIMELINE_MAX_LENGTH]
+
+    key = timeline_key(user_id)
+    pipe = redis.pipeline()
+    pipe.delete(key)
+    mapping = {str(post_id): created_at.timestamp() for post_id, created_at in rows}
+    if mapping:
+        pipe.zadd(key, mapping)
+        pipe.expire(key, settings.FEED_TIMELINE_TTL)
+    pipe.set(timeline_ready_key(user_id), 1, ex=settings.FEED_TIMELINE_TTL)
+    pipe.execute()
+
+
+def hydrate(post_ids, queryset=None):
+    """Load posts for an ordered list of IDs, preserving order and skipping deleted ones."""
+    queryset = queryset if queryset is not None else Post.objects.for_rendering()
+    posts = queryset.in_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+
+class HomeTimeline:
+    """
+    Keyset-paginated view over a user's materialized timeline.
+
+    Exposes ``keyset_page`` so it can be handed to ``KeysetPagination`` in
+    place of a queryset. Celebrity posts are merged in on read.
+    """
+
+    def __init__(self, redis, user):
+        self.redis = redis
+        self.user = user
+        self._celebrity_ids = None
+        self._ensure_materialized()
+
+    def _ensure_materialized(self):
+        user_id = self.user.id
+        if not self.redis.exists(timeline_ready_key(user_id)):
+            rebuild(self.redis, user_id)
+
+    @property
+    def celebrity_ids(self):
+        if self._celebrity_ids is None:
+            self._celebrity_ids = followed_celebrity_ids(self.user.id)
+        return self._celebrity_ids
+
+    def _timeline_entries(self, position, reverse, limit):
+        key = timeline_key(self.user.id)
+        if position is None:
+            members = self.redis.zrevrange(key, 0, limit - 1, withscores=True)
+            return [(int(member), score) for member, score in members]
+
+        created_at, pk = position
+        score = created_at.timestamp()
+        # Entries sharing the cursor's score are filtered by ID below, so
+        # over-fetch by the number of ties.
+        ties = self.redis.zcount(key, score, score)
+        if reverse:
+            members = self.redis.zrangebyscore(
+                key, score, '+inf', start=0, num=limit + ties, withscores=True
+            )
+            entries = [(int(member), s) for member, s in members]
+            entries = [(i, s) for i, s in entries if s > score or i > pk]
+        else:
+            members = self.redis.zrevrangebyscore(
+                key, score, '-inf', start=0, num=limit + ties, withscores=True
+            )
+            entries = [(int(member), s) for member, s in members]
+            entries = [(i, s) for i, s in entries if s < score or i < pk]
+        return entries[:limit]
+
+    def _celebrity_entries(self, position, reverse, limit):
+        if not self.celebrity_ids:
+            return []
+        queryset = Post.objects.filter(user_id__in=self.celebrity_ids)
+        if reverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+        if position is not None:
+            created_at, pk = position
+            op = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'created_at__{op}': created_at}) | Q(created_at=created_at, **{f'id__{op}': pk})
+            )
+        return [
+            (post_id, created_at.timestamp())
+            for post_id, created_at in queryset.values_list('id', 'created_at')[:limit]
+        ]
+
+    def page_ids(self, position=None, reverse=False, limit=20):
+        """
+        Return up to ``limit`` post IDs past ``position`` in traversal order:
+        newest first, or oldest first when walking backwards (``reverse``).
+        """
+        entries = dict(self._timeline_entries(position, reverse, limit))
+        entries.update(self._celebrity_entries(position, reverse, limit))
+        ordered = sorted(entries.items(), key=lambda item: (item[1], item[0]), reverse=not reverse)
+        return [post_id for post_id, score in ordered[:limit]]
+
+    def keyset_page(self, position, reverse, limit):
+        return hydrate(self.page_ids(position, reverse, limit))
+
+    def __iter__(self):
+        return iter(self.keyset_page(None, False, settings.FEED_TIMELINE_MAX_LENGTH))
@@ -0,0 +1,152 @@
+"""
+Sliding-window trending hashtags.
+
+Every new post bumps per-hashtag counters in an hourly Redis bucket
+(a hash of hashtag ID -> uses). A periodic Celery task reads the buckets of
+the last TRENDING_WINDOW_HOURS hours, scores each hashtag as the sum of its
+hourly counts weighted by TRENDING_DECAY ** age_in_hours, and stores the
+serialized top TRENDING_TOP_N in the cache, so the endpoint is a single
+cache read.
+
+Without Redis, the top hashtags are counted from the database over the same
+window (without decay).
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from mini_twitter.utils import get_redis_connection
+from .models import Hashtag
+
+BUCKET_KEY = 'trending:hour:{hour}'
+TRENDING_KEY = 'trending_hashtags'
+
+
+def current_hour(now=None):
+    return int((now if now is not None else time.time()) // 3600)
+
+
+def bucket_key(hour):
+    return BUCKET_KEY.format(hour=hour)
+
+
+def record_hashtags(hashtag_ids, now=None):
+    """Count one use of each hashtag in the current hourly bucket."""
+    redis = get_redis_connection()
+    if redis is None or not hashtag_ids:
+        return
+    key = bucket_key(current_hour(now))
+    pipe = redis.pipeline(transaction=False)
+    for hashtag_id in hashtag_ids:
+        pipe.hincrby(key, hashtag_id, 1)
+    pipe.expire(key, (settings.TRENDING_WINDOW_HOURS + 1) * 3600)
+    pipe.execute()
+
+
+def record_hashtag_counts(counts, now=None):
+    """
+    Add pre-aggregated uses, {hour: {hashtag_id: count}}, e.g. for posts
+    generated with past timestamps. Hours outside the window are skipped.
+    """
+    redis = get_redis_connection()
+    if redis is None:
+        return
+    oldest = current_hour(now) - settings.TRENDING_WINDOW_HOURS
+    pipe = redis.pipeline(transaction=False)
+    for hour, hashtag_counts in counts.items():
+        if hour <= oldest or not hashtag_counts:
+            continue
+        key = bucket_key(hour)
+        for hashtag_id, count in hashtag_counts.items():
+            pipe.hincrby(key, hashtag_id, count)
+        pipe.expire(key, (settings.TRENDING_WINDOW_HOURS + 1) * 3600)
+    pipe.execute()
+
+
+def decayed_scores(buckets, decay):
+    """
+    Score hashtags from hourly buckets, newest first (``buckets[age]`` maps
+    hashtag ID -> count). The bucket matrix is kept in coordinate form
+    (age, hashtag, count) so the weighted sum is a single bincount.
+    Returns (hashtag_ids, scores) as arrays.
+    """
+    sizes = [len(bucket) for bucket in buckets]
+    total = sum(sizes)
+    if not total:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    ids = np.fromiter(
+        (int(hashtag_id) for bucket in buckets for hashtag_id in bucket),
+        dtype=np.int64, count=total
+    )
+    counts = np.fromiter(
+        (int(count) for bucket in buckets for count in bucket.values()),
+        dtype=np.float64, count=total
+    )
+    ages = np.repeat(np.arange(len(buckets)), sizes)
+
+    hashtag_ids, columns = np.unique(ids, return_inverse=True)
+    weights = np.power(decay, ages) * counts
+    return hashtag_ids, np.bincount(columns, weights=weights, minlength=len(hashtag_ids))
+
+
+def top_hashtag_ids(hashtag_ids, scores, limit):
+    """Return up to ``limit`` hashtag IDs by descending score (ties broken by ID)."""
+    if not len(hashtag_ids):
+        return []
+    if len(hashtag_ids) > limit:
+        candidates = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        candidates = np.arange(len(hashtag_ids))
+    order = np.lexsort((hashtag_ids[candidates], -scores[candidates]))
+    return [int(hashtag_id) for hashtag_id in hashtag_ids[candidates][order]]
+
+
+def _redis_top_ids(redis, limit, now=None):
+    hour = current_hour(now)
+    pipe = redis.pipeline(transaction=False)
+    for age in range(settings.TRENDING_WINDOW_HOURS):
+        pipe.hgetall(bucket_key(hour - age))
+    hashtag_ids, scores = decayed_scores(pipe.execute(), settings.TRENDING_DECAY)
+    return top_hashtag_ids(hashtag_ids, scores, limit)
+
+
+def _database_top_ids(limit):
+    since = timezone.now() - timedelta(hours=settings.TRENDING_WINDOW_HOURS)
+    return list(
+        Hashtag.objects.filter(posts__post__created_at__gte=since)
+        .annotate(recent_count=Count('posts'))
+        .order_by('-recent_count', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def refresh_trending(now=None):
+    """Recompute the top hashtags and cache their serialized form."""
+    from .serializers import HashtagSerializer
+
+    limit = settings.TRENDING_TOP_N
+    redis = get_redis_connection()
+    if redis is not None:
+        top_ids = _redis_top_ids(redis, limit, now)
+    else:
+        top_ids = _database_top_ids(limit)
+
+    hashtags = Hashtag.objects.in_bulk(top_ids)
+    data = HashtagSerializer(
+        [hashtags[hashtag_id] for hashtag_id in top_ids if hashtag_id in hashtags], many=True
+    ).data
+    cache.set(TRENDING_KEY, data, settings.TRENDING_CACHE_TIMEOUT)
+    return data
+
+
+def get_trending():
+    data = cache.get(TRENDING_KEY)
+    if data is None:
+        data = refresh_trending()
+    return data
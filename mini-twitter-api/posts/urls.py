@@ -12,7 +12,8 @@ retweets_router = DefaultRouter()
 retweets_router.register(r'', RetweetViewSet)
 
 urlpatterns = [
-    path('', include(router.urls)),
+    # Before the post routes, whose <pk>/ pattern would match 'likes/' and 'retweets/'
     path('likes/', include(likes_router.urls)),
     path('retweets/', include(retweets_router.urls)),
+    path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,15 +1,31 @@
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.db import transaction
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.parsers import JSONParser
 from django.core.cache import cache
+from django.conf import settings
 from django.db.models import Q, Count
-from rest_framework.exceptions import PermissionDenied
-from .models import Post, Like, Hashtag, PostHashtag, Retweet, Mention
-from .serializers import PostSerializer, LikeSerializer, HashtagSerializer, RetweetSerializer
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from .models import Post, Like, PostHashtag, Retweet, Mention
+from .serializers import (
+    PostSerializer, LikeSerializer, RetweetSerializer, resolve_viewer_state
+)
+from .counters import incr_counter, pending_counters
+from .feeds import get_home_feed
+from .feed_cache import feed_page_key, get_feed_version
+from .timeline import hydrate
+from .trending import get_trending
+from .search import filter_posts, search_posts
+from .autocomplete import matching_hashtags, matching_users, suggest_hashtags, suggest_users
+from .ingest import IngestError, ingest_posts
+from .parsers import NDJSONParser
+from .likes import LikeError, like_post, unlike_post
+from .retweets import RetweetError, create_retweet, delete_retweet
+from mini_twitter.fieldsets import Fieldset
+from mini_twitter.pagination import RankedKeysetPagination
+from mini_twitter.renderers import FAST_RENDERER_CLASSES
 from users.models import Follow
-from django.contrib.auth.models import User
 from users.serializers import UserSerializer
 from datetime import timedelta
 from django.utils import timezone
@@ -25,16 +41,52 @@ except ImportError:
         pass
 
 class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all()
+    queryset = Post.objects.for_serialization()
     serializer_class = PostSerializer
+    renderer_classes = FAST_RENDERER_CLASSES
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve', 'search', 'trending_hashtags']:
+        if self.action in ['list', 'retrieve', 'search', 'autocomplete', 'trending_hashtags']:
             return [AllowAny()]
+        if self.action == 'bulk':
+            return [IsAdminUser()]
         return [IsAuthenticated()]
     
+    def get_serializer(self, *args, **kwargs):
+        """
+        Resolve the viewer's like/retweet state for every post being
+        serialized (including nested retweeted and parent posts) up front,
+        instead of two queries per post in PostSerializer, along with any
+        counter deltas not yet flushed to the database.
+        """
+        serializer_class = self.get_serializer_class()
+        kwargs.setdefault('context', self.get_serializer_context())
+        if args and args[0] is not None and issubclass(serializer_class, PostSerializer):
+            posts = args[0] if kwargs.get('many') else [args[0]]
+            fieldset = kwargs['context'].get('fieldset', Fieldset.from_request(self.request))
+            viewer_state = resolve_viewer_state(self.request.user, posts, fieldset)
+            kwargs['context'] = {
+                **kwargs['context'],
+                **viewer_state,
+                'pending_counters': pending_counters(viewer_state['viewer_post_ids'])
+            }
+        return serializer_class(*args, **kwargs)
+    
+    def get_paginated_response(self, data):
+        # Normalized pages (?entities=1) carry their posts and users next to the ordered IDs
+        if isinstance(data, dict):
+            response = super().get_paginated_response(data['results'])
+            response.data.update(data)
+            return response
+        return super().get_paginated_response(data)
+    
     def get_queryset(self):
-        queryset = super().get_queryset()
+        if self.action in ('like', 'unlike', 'retweet', 'unretweet', 'likes', 'retweets', 'replies'):
+            # These actions only need the post row itself, not its serialization graph
+            return Post.objects.all()
+        
+        # Lists are rendered from cached snapshots and only need light rows
+        queryset = Post.objects.for_rendering() if self.action == 'list' else super().get_queryset()
         
         # Filter by user if specified
         user_id = self.request.query_params.get('user_id')
@@ -60,53 +112,53 @@ class PostViewSet(viewsets.ModelViewSet):
         elif post_type == 'replies':
             queryset = queryset.filter(is_reply=True)
         
-        # Search functionality
+        # Search functionality: matching posts, or posts by authors whose
+        # username starts with the term (an indexed prefix match, see
+        # users/migrations/0005_username_prefix_index.py)
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(content__icontains=search) | 
-                Q(user__username__icontains=search)
-            )
+            queryset = filter_posts(queryset, search) | queryset.filter(user__username__istartswith=search)
         
         return queryset
     
     def perform_create(self, serializer):
+        # A post with an original_post is a retweet; it goes through the
+        # same path as the retweet action and keeps no content of its own
+        original_post_id = self.request.data.get('original_post')
+        if original_post_id is not None:
+            try:
+                original_post = Post.objects.select_related('user').get(pk=original_post_id)
+            except (Post.DoesNotExist, ValueError):
+                raise ValidationError({"original_post": "Original post does not exist."})
+            try:
+                serializer.instance = create_retweet(self.request.user, original_post)
+            except RetweetError as exc:
+                raise ValidationError({"original_post": str(exc)})
+            return
+        
         # Check if this is a reply
         parent_id = self.request.data.get('parent')
         is_reply = parent_id is not None
         
-        # Check if this is a retweet
-        original_post_id = self.request.data.get('original_post')
-        is_retweet = original_post_id is not None
-        
         parent = None
-        original_post = None
         
         if is_reply:
             try:
                 parent = Post.objects.get(pk=parent_id)
             except Post.DoesNotExist:
-                raise serializers.ValidationError({"parent": "Parent post does not exist."})
-        
-        if is_retweet:
-            try:
-                original_post = Post.objects.get(pk=original_post_id)
-            except Post.DoesNotExist:
-                raise serializers.ValidationError({"original_post": "Original post does not exist."})
+                raise ValidationError({"parent": "Parent post does not exist."})
         
         post = serializer.save(
             user=self.request.user,
             is_reply=is_reply,
             parent=parent,
-            is_retweet=is_retweet,
-            original_post=original_post
+            is_retweet=False,
+            original_post=None
         )
         
         # Update reply count on parent post
         if is_reply and parent:
-            with transaction.atomic():
-                parent.replies_count += 1
-                parent.save()
+            incr_counter(parent.id, 'replies_count', 1)
             
             # Create notification for reply
             if NOTIFICATIONS_ENABLED and parent.user != self.request.user:
@@ -118,24 +170,6 @@ class PostViewSet(viewsets.ModelViewSet):
                     text=f"{self.request.user.username} replied to your post."
                 )
         
-        # Create retweet record and update retweet count
-        if is_retweet and original_post:
-            Retweet.objects.create(user=self.request.user, post=original_post)
-            
-            with transaction.atomic():
-                original_post.retweets_count += 1
-                original_post.save()
-            
-            # Create notification for retweet
-            if NOTIFICATIONS_ENABLED and original_post.user != self.request.user:
-                create_notification(
-                    recipient=original_post.user,
-                    sender=self.request.user,
-                    notification_type='retweet',
-                    content_object=post,
-                    text=f"{self.request.user.username} retweeted your post."
-                )
-        
         # Create notifications for mentions
         if NOTIFICATIONS_ENABLED:
             for mention in post.mentions.all():
@@ -166,129 +200,57 @@ class PostViewSet(viewsets.ModelViewSet):
         if instance.user != self.request.user:
             raise PermissionDenied("You do not have permission to delete this post.")
         
-        # If this is a reply, update the parent's reply count
-        if instance.is_reply and instance.parent:
-            with transaction.atomic():
-                instance.parent.replies_count -= 1
-                instance.parent.save()
+        # Deleting a retweet undoes it, Retweet row and counter included
+        if instance.is_retweet and instance.original_post_id:
+            try:
+                delete_retweet(instance.user_id, instance.original_post_id)
+                return
+            except RetweetError:
+                # A retweet post without a Retweet row was never counted
+                pass
         
-        # If this is a retweet, update the original post's retweet count
-        if instance.is_retweet and instance.original_post:
-            with transaction.atomic():
-                instance.original_post.retweets_count -= 1
-                instance.original_post.save()
+        # If this is a reply, update the parent's reply count
+        if instance.is_reply and instance.parent_id:
+            incr_counter(instance.parent_id, 'replies_count', -1)
         
         instance.delete()
     
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         post = self.get_object()
-        user = request.user
-        
-        like, created = Like.objects.get_or_create(
-            user=user,
-            post=post
-        )
         
-        if created:
-            # Update likes count
-            with transaction.atomic():
-                post.likes_count += 1
-                post.save()
-            
-            # Invalidate cache
-            cache.delete(f'feed_{user.id}')
-            
-            # Create notification (only if the post is not by the current user)
-            if NOTIFICATIONS_ENABLED and post.user != user:
-                create_notification(
-                    recipient=post.user,
-                    sender=user,
-                    notification_type='like',
-                    content_object=like,
-                    text=f"{user.username} liked your post."
-                )
-            
-            return Response(
-                {"detail": "Post liked successfully."},
-                status=status.HTTP_201_CREATED
-            )
+        try:
+            like_post(request.user, post)
+        except LikeError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_200_OK)
         
         return Response(
-            {"detail": "You have already liked this post."},
-            status=status.HTTP_200_OK
+            {"detail": "Post liked successfully."},
+            status=status.HTTP_201_CREATED
         )
     
     @action(detail=True, methods=['post'])
     def unlike(self, request, pk=None):
         post = self.get_object()
-        user = request.user
         
         try:
-            like = Like.objects.get(
-                user=user,
-                post=post
-            )
-            like.delete()
-            
-            # Update likes count
-            with transaction.atomic():
-                post.likes_count -= 1
-                post.save()
-            
-            # Invalidate cache
-            cache.delete(f'feed_{user.id}')
-            
-            return Response(
-                {"detail": "Post unliked successfully."},
-                status=status.HTTP_200_OK
-            )
-        except Like.DoesNotExist:
-            return Response(
-                {"detail": "You have not liked this post."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            unlike_post(request.user.id, post.id)
+        except LikeError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(
+            {"detail": "Post unliked successfully."},
+            status=status.HTTP_200_OK
+        )
     
     @action(detail=True, methods=['post'])
     def retweet(self, request, pk=None):
         post = self.get_object()
-        user = request.user
         
-        # Check if user has already retweeted this post
-        if Retweet.objects.filter(user=user, post=post).exists():
-            return Response(
-                {"detail": "You have already retweeted this post."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Create a new post that is a retweet
-        retweet_post = Post.objects.create(
-            user=user,
-            content="",  # Retweets don't have their own content
-            is_retweet=True,
-            original_post=post
-        )
-        
-        # Create the retweet record
-        Retweet.objects.create(user=user, post=post)
-        
-        # Update retweet count
-        with transaction.atomic():
-            post.retweets_count += 1
-            post.save()
-        
-        # Invalidate cache
-        cache.delete(f'feed_{user.id}')
-        
-        # Create notification
-        if NOTIFICATIONS_ENABLED and post.user != user:
-            create_notification(
-                recipient=post.user,
-                sender=user,
-                notification_type='retweet',
-                content_object=retweet_post,
-                text=f"{user.username} retweeted your post."
-            )
+        try:
+            create_retweet(request.user, post)
+        except RetweetError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(
             {"detail": "Post retweeted successfully."},
@@ -297,75 +259,51 @@ class PostViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def unretweet(self, request, pk=None):
-        post = self.get_object()
-        user = request.user
-        
+        # Only the ID is needed; a missing post has no retweet to undo
         try:
-            # Find the retweet record
-            retweet = Retweet.objects.get(user=user, post=post)
-            
-            # Find the retweet post
-            retweet_post = Post.objects.filter(
-                user=user,
-                is_retweet=True,
-                original_post=post
-            ).first()
-            
-            if retweet_post:
-                retweet_post.delete()
-            
-            retweet.delete()
-            
-            # Update retweet count
-            with transaction.atomic():
-                post.retweets_count -= 1
-                post.save()
-            
-            # Invalidate cache
-            cache.delete(f'feed_{user.id}')
-            
-            return Response(
-                {"detail": "Post unretweeted successfully."},
-                status=status.HTTP_200_OK
-            )
-        except Retweet.DoesNotExist:
-            return Response(
-                {"detail": "You have not retweeted this post."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            delete_retweet(request.user.id, int(pk))
+        except ValueError:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        except RetweetError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(
+            {"detail": "Post unretweeted successfully."},
+            status=status.HTTP_200_OK
+        )
     
     @action(detail=True, methods=['get'])
     def likes(self, request, pk=None):
         post = self.get_object()
-        likes = Like.objects.filter(post=post)
-        users = User.objects.filter(likes__post=post)
+        likes = Like.objects.filter(post=post).select_related('user__profile')
         
-        page = self.paginate_queryset(users)
+        # Paginate the Like rows so the cursor follows when each user liked
+        page = self.paginate_queryset(likes)
         if page is not None:
-            serializer = UserSerializer(page, many=True)
+            serializer = UserSerializer([like.user for like in page], many=True, context={'request': request})
             return self.get_paginated_response(serializer.data)
         
-        serializer = UserSerializer(users, many=True)
+        serializer = UserSerializer([like.user for like in likes], many=True, context={'request': request})
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def retweets(self, request, pk=None):
         post = self.get_object()
-        retweets = Retweet.objects.filter(post=post)
-        users = User.objects.filter(retweets__post=post)
+        retweets = Retweet.objects.filter(post=post).select_related('user__profile')
         
-        page = self.paginate_queryset(users)
+        # Paginate the Retweet rows so the cursor follows when each user retweeted
+        page = self.paginate_queryset(retweets)
         if page is not None:
-            serializer = UserSerializer(page, many=True)
+            serializer = UserSerializer([retweet.user for retweet in page], many=True, context={'request': request})
             return self.get_paginated_response(serializer.data)
         
-        serializer = UserSerializer(users, many=True)
+        serializer = UserSerializer([retweet.user for retweet in retweets], many=True, context={'request': request})
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def replies(self, request, pk=None):
         post = self.get_object()
-        replies = Post.objects.filter(parent=post, is_reply=True)
+        replies = Post.objects.for_rendering().filter(parent=post, is_reply=True)
         
         page = self.paginate_queryset(replies)
         if page is not None:
@@ -379,35 +317,62 @@ class PostViewSet(viewsets.ModelViewSet):
     def feed(self, request):
         user = request.user
         
-        # Try to get feed from cache
-        cached_feed = cache.get(f'feed_{user.id}')
-        if cached_feed:
-            return Response(cached_feed)
-        
-        # Get IDs of users that the current user follows
-        following_ids = Follow.objects.filter(follower=user).values_list('following_id', flat=True)
-        
-        # Include the user's own posts in the feed
-        following_ids = list(following_ids) + [user.id]
-        
-        # Get posts from followed users and the user's own posts
-        posts = Post.objects.filter(
-            Q(user_id__in=following_ids) |  # Posts from followed users
-            Q(mentions__user=user)  # Posts where the user is mentioned
-        ).distinct().order_by('-created_at')
-        
-        page = self.paginate_queryset(posts)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
+        # Try to get this page's post IDs and links from cache; the key embeds
+        # the user's feed version, which is bumped whenever the feed changes.
+        # Posts are rendered on every read, so counters and viewer state are live
+        cache_key = feed_page_key(user.id, get_feed_version(user.id), request.query_params)
+        cached_page = cache.get(cache_key)
+        if cached_page is not None:
+            posts = hydrate(cached_page['post_ids'])
+            links = cached_page['links']
+        else:
+            # Read the user's home feed from the configured feed engine
+            posts = get_home_feed(user)
+            page = self.paginate_queryset(posts)
+            if page is not None:
+                posts = page
+                links = {
+                    'next': self.paginator.get_next_link(),
+                    'previous': self.paginator.get_previous_link(),
+                }
+            else:
+                posts = list(posts)
+                links = None
+            cached_page = {'post_ids': [post.id for post in posts], 'links': links}
+            cache.set(cache_key, cached_page, settings.FEED_CACHE_TIMEOUT)
         
         serializer = self.get_serializer(posts, many=True, context={'request': request})
+        data = serializer.data
+        if links is None:
+            return Response(data)
+        # Normalized pages (?entities=1) carry their posts and users next to the ordered IDs
+        return Response({**links, **data} if isinstance(data, dict) else {**links, 'results': data})
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Import many posts at once (staff only). Accepts a JSON list (or
+        {"posts": [...]}) or NDJSON; see posts.ingest for the record format.
+        """
+        records = request.data.get('posts') if isinstance(request.data, dict) else request.data
+        if not isinstance(records, list) or not records:
+            return Response(
+                {"detail": "Expected a non-empty list of posts."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(records) > settings.POST_INGEST_MAX_RECORDS:
+            return Response(
+                {"detail": f"At most {settings.POST_INGEST_MAX_RECORDS} posts per request."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Cache the feed for 5 minutes
-        cache.set(f'feed_{user.id}', serializer.data, 300)
+        try:
+            report = ingest_posts(records)
+        except IngestError as exc:
+            return Response({"errors": exc.errors}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(serializer.data)
-
+        return Response(report, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['get'])
     def search(self, request):
         search_query = request.query_params.get('q', '')
@@ -420,67 +385,114 @@ class PostViewSet(viewsets.ModelViewSet):
         # Check if it's a hashtag search
         if search_query.startswith('#'):
             hashtag = search_query[1:]  # Remove the # symbol
-            posts = Post.objects.filter(hashtags__hashtag__name__iexact=hashtag)
-            posts_serializer = self.get_serializer(posts, many=True, context={'request': request})
+            posts = Post.objects.for_rendering().filter(hashtags__hashtag__name__iexact=hashtag)
+            paginator = self.paginator
+            page = paginator.paginate_queryset(posts, request, view=self)
+            posts_serializer = self.get_serializer(page, many=True, context={'request': request, 'entities': False})
         
             return Response({
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
                 'posts': posts_serializer.data,
                 'users': [],
                 'hashtag': hashtag
             })
     
         # Regular search
-        # Search in posts content
-        posts = Post.objects.filter(content__icontains=search_query)
-        posts_serializer = self.get_serializer(posts, many=True, context={'request': request})
+        # Full-text search in posts content, best matches first
+        paginator = RankedKeysetPagination()
+        page = paginator.paginate_queryset(search_posts(search_query), request, view=self)
+        # Search responses have their own users key, so they are never normalized
+        posts_serializer = self.get_serializer(page, many=True, context={'request': request, 'entities': False})
     
-        # Search in usernames (limited to 5 results)
-        users = User.objects.filter(username__icontains=search_query)[:5]
-        users_serializer = UserSerializer(users, many=True)
-    
-        # Search in hashtags (limited to 5 results)
-        hashtags = Hashtag.objects.filter(name__icontains=search_query)[:5]
-        hashtags_serializer = HashtagSerializer(hashtags, many=True)
+        # Users and hashtags starting with the query (5 of each), from the
+        # autocomplete indexes rather than a scan per keystroke
+        users_serializer = UserSerializer(matching_users(search_query, 5), many=True)
     
         return Response({
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
             'posts': posts_serializer.data,
             'users': users_serializer.data,
-            'hashtags': hashtags_serializer.data
+            'hashtags': matching_hashtags(search_query, 5)
         })
     
     @action(detail=False, methods=['get'])
-    def trending_hashtags(self, request):
-        # Get hashtags used in the last 7 days
-        last_week = timezone.now() - timedelta(days=7)
+    def autocomplete(self, request):
+        """
+        Typeahead suggestions for usernames and hashtags starting with ``q``,
+        served from in-process indexes. A leading '@' or '#' restricts the
+        suggestions to users or hashtags.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"detail": "Query parameter 'q' is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Get trending hashtags based on post count
-        trending_hashtags = Hashtag.objects.filter(
-            posts__post__created_at__gte=last_week
-        ).annotate(
-            recent_count=Count('posts')
-        ).order_by('-recent_count')[:10]
+        try:
+            limit = int(request.query_params.get('limit', settings.AUTOCOMPLETE_MAX_RESULTS))
+        except ValueError:
+            limit = settings.AUTOCOMPLETE_MAX_RESULTS
+        limit = max(1, min(limit, settings.AUTOCOMPLETE_MAX_RESULTS))
         
-        serializer = HashtagSerializer(trending_hashtags, many=True)
-        return Response(serializer.data)
+        prefix = query.lstrip('@#')
+        return Response({
+            'users': suggest_users(prefix, limit) if not query.startswith('#') else [],
+            'hashtags': suggest_hashtags(prefix, limit) if not query.startswith('@') else [],
+        })
+    
+    @action(detail=False, methods=['get'])
+    def trending_hashtags(self, request):
+        # Served from the top hashtags precomputed by a periodic task
+        return Response(get_trending())
 
 class LikeViewSet(viewsets.ModelViewSet):
     queryset = Like.objects.all()
     serializer_class = LikeSerializer
     permission_classes = [IsAuthenticated]
+    # Likes are created and removed, never edited
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
     
     def get_queryset(self):
         return Like.objects.filter(user=self.request.user)
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        try:
+            serializer.instance = like_post(self.request.user, serializer.validated_data['post'])
+        except LikeError as exc:
+            raise ValidationError({"post": str(exc)})
+    
+    def perform_destroy(self, instance):
+        try:
+            unlike_post(instance.user_id, instance.post_id)
+        except LikeError:
+            # Already removed by a concurrent unlike
+            pass
 
 class RetweetViewSet(viewsets.ModelViewSet):
     queryset = Retweet.objects.all()
     serializer_class = RetweetSerializer
     permission_classes = [IsAuthenticated]
     
+    # Retweets are created and removed, never edited
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+    
     def get_queryset(self):
         return Retweet.objects.filter(user=self.request.user)
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
\ No newline at end of file
+        post = serializer.validated_data['post']
+        try:
+            create_retweet(self.request.user, post)
+        except RetweetError as exc:
+            raise ValidationError({"post": str(exc)})
+        serializer.instance = Retweet.objects.get(user=self.request.user, post=post)
+    
+    def perform_destroy(self, instance):
+        try:
+            delete_retweet(instance.user_id, instance.post_id)
+        except RetweetError:
+            # Already removed by a concurrent unretweet
+            pass
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.db import models
+
+# Directory under MEDIA_ROOT holding the files of upload sessions
+UPLOAD_DIR = 'uploads'
+
+class UploadFile(File):
+    """
+    The file of a finished upload, for assigning to a FileField. Because it
+    has a temporary_file_path, FileSystemStorage moves it into place instead
+    of copying it; other storages read it in chunks.
+    """
+    
+    def temporary_file_path(self):
+        return self.file.name
+
+class Upload(models.Model):
+    """
+    A chunked upload session. Chunks are written at ``offset`` until it
+    reaches ``size``; once finalized, a post or profile can reference the
+    upload by ID, which moves its file into the image field and deletes
+    the session.
+    """
+    PENDING = 'pending'
+    COMPLETE = 'complete'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (COMPLETE, 'Complete'),
+    )
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='upload_updated_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes) by {self.user.username}"
+    
+    @property
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR, str(self.pk))
+    
+    def open(self):
+        return UploadFile(open(self.path, 'rb'), name=self.filename)
+    
+    def delete_file(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+from .models import Upload
+
+class UploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Upload
+        fields = ('id', 'filename', 'size', 'offset', 'status', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'offset', 'status', 'created_at', 'updated_at')
+    
+    def validate_filename(self, value):
+        # Only the base name is kept; the image field decides the directory
+        name = value.replace('\\', '/').rsplit('/', 1)[-1]
+        if not name.strip('.'):
+            raise serializers.ValidationError("Invalid file name.")
+        return name
+    
+    def validate_size(self, value):
+        if value < 1:
+            raise serializers.ValidationError("The file is empty.")
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files may be at most {settings.UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+class UploadField(serializers.PrimaryKeyRelatedField):
+    """A finalized upload of the requesting user, referenced by ID."""
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('write_only', True)
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+    
+    def get_queryset(self):
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return Upload.objects.none()
+        return Upload.objects.filter(user=request.user, status=Upload.COMPLETE)
+
+class UploadReferenceMixin:
+    """
+    Lets a ModelSerializer set file fields from finished uploads.
+    ``upload_fields`` maps the name of an UploadField to the model field it
+    fills. On save each upload is claimed (its session deleted, so it can be
+    used once) and its file moved into the field; the model's own save then
+    handles it like any other new file.
+    """
+    upload_fields = {}
+    
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        for upload_field, field_name in self.upload_fields.items():
+            if attrs.get(upload_field) is not None and field_name in attrs:
+                raise serializers.ValidationError(
+                    {upload_field: f"Send either {field_name} or {upload_field}, not both."}
+                )
+        return attrs
+    
+    def save(self, **kwargs):
+        uploads = [
+            (upload_field, field_name, self.validated_data.pop(upload_field, None))
+            for upload_field, field_name in self.upload_fields.items()
+        ]
+        uploads = [(upload_field, field_name, upload) for upload_field, field_name, upload in uploads if upload]
+        if not uploads:
+            return super().save(**kwargs)
+        
+        files = []
+        try:
+            with transaction.atomic():
+                for upload_field, field_name, upload in uploads:
+                    if not Upload.objects.filter(pk=upload.pk, status=Upload.COMPLETE).delete()[0]:
+                        raise serializers.ValidationError({upload_field: "This upload has already been used."})
+                    files.append(upload.open())
+                    kwargs[field_name] = files[-1]
+                return super().save(**kwargs)
+        finally:
+            for file in files:
+                file.close()
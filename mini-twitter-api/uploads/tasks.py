@@ -0,0 +1,31 @@
+import os
+import time
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from .models import UPLOAD_DIR, Upload
+
+@shared_task
+def delete_expired_uploads():
+    """
+    Delete upload sessions idle for UPLOAD_SESSION_TTL, whether abandoned
+    mid-transfer or finalized and never used, and any file in the upload
+    directory that old without a session (e.g. claimed by a save that
+    failed).
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    expired = list(Upload.objects.filter(updated_at__lt=cutoff))
+    for upload in expired:
+        upload.delete_file()
+    Upload.objects.filter(pk__in=[upload.pk for upload in expired]).delete()
+    
+    directory = os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR)
+    if os.path.isdir(directory):
+        sessions = {str(pk) for pk in Upload.objects.values_list('pk', flat=True)}
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name not in sessions and os.path.getmtime(path) < time.time() - settings.UPLOAD_SESSION_TTL:
+                os.remove(path)
+    return len(expired)
@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+from posts.models import Post
+from .models import Upload
+from .tasks import delete_expired_uploads
+
+class UploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='uploader')
+        self.client.force_authenticate(user=self.user)
+        buffer = BytesIO()
+        Image.effect_noise((300, 200), 64).convert('RGB').save(buffer, format='JPEG')
+        self.content = buffer.getvalue()
+    
+    def start(self, filename='photo.jpg'):
+        response = self.client.post(
+            reverse('upload-list'), {'filename': filename, 'size': len(self.content)}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+    
+    def send(self, upload_id, offset, data):
+        return self.client.patch(
+            reverse('upload-detail', args=[upload_id]), data,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+    
+    def upload(self, filename='photo.jpg'):
+        upload_id = self.start(filename)
+        self.send(upload_id, 0, self.content)
+        response = self.client.post(reverse('upload-finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return upload_id
+    
+    def test_chunks_are_resumable(self):
+        upload_id = self.start('../../photo.jpg')
+        upload = Upload.objects.get()
+        self.assertEqual(upload.filename, 'photo.jpg')
+        half = len(self.content) // 2
+        
+        response = self.send(upload_id, 0, self.content[:half])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Upload-Offset'], str(half))
+        
+        # Finalizing early fails, and a chunk sent at the wrong offset is refused
+        response = self.client.post(reverse('upload-finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.send(upload_id, 0, self.content[half:])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], half)
+        
+        # Resume from the reported offset
+        offset = self.client.get(reverse('upload-detail', args=[upload_id])).data['offset']
+        self.assertEqual(self.send(upload_id, offset, self.content[offset:]).data['offset'], len(self.content))
+        response = self.send(upload_id, len(self.content), b'more')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.post(reverse('upload-finalize', args=[upload_id]))
+        self.assertEqual(response.data['status'], Upload.COMPLETE)
+        with open(upload.path, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+        
+        # Sessions are private
+        other = APIClient()
+        other.force_authenticate(user=User.objects.create_user(username='other'))
+        response = other.get(reverse('upload-detail', args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_limits_and_invalid_files(self):
+        with override_settings(UPLOAD_MAX_SIZE=100):
+            response = self.client.post(
+                reverse('upload-list'), {'filename': 'big.jpg', 'size': 101}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        upload_id = self.start()
+        with override_settings(UPLOAD_CHUNK_MAX_SIZE=10):
+            response = self.send(upload_id, 0, self.content)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        self.content = b'%PDF' + bytes(100)
+        upload_id = self.start('document.jpg')
+        self.send(upload_id, 0, self.content)
+        response = self.client.post(reverse('upload-finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        path = Upload.objects.get(pk=upload_id).path
+        self.client.delete(reverse('upload-detail', args=[upload_id]))
+        self.assertFalse(os.path.exists(path))
+    
+    def test_posts_and_profiles_reference_uploads(self):
+        upload_id = self.upload()
+        path = Upload.objects.get().path
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('post-list'), {'content': 'Uploaded', 'image_upload': upload_id}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('image_upload', response.data)
+        post = Post.objects.get()
+        self.assertRegex(post.image.name, r'^posts/photo_\w+\.jpg$')
+        self.assertEqual((post.image_variants['width'], post.image_variants['height']), (300, 200))
+        # The file was moved into place and the session consumed
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Upload.objects.exists())
+        
+        response = self.client.post(
+            reverse('post-list'), {'content': 'Again', 'image_upload': upload_id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image_upload', response.data)
+        
+        # Pending uploads and other users' uploads cannot be referenced
+        pending_id = self.start()
+        other = User.objects.create_user(username='other')
+        finished = Upload.objects.create(user=other, filename='x.jpg', size=1, offset=1, status=Upload.COMPLETE)
+        for upload_id in (pending_id, finished.id):
+            response = self.client.post(
+                reverse('post-list'), {'content': 'Nope', 'image_upload': upload_id}, format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        avatar_id, header_id = self.upload('me.jpg'), self.upload('header.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('profile-update-my-profile'),
+                {'avatar_upload': avatar_id, 'header_image_upload': header_id}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.profile.refresh_from_db()
+        self.assertRegex(self.user.profile.avatar.name, r'^avatars/me_\w+\.jpg$')
+        self.assertEqual(self.user.profile.header_image_variants['variants']['small']['width'], 600)
+    
+    def test_expired_uploads_are_deleted(self):
+        upload_id = self.start()
+        recent_id = self.start()
+        Upload.objects.filter(pk=upload_id).update(updated_at=timezone.now() - timezone.timedelta(days=2))
+        path = Upload.objects.get(pk=upload_id).path
+        orphan = os.path.join(os.path.dirname(path), '999')
+        open(orphan, 'wb').close()
+        os.utime(orphan, (0, 0))
+        
+        self.assertEqual(delete_expired_uploads(), 1)
+        self.assertEqual(list(Upload.objects.values_list('pk', flat=True)), [recent_id])
+        self.assertFalse(os.path.exists(path) or os.path.exists(orphan))
@@ -0,0 +1,118 @@
+import os
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, UnidentifiedImageError
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from mini_twitter.images import ALLOWED_FORMATS
+from .models import Upload
+from .serializers import UploadSerializer
+
+# Chunks are copied from the request to the file in pieces of this size
+READ_SIZE = 64 * 1024
+
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads:
+
+    1. ``POST /api/uploads/`` with ``filename`` and ``size`` opens a session;
+    2. ``PATCH /api/uploads/<id>/`` with an ``Upload-Offset`` header and the
+       bytes as the raw body appends a chunk. The offset must be the number
+       of bytes received so far, which ``GET /api/uploads/<id>/`` reports
+       for resuming an interrupted upload;
+    3. ``POST /api/uploads/<id>/finalize/`` once all bytes are in.
+
+    Chunks are streamed from the request to ``MEDIA_ROOT/uploads/`` without
+    being held in memory. The finished upload is then referenced by ID from
+    a post's ``image_upload`` or a profile's ``avatar_upload`` and
+    ``header_image_upload``.
+    """
+    serializer_class = UploadSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return Upload.objects.filter(user=self.request.user)
+    
+    def perform_create(self, serializer):
+        upload = serializer.save(user=self.request.user)
+        os.makedirs(os.path.dirname(upload.path), exist_ok=True)
+        open(upload.path, 'wb').close()
+    
+    def perform_destroy(self, instance):
+        instance.delete_file()
+        instance.delete()
+    
+    def partial_update(self, request, *args, **kwargs):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            raise ValidationError({"detail": "An Upload-Offset header and a Content-Length are required."})
+        if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+            raise ValidationError({"detail": f"Chunks may be at most {settings.UPLOAD_CHUNK_MAX_SIZE} bytes."})
+        
+        with transaction.atomic():
+            upload = self.get_queryset().select_for_update().get(pk=self.get_object().pk)
+            if upload.status != Upload.PENDING:
+                raise ValidationError({"detail": "The upload is already finalized."})
+            if offset != upload.offset:
+                # Out of sync (e.g. a chunk was lost): resume from the reported offset
+                return Response(
+                    {"detail": "Upload-Offset does not match the bytes received.", "offset": upload.offset},
+                    status=status.HTTP_409_CONFLICT, headers={'Upload-Offset': str(upload.offset)}
+                )
+            if offset + length > upload.size:
+                raise ValidationError({"detail": "The chunk extends past the declared size."})
+            
+            upload.offset += self.write_chunk(upload, request.stream, length)
+            upload.save(update_fields=['offset', 'updated_at'])
+        
+        return Response(self.get_serializer(upload).data, headers={'Upload-Offset': str(upload.offset)})
+    
+    def write_chunk(self, upload, stream, length):
+        """
+        Copy up to ``length`` bytes from the request into the file at the
+        upload's offset and return how many arrived. Bytes received before
+        the client disconnected are kept, so it can resume after them.
+        """
+        written = 0
+        with open(upload.path, 'r+b') as file:
+            file.seek(upload.offset)
+            try:
+                while stream is not None and written < length:
+                    data = stream.read(min(READ_SIZE, length - written))
+                    if not data:
+                        break
+                    file.write(data)
+                    written += len(data)
+            except OSError:
+                pass
+            # Drop anything past the new offset left by an earlier interrupted write
+            file.truncate()
+        return written
+    
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        with transaction.atomic():
+            upload = self.get_queryset().select_for_update().get(pk=self.get_object().pk)
+            if upload.status == Upload.PENDING:
+                if upload.offset != upload.size:
+                    raise ValidationError(
+                        {"detail": f"The upload is incomplete: {upload.offset} of {upload.size} bytes received."}
+                    )
+                # Only the header is read here; the image is decoded when processed
+                try:
+                    with Image.open(upload.path) as image:
+                        valid = image.format in ALLOWED_FORMATS
+                except (UnidentifiedImageError, OSError):
+                    valid = False
+                if not valid:
+                    raise ValidationError({"detail": "The file is not a supported image."})
+                upload.status = Upload.COMPLETE
+                upload.save(update_fields=['status', 'updated_at'])
+        return Response(self.get_serializer(upload).data)
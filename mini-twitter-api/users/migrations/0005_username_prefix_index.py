@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def create_username_prefix_index(apps, schema_editor):
+    # Serves case-insensitive prefix matches (username__istartswith), which
+    # Django runs as UPPER(username::text) LIKE UPPER(%s)
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX auth_user_username_upper_like ON auth_user (UPPER(username::text) text_pattern_ops)'
+        )
+
+
+def drop_username_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS auth_user_username_upper_like')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0004_profile_avatar_variants_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_username_prefix_index, drop_username_prefix_index),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from mini_twitter.images import track_uploads
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -11,6 +12,10 @@ class Profile(models.Model):
     birth_date = models.DateField(null=True, blank=True)
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
     header_image = models.ImageField(upload_to='headers/', null=True, blank=True)
+    # Dimensions and resized/WebP variants of the images, recorded once
+    # processed (see mini_twitter.images)
+    avatar_variants = models.JSONField(null=True, blank=True, editable=False)
+    header_image_variants = models.JSONField(null=True, blank=True, editable=False)
     followers_count = models.PositiveIntegerField(default=0)
     following_count = models.PositiveIntegerField(default=0)
     posts_count = models.PositiveIntegerField(default=0)
@@ -21,6 +26,20 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+    def save(self, *args, **kwargs):
+        uploads = track_uploads(self, ['avatar', 'header_image'])
+        super().save(*args, **kwargs)
+
+        # Process new images off the request thread
+        if uploads:
+            from .tasks import process_profile_image
+            for field_name, stale in uploads:
+                profile_id, name = self.pk, getattr(self, field_name).name
+                transaction.on_commit(
+                    lambda field_name=field_name, name=name, stale=stale:
+                        process_profile_image.delay(profile_id, field_name, name, stale)
+                )
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -37,6 +56,11 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('follower', 'following')
+        # Follower/following lists are keyset-paginated on (created_at, id)
+        indexes = [
+            models.Index(fields=['following', 'created_at', 'id'], name='follow_following_created_idx'),
+            models.Index(fields=['follower', 'created_at', 'id'], name='follow_follower_created_idx'),
+        ]
         
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
\ No newline at end of file
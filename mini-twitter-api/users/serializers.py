@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from mini_twitter.fieldsets import SparseFieldsetMixin
+from mini_twitter.images import variant_urls
+from uploads.serializers import UploadField, UploadReferenceMixin
 from .models import Profile, Follow
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     profile_picture = serializers.SerializerMethodField()
     
     class Meta:
@@ -12,6 +15,10 @@ class UserSerializer(serializers.ModelSerializer):
     
     def get_profile_picture(self, obj):
         if hasattr(obj, 'profile') and obj.profile.avatar:
+            # Post cards only need the small variant, once it has been made
+            variants = obj.profile.avatar_variants
+            if variants:
+                return obj.profile.avatar.storage.url(variants['variants']['small']['src'])
             return obj.profile.avatar.url
         return None
 
@@ -31,16 +38,22 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         )
         return user
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(UploadReferenceMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
     full_name = serializers.SerializerMethodField()
+    avatar_variants = serializers.SerializerMethodField()
+    header_image_variants = serializers.SerializerMethodField()
+    avatar_upload = UploadField()
+    header_image_upload = UploadField()
     
     class Meta:
         model = Profile
         fields = (
             'id', 'username', 'email', 'full_name', 'bio', 'location', 'website', 
-            'birth_date', 'avatar', 'header_image', 'followers_count', 
+            'birth_date', 'avatar', 'avatar_upload', 'avatar_variants',
+            'header_image', 'header_image_upload', 'header_image_variants',
+            'followers_count', 
             'following_count', 'posts_count', 'is_verified', 'created_at'
         )
         read_only_fields = (
@@ -48,8 +61,16 @@ class ProfileSerializer(serializers.ModelSerializer):
             'following_count', 'posts_count', 'is_verified', 'created_at'
         )
     
+    upload_fields = {'avatar_upload': 'avatar', 'header_image_upload': 'header_image'}
+    
     def get_full_name(self, obj):
         return f"{obj.user.first_name} {obj.user.last_name}".strip()
+    
+    def get_avatar_variants(self, obj):
+        return variant_urls(obj.avatar, obj.avatar_variants)
+    
+    def get_header_image_variants(self, obj):
+        return variant_urls(obj.header_image, obj.header_image_variants)
 
 class FollowSerializer(serializers.ModelSerializer):
     follower_username = serializers.CharField(source='follower.username', read_only=True)
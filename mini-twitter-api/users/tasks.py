@@ -2,6 +2,8 @@ from celery import shared_task
 from django.contrib.auth.models import User
 from django.core.mail import send_mail
 from django.conf import settings
+from mini_twitter.images import process_upload
+from .models import Profile
 
 @shared_task
 def send_follow_notification(follower_id, following_id):
@@ -23,4 +25,10 @@ def send_follow_notification(follower_id, following_id):
         
         return True
     except User.DoesNotExist:
-        return False
\ No newline at end of file
+        return False
+
+@shared_task
+def process_profile_image(profile_id, field_name, name, stale=()):
+    """Validate an uploaded avatar or header image, strip its metadata and write its variants."""
+    kind = 'avatar' if field_name == 'avatar' else 'header'
+    return process_upload(Profile, profile_id, field_name, name, kind, stale) is not None
@@ -1,8 +1,15 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from mini_twitter.testing import QueryPlanTestMixin
 from .models import Profile, Follow
 
 class UserTests(TestCase):
@@ -28,6 +35,12 @@ class UserTests(TestCase):
         self.assertEqual(User.objects.count(), 2)
         self.assertEqual(User.objects.get(username='testuser').email, 'test@example.com')
     
+    def test_sparse_fieldsets(self):
+        url = reverse('user-detail', args=[self.user.id])
+        response = self.client.get(url + '?fields=id,username')
+        self.assertEqual(response.data, {'id': self.user.id, 'username': 'existinguser'})
+        self.assertIn('email', self.client.get(url).data)
+    
     def test_profile_created_on_user_creation(self):
         self.assertTrue(hasattr(self.user, 'profile'))
         self.assertIsInstance(self.user.profile, Profile)
@@ -38,6 +51,7 @@ class UserTests(TestCase):
             email='follow@example.com',
             password='followpassword123'
         )
+        updated_at = Profile.objects.get(user=new_user).updated_at
         url = reverse('user-follow', args=[new_user.id])
         response = self.client.post(url)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -48,6 +62,8 @@ class UserTests(TestCase):
         new_user.refresh_from_db()
         self.assertEqual(self.user.profile.following_count, 1)
         self.assertEqual(new_user.profile.followers_count, 1)
+        # Without touching updated_at, which versions cached post renderings
+        self.assertEqual(new_user.profile.updated_at, updated_at)
     
     def test_unfollow_user(self):
         new_user = User.objects.create_user(
@@ -71,3 +87,68 @@ class UserTests(TestCase):
         new_user.refresh_from_db()
         self.assertEqual(self.user.profile.following_count, 0)
         self.assertEqual(new_user.profile.followers_count, 0)
+    
+    def test_followers_use_cursor_pagination(self):
+        followers = [
+            User.objects.create_user(username=f'follower{i}')
+            for i in range(3)
+        ]
+        for follower in followers:
+            Follow.objects.create(follower=follower, following=self.user)
+        
+        url = reverse('user-followers', args=[self.user.id]) + '?page_size=2'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(
+            [u['username'] for u in response.data['results']],
+            ['follower2', 'follower1']
+        )
+        response = self.client.get(response.data['next'])
+        self.assertEqual([u['username'] for u in response.data['results']], ['follower0'])
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+    
+    def test_avatar_variants(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        buffer = BytesIO()
+        Image.new('RGBA', (400, 300), (0, 0, 255, 128)).save(buffer, format='PNG')
+        upload = SimpleUploadedFile('me.png', buffer.getvalue(), content_type='image/png')
+        
+        url = reverse('profile-update-my-profile')
+        with override_settings(MEDIA_ROOT=media_root), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {'avatar': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        profile = Profile.objects.get(user=self.user)
+        small = profile.avatar_variants['variants']['small']
+        self.assertEqual((small['width'], small['height']), (96, 96))
+        # Transparent images keep a PNG fallback next to the WebP variant
+        self.assertRegex(small['src'], r'^avatars/variants/me_\w+/small\.png$')
+        
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.get(reverse('user-detail', args=[self.user.id]))
+            self.assertTrue(response.data['profile_picture'].endswith(small['src']))
+            response = self.client.get(reverse('profile-detail', args=[profile.id]))
+        self.assertTrue(response.data['avatar_variants']['variants']['medium']['webp'].endswith('medium.webp'))
+        self.assertIsNone(response.data['header_image_variants'])
+
+
+class FollowQueryPlanTests(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='celebrity')
+        self.client.force_authenticate(user=self.user)
+        for i in range(5):
+            fan = User.objects.create_user(username=f'fan{i}')
+            Follow.objects.create(follower=fan, following=self.user)
+            Follow.objects.create(follower=self.user, following=fan)
+    
+    def test_followers_and_following(self):
+        self.assertIndexedEndpoint(
+            reverse('user-followers', args=[self.user.id]), ['users_follow']
+        )
+        self.assertIndexedEndpoint(
+            reverse('user-following', args=[self.user.id]), ['users_follow']
+        )
@@ -5,11 +5,13 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import F
 from django.core.cache import cache
 from rest_framework.exceptions import PermissionDenied
 from .models import Profile, Follow
 from .serializers import UserSerializer, UserRegistrationSerializer, ProfileSerializer, FollowSerializer
 from .tasks import send_follow_notification
+from mini_twitter.pagination import KeysetPagination, UserKeysetPagination
 
 # Import create_notification only if notifications app is installed
 try:
@@ -22,8 +24,9 @@ except ImportError:
         pass
 
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('profile')
     serializer_class = UserSerializer
+    pagination_class = UserKeysetPagination
     
     def get_permissions(self):
         if self.action == 'create':
@@ -52,15 +55,12 @@ class UserViewSet(viewsets.ModelViewSet):
         )
         
         if created:
-            # Update follower and following counts
+            # Update follower and following counts in place: saving the
+            # profiles would bump updated_at, which retires the authors'
+            # cached post renderings (see posts.render_cache)
             with transaction.atomic():
-                user.profile.following_count += 1
-                user.profile.save()
-                user_to_follow.profile.followers_count += 1
-                user_to_follow.profile.save()
-            
-            # Invalidate cache
-            cache.delete(f'feed_{user.id}')
+                Profile.objects.filter(user=user).update(following_count=F('following_count') + 1)
+                Profile.objects.filter(user=user_to_follow).update(followers_count=F('followers_count') + 1)
             
             # Send notification
             send_follow_notification.delay(user.id, user_to_follow.id)
@@ -97,15 +97,14 @@ class UserViewSet(viewsets.ModelViewSet):
             )
             follow.delete()
             
-            # Update follower and following counts
+            # Update follower and following counts in place, as in follow
             with transaction.atomic():
-                user.profile.following_count -= 1
-                user.profile.save()
-                user_to_unfollow.profile.followers_count -= 1
-                user_to_unfollow.profile.save()
-            
-            # Invalidate cache
-            cache.delete(f'feed_{user.id}')
+                Profile.objects.filter(user=user, following_count__gt=0).update(
+                    following_count=F('following_count') - 1
+                )
+                Profile.objects.filter(user=user_to_unfollow, followers_count__gt=0).update(
+                    followers_count=F('followers_count') - 1
+                )
             
             return Response(
                 {"detail": f"You have unfollowed {user_to_unfollow.username}."},
@@ -125,24 +124,24 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def followers(self, request, pk=None):
         user = self.get_object()
-        followers = User.objects.filter(following__following=user)
-        page = self.paginate_queryset(followers)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(followers, many=True)
-        return Response(serializer.data)
+        follows = Follow.objects.filter(following=user).select_related('follower__profile')
+        
+        # Paginate the Follow rows so the cursor follows when the relationship started
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(follows, request, view=self)
+        serializer = self.get_serializer([follow.follower for follow in page], many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['get'])
     def following(self, request, pk=None):
         user = self.get_object()
-        following = User.objects.filter(followers__follower=user)
-        page = self.paginate_queryset(following)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(following, many=True)
-        return Response(serializer.data)
+        follows = Follow.objects.filter(follower=user).select_related('following__profile')
+        
+        # Paginate the Follow rows so the cursor follows when the relationship started
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(follows, request, view=self)
+        serializer = self.get_serializer([follow.following for follow in page], many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class ProfileViewSet(viewsets.ModelViewSet):
     queryset = Profile.objects.all()